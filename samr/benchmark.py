@@ -0,0 +1,192 @@
+"""
+Benchmarks for the stages of the samr pipeline.
+
+`write_synthetic_corpus` generates corpora in the train.tsv format with the
+same structure as the SAMR data (every phrase is a node of a binary parse
+tree of its sentence), and `benchmark_stages` times each stage of the
+pipeline on them. Results are dicts, so that runs can be saved as json and
+compared.
+"""
+import csv
+import gc
+import platform
+import random
+import resource
+import time
+
+import numpy
+import sklearn
+from sklearn.feature_extraction.text import CountVectorizer
+
+try:
+    import tracemalloc
+except ImportError:  # Python < 3.4
+    tracemalloc = None
+
+from samr.corpus import iter_data_file
+from samr.inquirer_lex_transform import InquirerLexTransform
+from samr.neighbors import NeighborsClassifier, compare_to_exact
+from samr.predictor import _valid_classifiers, get_classifier, split_words, target
+from samr.transformations import (ExtractText, ReplaceText, MapToSynsets,
+                                  ClassifierOvOAsFeatures)
+
+
+# Real words are mixed with made-up ones so that the lexicon and Wordnet
+# based stages have something to find.
+WORDS = ("the a of and to is in it that as with for its film movie but this "
+         "be on an by more than one not all story about so like has good bad "
+         "great best funny love characters n't 's work comedy director , . "
+         "little own too life well performance make most much some very time "
+         "never drama even could dull boring awful brilliant charming fails "
+         "beautiful moving entertaining mess worst clever stupid sweet sad "
+         "script plot cast action thriller heart fun smart tired flat").split()
+
+
+def synthetic_sentence(rng, vocabulary_size=20000):
+    length = rng.randint(3, 40)
+    words = []
+    for _ in range(length):
+        if rng.random() < 0.6:
+            words.append(rng.choice(WORDS))
+        else:
+            words.append("w{}".format(int(rng.paretovariate(1.0)) % vocabulary_size))
+    return words
+
+
+def _tree_spans(start, end, rng):
+    """
+    Private function that returns the (start, end) token spans of the nodes of
+    a random binary tree over the tokens in [start, end).
+    """
+    spans = [(start, end)]
+    if end - start > 1:
+        middle = rng.randint(start + 1, end - 1)
+        spans.extend(_tree_spans(start, middle, rng))
+        spans.extend(_tree_spans(middle, end, rng))
+    return spans
+
+
+def write_synthetic_corpus(path, n_phrases, seed=0):
+    """
+    Writes into `path` a tsv file in the train.tsv format with `n_phrases`
+    phrases. Each sentence contributes all the phrases of a random binary
+    parse tree of it (with the whole sentence first), like in the SAMR data.
+    """
+    rng = random.Random(seed)
+    with open(path, "w") as f:
+        writer = csv.writer(f, delimiter="\t", lineterminator="\n")
+        writer.writerow(("PhraseId", "SentenceId", "Phrase", "Sentiment"))
+        phraseid = 0
+        sentenceid = 0
+        while phraseid < n_phrases:
+            sentenceid += 1
+            words = synthetic_sentence(rng)
+            for start, end in _tree_spans(0, len(words), rng):
+                if phraseid == n_phrases:
+                    break
+                phraseid += 1
+                sentiment = min(4, max(0, int(rng.gauss(2, 1))))
+                writer.writerow((phraseid, sentenceid, " ".join(words[start:end]),
+                                 sentiment))
+
+
+def _n_rows(X):
+    if hasattr(X, "shape"):
+        return X.shape[0]
+    return len(X)
+
+
+def measure(function, *args, **kwargs):
+    """
+    Calls `function` with the given arguments and returns a `(result, stats)`
+    tuple, where `stats` is a dict with the wall and cpu time spent and the
+    peak resident memory of the process (in kilobytes) afterwards.
+    If the `tracemalloc` module is tracing, the peak memory allocated by the
+    call is also reported.
+    """
+    gc.collect()
+    tracing = tracemalloc is not None and tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.clear_traces()
+    start_cpu = time.process_time()
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    stats = {"seconds": time.perf_counter() - start,
+             "cpu_seconds": time.process_time() - start_cpu,
+             "maxrss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+    if tracing:
+        stats["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+    return result, stats
+
+
+def environment():
+    return {"python": platform.python_version(), "numpy": numpy.__version__,
+            "sklearn": sklearn.__version__, "machine": platform.machine()}
+
+
+def benchmark_stages(path, classifiers=None, classifier_rows=50000, ngram=1):
+    """
+    Times every stage of the samr pipeline on the corpus stored in the tsv file
+    `path` and returns a list of result dicts, one per stage and operation.
+    `classifiers` is the list of main classifiers to time (by default all of
+    them), which are trained and evaluated on at most `classifier_rows` rows
+    because some of them scale badly. For "ann" the recall and accuracy lost
+    against exact search are reported too (see
+    `samr.neighbors.compare_to_exact`).
+    Stages that fail (ex: because nltk data is missing) are reported with an
+    "error" and later stages are fed a plain whitespace tokenization instead.
+    """
+    results = []
+
+    def run(stage, operation, function, X, *args):
+        try:
+            Z, stats = measure(function, X, *args)
+        except Exception as e:
+            results.append({"stage": stage, "operation": operation,
+                            "error": "{}: {}".format(type(e).__name__, e)})
+            return None
+        stats.update(stage=stage, operation=operation, rows=_n_rows(X))
+        stats["rows_per_second"] = stats["rows"] / max(stats["seconds"], 1e-9)
+        results.append(stats)
+        return Z
+
+    data, stats = measure(lambda: list(iter_data_file(path)))
+    stats.update(stage="corpus", operation="load", rows=len(data))
+    results.append(stats)
+    y = target(data)
+
+    text = run("ExtractText", "transform", ExtractText(lowercase=True).transform, data)
+    if text is None:
+        text = [" ".join(x.phrase.lower().split()) for x in data]
+    replace = ReplaceText([("n't", "not"), ("'s", "is")])
+    text = run("ReplaceText", "transform", replace.transform, text) or text
+    synsets = run("MapToSynsets", "transform", MapToSynsets().transform, text)
+    lex = run("InquirerLexTransform", "transform", InquirerLexTransform().transform, text)
+
+    branches = [("text", text), ("synsets", synsets), ("lex", lex)]
+    bags = {}
+    for name, X in branches:
+        if X is None:
+            continue
+        vectorizer = CountVectorizer(tokenizer=split_words, ngram_range=(1, ngram))
+        stage = "CountVectorizer[{}]".format(name)
+        bags[name] = run(stage, "fit_transform", vectorizer.fit_transform, X)
+
+    ovo = ClassifierOvOAsFeatures()
+    run("ClassifierOvOAsFeatures", "fit", ovo.fit, bags["text"], y)
+    features = run("ClassifierOvOAsFeatures", "transform", ovo.transform, bags["text"])
+    if features is None:
+        return results
+
+    features = features[:classifier_rows]
+    y = y[:classifier_rows]
+    for name in classifiers or sorted(_valid_classifiers):
+        classifier = get_classifier(name)()
+        stage = "classifier[{}]".format(name)
+        run(stage, "fit", classifier.fit, features, y)
+        run(stage, "predict", classifier.predict, features)
+        if isinstance(classifier, NeighborsClassifier) and hasattr(classifier, "index_"):
+            report = compare_to_exact(classifier, features, y)
+            report.update(stage=stage, operation="compare_to_exact", rows=len(y))
+            results.append(report)
+    return results
@@ -2,8 +2,15 @@ import os
 import csv
 import random
 
-from samr.data import Datapoint
+import numpy
+
+from samr.data import Datapoint, PhraseBatch, make_phrase_batch
 from samr.settings import DATA_PATH
+from samr.storage import StringArray, save_arrays, load_arrays
+
+
+COLUMNS_KIND = "samr-corpus-columns"
+COLUMNS_VERSION = 1
 
 
 def _iter_data_file(filename):
@@ -18,20 +25,153 @@ def _iter_data_file(filename):
         yield Datapoint(*row)
 
 
+def iter_data_file(filename):
+    """
+    Returns an iterator of `Datapoint`s read one by one from the tsv file
+    `filename` (a path relative to the data folder or an absolute path), so
+    that files of any size can be processed.
+    """
+    return _iter_data_file(filename)
+
+
+def iter_chunks(iterable, chunk_size):
+    """
+    Splits `iterable` into lists of `chunk_size` consecutive elements (the last
+    one can be shorter) and returns an iterator over them.
+    """
+    chunk = []
+    for x in iterable:
+        chunk.append(x)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _columns_path(filename):
+    return os.path.join(DATA_PATH, filename + ".columns")
+
+
+def _source_stamp(path):
+    stat = os.stat(path)
+    return {"source_size": stat.st_size, "source_mtime": stat.st_mtime}
+
+
+def convert_data_file(filename):
+    """
+    Converts the tsv file `filename` of the data folder into a columnar binary
+    format (saved next to it, with a ".columns" suffix) that is loaded with
+    memory mapping by `iter_corpus` and `iter_test_corpus` from then on.
+    """
+    batch = make_phrase_batch(_iter_data_file(filename))
+    arrays = batch.phrase.arrays("phrase")
+    arrays.update(phraseid=batch.phraseid, sentenceid=batch.sentenceid,
+                  sentiment=batch.sentiment)
+    header = _source_stamp(os.path.join(DATA_PATH, filename))
+    save_arrays(_columns_path(filename), COLUMNS_KIND, COLUMNS_VERSION, arrays,
+                header=header)
+
+
+def _load_columns(filename):
+    """
+    Private function that returns a memory mapped `PhraseBatch` with the
+    converted contents of `filename` or `None` if it was not converted or the
+    conversion is outdated.
+    """
+    path = _columns_path(filename)
+    if not os.path.isdir(path):
+        return None
+    header, arrays = load_arrays(path, COLUMNS_KIND, COLUMNS_VERSION)
+    source = os.path.join(DATA_PATH, filename)
+    if os.path.isfile(source):
+        stamp = _source_stamp(source)
+        if any(header.get(key) != value for key, value in stamp.items()):
+            return None
+    return PhraseBatch(arrays["phraseid"], arrays["sentenceid"],
+                       StringArray.from_arrays(arrays, "phrase"),
+                       arrays["sentiment"])
+
+
+def _load_data_file(filename):
+    data = _load_columns(filename)
+    if data is None:
+        data = list(_iter_data_file(filename))
+    return data
+
+
 def iter_corpus(__cached=[]):
     """
     Returns an iterable of `Datapoint`s with the contents of train.tsv.
     """
     if not __cached:
-        __cached.extend(_iter_data_file("train.tsv"))
-    return __cached
+        __cached.append(_load_data_file("train.tsv"))
+    return __cached[0]
 
 
 def iter_test_corpus():
     """
     Returns an iterable of `Datapoint`s with the contents of test.tsv.
     """
-    return list(_iter_data_file("test.tsv"))
+    return _load_data_file("test.tsv")
+
+
+def _sentence_groups(data):
+    """
+    Private function that returns a `(n_groups, groups)` tuple where `groups`
+    is an array with the group of each element of `data`. Groups are numbered
+    in the (string) order of the sentence ids.
+    """
+    if isinstance(data, PhraseBatch):
+        sentenceids = data.sentenceid.astype(str)
+    else:
+        sentenceids = numpy.array([x.sentenceid for x in data])
+    ids, groups = numpy.unique(sentenceids, return_inverse=True)
+    return len(ids), groups
+
+
+def split_indices(seed, proportion=0.9):
+    """
+    Makes a randomized train/test split of the train.tsv corpus, keeping the
+    phrases of a sentence together, with `proportion` fraction of the
+    sentences going to train and the rest to test. The same seed always gives
+    the same split (the same one as `make_train_test_split`).
+
+    Return value is a (train, test) tuple of integer arrays with positions in
+    `iter_corpus()`, see `samr.data.CorpusView`.
+    """
+    n_groups, groups = _sentence_groups(iter_corpus())
+    if n_groups < 2:
+        raise ValueError("Corpus too small to split")
+    N = int(n_groups * proportion)
+    if N == 0:
+        N += 1
+    order = list(range(n_groups))
+    random.Random(seed).shuffle(order)
+    is_test = numpy.zeros(n_groups, dtype=bool)
+    is_test[order[N:]] = True
+    is_test = is_test[groups]
+    return numpy.flatnonzero(~is_test), numpy.flatnonzero(is_test)
+
+
+def kfold_indices(seed, K=10):
+    """
+    Returns an iterator over `K` train/test splits of the train.tsv corpus
+    (like the ones of `split_indices`) made from a single shuffle of its
+    sentences, such that every sentence is in the test part of exactly one
+    split.
+    """
+    n_groups, groups = _sentence_groups(iter_corpus())
+    if n_groups < K:
+        raise ValueError("Corpus too small to split in {} folds".format(K))
+    order = list(range(n_groups))
+    random.Random(seed).shuffle(order)
+    fold = numpy.zeros(n_groups, dtype=int)
+    for k, part in enumerate(numpy.array_split(order, K)):
+        fold[part] = k
+    fold = fold[groups]
+    for k in range(K):
+        yield numpy.flatnonzero(fold != k), numpy.flatnonzero(fold == k)
 
 
 def make_train_test_split(seed, proportion=0.9):
@@ -43,23 +183,8 @@ def make_train_test_split(seed, proportion=0.9):
     seeds should always provide different train/test splits.
 
     Return value is a (train, test) tuple where train and test are lists of
-    `Datapoint` instances.
+    `Datapoint` instances. See `split_indices` to avoid the copies.
     """
-    data = list(iter_corpus())
-    ids = list(sorted(set(x.sentenceid for x in data)))
-    if len(ids) < 2:
-        raise ValueError("Corpus too small to split")
-    N = int(len(ids) * proportion)
-    if N == 0:
-        N += 1
-    rng = random.Random(seed)
-    rng.shuffle(ids)
-    test_ids = set(ids[N:])
-    train = []
-    test = []
-    for x in data:
-        if x.sentenceid in test_ids:
-            test.append(x)
-        else:
-            train.append(x)
-    return train, test
+    data = iter_corpus()
+    train, test = split_indices(seed, proportion)
+    return [data[i] for i in train], [data[i] for i in test]
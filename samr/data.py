@@ -1,4 +1,154 @@
 from collections import namedtuple
 
+import numpy
+
+from samr.storage import StringArray
 
 Datapoint = namedtuple("Datapoint", "phraseid sentenceid phrase sentiment")
+
+
+class PhraseBatch:
+    """
+    A read-only sequence of `Datapoint` instances stored by columns: integer
+    arrays for the phrase ids, sentence ids and sentiments (-1 meaning no
+    sentiment) and a `samr.storage.StringArray` for the phrases.
+    The arrays can be memory mapped, so a `PhraseBatch` costs little memory
+    until its elements are accessed.
+    Indexing with an integer gives a `Datapoint`, while slicing or indexing
+    with an array of positions (or a boolean mask) gives another
+    `PhraseBatch`. Contiguous slices share the arrays of the original batch.
+    Batches made that way remember the original one as `corpus` and their
+    positions in it as `indices`, like a `CorpusView`.
+    The samr pipeline handles batches by columns, without making a
+    `Datapoint` per row.
+    """
+    def __init__(self, phraseid, sentenceid, phrase, sentiment, corpus=None,
+                 indices=None):
+        self.phraseid = phraseid
+        self.sentenceid = sentenceid
+        self.phrase = phrase
+        self.sentiment = sentiment
+        self.corpus = corpus
+        self.indices = indices
+
+    @classmethod
+    def from_datapoints(cls, datapoints):
+        """
+        Returns a `PhraseBatch` with the contents of the iterable of
+        `Datapoint` instances `datapoints`. Ids and sentiments must be strings
+        of integers (sentiments can also be `None`).
+        """
+        datapoints = list(datapoints)
+        phraseid = numpy.array([_as_int(x.phraseid) for x in datapoints], dtype=numpy.int64)
+        sentenceid = numpy.array([_as_int(x.sentenceid) for x in datapoints], dtype=numpy.int64)
+        sentiment = numpy.array([-1 if x.sentiment is None else _as_int(x.sentiment)
+                                 for x in datapoints], dtype=numpy.int8)
+        phrase = StringArray.from_strings(x.phrase for x in datapoints)
+        return cls(phraseid, sentenceid, phrase, sentiment)
+
+    def __len__(self):
+        return len(self.phraseid)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start, stop, step = i.indices(len(self))
+            if step != 1:
+                return self.take(numpy.arange(start, stop, step))
+            stop = max(start, stop)
+            return PhraseBatch(self.phraseid[start:stop], self.sentenceid[start:stop],
+                               self.phrase[start:stop], self.sentiment[start:stop],
+                               corpus=self, indices=numpy.arange(start, stop))
+        if not isinstance(i, (int, numpy.integer)):
+            return self.take(i)
+        sentiment = self.sentiment[i]
+        return Datapoint(phraseid=str(self.phraseid[i]),
+                         sentenceid=str(self.sentenceid[i]),
+                         phrase=self.phrase[i],
+                         sentiment=None if sentiment < 0 else str(sentiment))
+
+    def take(self, indices):
+        """
+        Returns a `PhraseBatch` with the rows at the positions `indices` (an
+        integer array or a boolean mask).
+        """
+        indices = numpy.asarray(indices)
+        if indices.dtype == bool:
+            indices = numpy.flatnonzero(indices)
+        return PhraseBatch(self.phraseid[indices], self.sentenceid[indices],
+                           self.phrase.take(indices), self.sentiment[indices],
+                           corpus=self, indices=indices)
+
+    def __getstate__(self):
+        # The batch this one was taken from is not pickled
+        state = dict(vars(self))
+        state.update(corpus=None, indices=None)
+        return state
+
+    def labels(self):
+        """
+        Returns a list with the sentiment of every row as a `str` (or `None`).
+        """
+        labels = self.sentiment.astype(str).astype(object)
+        labels[self.sentiment < 0] = None
+        return labels.tolist()
+
+    def __iter__(self):
+        columns = (self.phraseid.tolist(), self.sentenceid.tolist(),
+                   self.phrase, self.sentiment.tolist())
+        for phraseid, sentenceid, phrase, sentiment in zip(*columns):
+            yield Datapoint(phraseid=str(phraseid), sentenceid=str(sentenceid),
+                            phrase=phrase,
+                            sentiment=None if sentiment < 0 else str(sentiment))
+
+
+class PhraseTexts(list):
+    """
+    A list with the texts of some phrases (ex: the output of `ExtractText`)
+    that also remembers the sentence id of each one in `sentenceids`, so that
+    later steps can take advantage of the phrases of a sentence being spans
+    of it (see `samr.phrase_tree`).
+    """
+    def __init__(self, texts, sentenceids):
+        super().__init__(texts)
+        self.sentenceids = list(sentenceids)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return PhraseTexts(list.__getitem__(self, i), self.sentenceids[i])
+        return list.__getitem__(self, i)
+
+
+class CorpusView:
+    """
+    A read-only sequence with the elements of `corpus` at the positions
+    `indices` (ex: a train/test split made by `samr.corpus.split_indices`),
+    without copying them.
+    """
+    def __init__(self, corpus, indices):
+        self.corpus = corpus
+        self.indices = indices
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, i):
+        return self.corpus[self.indices[i]]
+
+    def __iter__(self):
+        for i in self.indices:
+            yield self.corpus[i]
+
+
+def _as_int(x):
+    value = int(x)
+    if str(value) != x:
+        raise ValueError("Can't store {!r} as an integer".format(x))
+    return value
+
+
+def make_phrase_batch(datapoints):
+    """
+    Returns a `PhraseBatch` with the contents of the iterable of `Datapoint`
+    instances `datapoints`, see `PhraseBatch.from_datapoints`.
+    """
+    return PhraseBatch.from_datapoints(datapoints)
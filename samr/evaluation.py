@@ -1,15 +1,138 @@
-from samr.corpus import make_train_test_split
+from samr.corpus import iter_corpus, split_indices
+from samr.data import CorpusView, PhraseBatch
+from samr.parallel import can_fork, effective_n_jobs, fork_pool, pool_size
+from samr.transformations import ClassifierOvOAsFeatures
 
 
-def cross_validation(factory, seed, K=10, callback=None):
+def cross_validation(factory, seed, K=10, callback=None, n_jobs=1,
+                     feature_cache=None, splits=None):
+    """
+    Evaluates the predictors made by calling `factory` on `K` train/test
+    splits of the corpus and returns the mean score.
+    `callback` is called with the score of each fold, in fold order.
+    If `n_jobs` is not 1 folds are evaluated in that many worker processes
+    (-1 means all the ones of `samr.parallel`). Workers are forked so they
+    share the corpus loaded here, and can't use the worker processes of
+    `samr.parallel`: their stateless steps run serially, and the processes
+    of `samr.parallel` left over (if there are less folds than those) are
+    split among them as threads that fit the pairwise classifiers of
+    `ClassifierOvOAsFeatures`. Otherwise, or where
+    processes can't be forked (see `samr.parallel.can_fork`), folds
+    run one after the other here, sharing the worker processes of
+    `samr.parallel` for the steps inside them.
+    If `feature_cache` (a `samr.feature_cache.FeatureCache` of the corpus) is
+    given the stateless steps of every fold are taken from it.
+    `splits`, if given, is an iterable of (train, test) tuples of positions in
+    the corpus (ex: `samr.corpus.kfold_indices(seed, K)`) used instead of `K`
+    splits made by `samr.corpus.split_indices`. Folds are views of the
+    corpus, so only these positions are sent to the workers.
+    """
     seed = str(seed)
-    scores = []
-    for k in range(K):
-        train, test = make_train_test_split(seed + str(k))
-        predictor = factory()
-        predictor.fit(train)
-        score = predictor.score(test)
+    if splits is None:
+        splits = (split_indices(seed + str(k)) for k in range(K))
+    splits = list(splits)
+    n_jobs = min(effective_n_jobs(n_jobs), len(splits))
+    if n_jobs <= 1 or not can_fork():
+        scores = (_fold_score(factory, train, test, feature_cache)
+                  for train, test in splits)
+        return _collect(scores, callback)
+    iter_corpus()  # Load the corpus before forking so workers share it
+    if feature_cache is not None:
+        factory().set_feature_cache(feature_cache)  # Fill it before forking
+    inner_jobs = max(1, pool_size() // n_jobs)
+    pool = fork_pool(n_jobs, initializer=_init_worker,
+                     initargs=(factory, inner_jobs, feature_cache))
+    try:
+        scores = pool.imap(_worker_fold_score, splits)
+        return _collect(scores, callback)
+    finally:
+        pool.terminate()
+
+
+def score_folds(tasks, n_jobs=1, feature_cache=None):
+    """
+    Evaluates several folds, possibly of different predictors.
+    `tasks` is expected to be a list of `(factory, train, test)` tuples where
+    `train` and `test` are positions in the corpus (as the `splits` of
+    `cross_validation`).
+    Returns an iterator over `(i, score)` tuples, where `i` is the position
+    of the task in `tasks`, in the order the tasks finish.
+    `n_jobs` and `feature_cache` are as in `cross_validation`, except that
+    with worker processes the factories are pickled, so they can't be
+    lambdas (ex: use `functools.partial`).
+    """
+    tasks = list(tasks)
+    n_jobs = min(effective_n_jobs(n_jobs), len(tasks))
+    if n_jobs <= 1 or not can_fork():
+        for i, (factory, train, test) in enumerate(tasks):
+            yield i, _fold_score(factory, train, test, feature_cache)
+        return
+    iter_corpus()  # Load the corpus before forking so workers share it
+    if feature_cache is not None:
+        factories = {id(factory): factory for factory, _, _ in tasks}
+        for factory in factories.values():
+            factory().set_feature_cache(feature_cache)  # Fill it before forking
+    inner_jobs = max(1, pool_size() // n_jobs)
+    pool = fork_pool(n_jobs, initializer=_init_worker,
+                     initargs=(None, inner_jobs, feature_cache))
+    try:
+        for result in pool.imap_unordered(_worker_task_score, enumerate(tasks)):
+            yield result
+    finally:
+        pool.terminate()
+
+
+def _collect(scores, callback):
+    result = []
+    for score in scores:
         if callback:
             callback(score)
-        scores.append(score)
-    return sum(scores) / len(scores)
+        result.append(score)
+    return sum(result) / len(result)
+
+
+def _fold_score(factory, train, test, feature_cache=None, n_jobs=None):
+    corpus = iter_corpus()
+    if isinstance(corpus, PhraseBatch):
+        train, test = corpus.take(train), corpus.take(test)
+    else:
+        train, test = CorpusView(corpus, train), CorpusView(corpus, test)
+    predictor = factory()
+    if feature_cache is not None:
+        predictor.set_feature_cache(feature_cache)
+    if n_jobs is not None:
+        _limit_jobs(predictor.classifier, n_jobs)
+    predictor.fit(train)
+    return predictor.score(test)
+
+
+def _limit_jobs(estimator, n_jobs):
+    """
+    Private function that lowers the `n_jobs` parameter of `estimator` (if it
+    has one) to at most `n_jobs`.
+    """
+    current = getattr(estimator, "n_jobs", None)
+    if current is not None and (current < 0 or current > n_jobs):
+        estimator.n_jobs = n_jobs
+
+
+_worker_state = {}
+
+
+def _init_worker(factory, n_jobs, feature_cache):
+    _worker_state["factory"] = factory
+    _worker_state["feature_cache"] = feature_cache
+    _worker_state["n_jobs"] = n_jobs
+    ClassifierOvOAsFeatures.n_jobs = n_jobs
+
+
+def _worker_fold_score(args):
+    train, test = args
+    return _fold_score(_worker_state["factory"], train, test,
+                       _worker_state["feature_cache"], _worker_state["n_jobs"])
+
+
+def _worker_task_score(args):
+    i, (factory, train, test) = args
+    return i, _fold_score(factory, train, test, _worker_state["feature_cache"],
+                          _worker_state["n_jobs"])
@@ -0,0 +1,177 @@
+"""
+A cache for the stateless part of samr pipelines.
+
+The stateless transformations (`ExtractText`, `ReplaceText`, `MapToSynsets`,
+`InquirerLexTransform`, ...) give the same output for a phrase no matter which
+train/test split it belongs to. A `FeatureCache` computes them once for a
+whole corpus so that each cross-validation fold only takes rows out of the
+precomputed results, and only the stateful steps are fitted again.
+Results are keyed by the configuration of the stages, the data files they read
+(see `StatelessTransform.data_stamp`), `FEATURE_CACHE_VERSION` and a
+fingerprint of the corpus, and can optionally be persisted to disk between
+runs.
+"""
+import hashlib
+import os
+import pickle
+
+from samr.transformations import StatelessTransform
+
+
+# Changing it invalidates the outputs persisted by previous versions. To be
+# increased whenever a stateless transformation changes its outputs.
+FEATURE_CACHE_VERSION = 1
+
+
+def corpus_fingerprint(corpus):
+    """
+    Returns a `str` that identifies the contents of `corpus`, a list of
+    `Datapoint` instances.
+    """
+    h = hashlib.sha1()
+    for datapoint in corpus:
+        row = "\t".join("" if x is None else x for x in datapoint)
+        h.update(row.encode("utf-8"))
+        h.update(b"\n")
+    return h.hexdigest()
+
+
+def stages_key(stages, parent_key=""):
+    """
+    Returns a `str` that identifies the configuration of the sequence of
+    transformations `stages`, and the data files they read, applied to the
+    output identified by `parent_key`.
+    """
+    config = []
+    for stage in stages:
+        stamp = stage.data_stamp() if hasattr(stage, "data_stamp") else None
+        config.append((type(stage).__name__, sorted(vars(stage).items()), stamp))
+    key = (FEATURE_CACHE_VERSION, parent_key, config)
+    return hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+
+
+class FeatureCache:
+    """
+    Stores the outputs of sequences of stateless transformations for every
+    row of a corpus.
+    """
+    def __init__(self, corpus, path=None):
+        """
+        `corpus` is expected to be a list of `Datapoint` instances.
+        If `path` is given results are also saved in (and loaded from) that
+        folder.
+        """
+        self.corpus = corpus
+        self.path = path
+        self.fingerprint = corpus_fingerprint(corpus)
+        self._rows = None
+        self._outputs = {}
+
+    def rows(self, X):
+        """
+        Returns a sequence with the corpus row of each `Datapoint` in `X`, or
+        `None` if some of them are not in the corpus.
+        """
+        if getattr(X, "corpus", None) is self.corpus:
+            return X.indices  # A `samr.data.CorpusView` of this corpus
+        if self._rows is None:
+            self._rows = {x.phraseid: i for i, x in enumerate(self.corpus)}
+        rows = []
+        for datapoint in X:
+            i = self._rows.get(datapoint.phraseid)
+            if i is None or self.corpus[i] != datapoint:
+                return None
+            rows.append(i)
+        return rows
+
+    def get(self, key, compute):
+        """
+        Returns the outputs stored under `key`. If there are none they are
+        computed by calling `compute` (which should return the outputs for the
+        whole corpus) and stored.
+        """
+        if key not in self._outputs:
+            filename = None
+            if self.path:
+                name = "{}-{}.pickle".format(self.fingerprint[:16], key[:16])
+                filename = os.path.join(self.path, name)
+            if filename and os.path.isfile(filename):
+                with open(filename, "rb") as f:
+                    outputs = pickle.load(f)
+            else:
+                outputs = compute()
+                if filename:
+                    if not os.path.isdir(self.path):
+                        os.makedirs(self.path)
+                    with open(filename, "wb") as f:
+                        pickle.dump(outputs, f, pickle.HIGHEST_PROTOCOL)
+            self._outputs[key] = outputs
+        return self._outputs[key]
+
+
+class CachedRows(list):
+    """
+    A list of outputs of a `CachedStages` that remembers the corpus row of
+    each element, so that further cached stages can take their outputs from
+    the cache too, and their sentence ids if the outputs had them (see
+    `samr.data.PhraseTexts`).
+    """
+    def __init__(self, values, rows, sentenceids=None):
+        super().__init__(values)
+        self.rows = rows
+        self.sentenceids = sentenceids
+
+
+class CachedStages(StatelessTransform):
+    """
+    A transformation that applies a sequence of stateless transformations
+    taking the outputs from a `FeatureCache` when possible.
+    The first `CachedStages` of a pipeline receives `Datapoint` instances,
+    further ones must be given a `parent` (the `CachedStages` that produces
+    their input). The cache is not pickled, so unpickled instances just apply
+    the stages.
+    """
+    def __init__(self, stages, cache, parent=None):
+        self.stages = stages
+        self.cache = cache
+        self.parent = parent
+        self.key = stages_key(stages, parent.key if parent else "")
+
+    def transform(self, X):
+        if self.cache is None:
+            return self._apply(X)
+        if self.parent is None:
+            rows = self.cache.rows(X)
+        else:
+            rows = getattr(X, "rows", None)
+        if rows is None:
+            return self._apply(X)
+        outputs = self.outputs()
+        if isinstance(outputs, list):
+            sentenceids = getattr(outputs, "sentenceids", None)
+            if sentenceids is not None:
+                sentenceids = [sentenceids[i] for i in rows]
+            return CachedRows([outputs[i] for i in rows], rows, sentenceids)
+        return outputs[rows]
+
+    def __getstate__(self):
+        # The cache is left out when pickling (ex: when saving a predictor)
+        state = dict(vars(self))
+        state["cache"] = None
+        return state
+
+    def outputs(self):
+        """
+        Returns the outputs of the stages for the whole corpus.
+        """
+        return self.cache.get(self.key, self._compute)
+
+    def _compute(self):
+        if self.parent is None:
+            return self._apply(self.cache.corpus)
+        return self._apply(self.parent.outputs())
+
+    def _apply(self, X):
+        for stage in self.stages:
+            X = stage.transform(X)
+        return X
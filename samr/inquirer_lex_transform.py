@@ -1,49 +1,50 @@
 #  Explain and drop some links here
-from collections import namedtuple, defaultdict
-import csv
-import os
+from collections import namedtuple
+from functools import lru_cache
+
+import numpy
+from scipy.sparse import csr_matrix
 
 from samr.transformations import StatelessTransform
-from samr.settings import DATA_PATH
-
-
-FIELDS = ("Entry, Source, Positiv, Negativ, Pstv, Affil, Ngtv, Hostile, Strong,"
-          " Power, Weak, Submit, Active, Passive, Pleasur, Pain, Feel, Arousal,"
-          " EMOT, Virtue, Vice, Ovrst, Undrst, Academ, Doctrin, Econ, Exch, "
-          "ECON, Exprsv, Legal, Milit, Polit, POLIT, Relig, Role, COLL, Work, "
-          "Ritual, SocRel, Race, Kin, MALE, Female, Nonadlt, HU, ANI, PLACE, "
-          "Social, Region, Route, Aquatic, Land, Sky, Object, Tool, Food, "
-          "Vehicle, BldgPt, ComnObj, NatObj, BodyPt, ComForm, COM, Say, Need, "
-          "Goal, Try, Means, Persist, Complet, Fail, NatrPro, Begin, Vary, "
-          "Increas, Decreas, Finish, Stay, Rise, Exert, Fetch, Travel, Fall, "
-          "Think, Know, Causal, Ought, Perceiv, Compare, Eval, EVAL, Solve, "
-          "Abs, ABS, Quality, Quan, NUMB, ORD, CARD, FREQ, DIST, Time, TIME, "
-          "Space, POS, DIM, Rel, COLOR, Self, Our, You, Name, Yes, No, Negate, "
-          "Intrj, IAV, DAV, SV, IPadj, IndAdj, PowGain, PowLoss, PowEnds, "
-          "PowAren, PowCon, PowCoop, PowAuPt, PowPt, PowDoct, PowAuth, PowOth, "
-          "PowTot, RcEthic, RcRelig, RcGain, RcLoss, RcEnds, RcTot, RspGain, "
-          "RspLoss, RspOth, RspTot, AffGain, AffLoss, AffPt, AffOth, AffTot, "
-          "WltPt, WltTran, WltOth, WltTot, WlbGain, WlbLoss, WlbPhys, WlbPsyc, "
-          "WlbPt, WlbTot, EnlGain, EnlLoss, EnlEnds, EnlPt, EnlOth, EnlTot, "
-          "SklAsth, SklPt, SklOth, SklTot, TrnGain, TrnLoss, TranLw, MeansLw, "
-          "EndsLw, ArenaLw, PtLw, Nation, Anomie, NegAff, PosAff, SureLw, If, "
-          "NotLw, TimeSpc, FormLw, Othtags, Defined")
+from samr.inquirer_lexicon import (FIELDS, LEXICON_SOURCE, LEXICON_PATH,
+                                   get_lexicon, lexicon_stamp)
+
 
 InquirerLexEntry = namedtuple("InquirerLexEntry", FIELDS)
-FIELDS = InquirerLexEntry._fields
+
+# Lexicon columns used by default
+USE_FIELDS = ("Positiv", "Negativ", "IAV", "Strong")
+
+
+@lru_cache(maxsize=None)
+def _word_categories(fields, source, path):
+    """
+    Private function that caches, per process, the categories of the given
+    `fields` of every word of the lexicon (see
+    `InquirerLexicon.word_categories`).
+    """
+    return get_lexicon(source, path).word_categories(fields)
 
 
 class InquirerLexTransform(StatelessTransform):
-    _corpus = []
-    _use_fields = [FIELDS.index(x) for x in "Positiv Negativ IAV Strong".split()]
+    def __init__(self, fields=USE_FIELDS, source=LEXICON_SOURCE,
+                 path=LEXICON_PATH):
+        """
+        `fields` are the lexicon columns to use (any of `FIELDS` but "Entry").
+        `source` is the lexicon tsv file and `path` the folder where it's
+        compiled, see `samr.inquirer_lexicon`.
+        """
+        self.fields = tuple(fields)
+        self.source = source
+        self.path = path
 
-    def transform(self, X, y=None):
+    def _transform(self, X):
         """
         `X` is expected to be a list of `str` instances containing the phrases.
         Return value is a list of `str` containing different amounts of the
         words "Positiv_Positiv", "Negativ_Negativ", "IAV_IAV", "Strong_Strong"
-        based on the sentiments given to the input words by the Hardvard
-        Inquirer lexicon.
+        (for the default `fields`) based on the sentiments given to the input
+        words by the Hardvard Inquirer lexicon.
         """
         corpus = self._get_corpus()
         result = []
@@ -56,24 +57,78 @@ class InquirerLexTransform(StatelessTransform):
 
     def _get_corpus(self):
         """
-        Private method used to cache a dictionary with the Harvard Inquirer
-        corpus.
+        Private method that returns a dictionary mapping the words of the
+        Harvard Inquirer lexicon to their categories.
         """
-        if not self._corpus:
-            corpus = defaultdict(list)
-            it = csv.reader(open(os.path.join(DATA_PATH, "inquirerbasicttabsclean")),
-                            delimiter="\t")
-            next(it)  # Drop header row
-            for row in it:
-                entry = InquirerLexEntry(*row)
-                xs = []
-                for i in self._use_fields:
-                    name, x = FIELDS[i], entry[i]
-                    if x:
-                        xs.append("{}_{}".format(name, x))
-                name = entry.Entry.lower()
-                if "#" in name:
-                    name = name[:name.index("#")]
-                corpus[name].extend(xs)
-            self._corpus.append(dict(corpus))
-        return self._corpus[0]
+        return _word_categories(self.fields, self.source, self.path)
+
+    def data_stamp(self):
+        return lexicon_stamp(self.source, self.path)
+
+
+class InquirerLexFeatures(StatelessTransform):
+    """
+    Vectorized equivalent of `InquirerLexTransform` followed by a unigram
+    `CountVectorizer`: it counts the Harvard Inquirer categories of the words
+    of each phrase directly into a matrix with one column per category value
+    (ex: "Positiv_Positiv"), without building intermediate strings.
+    """
+    def __init__(self, binary=False, dense=False, dtype=numpy.float32,
+                 fields=USE_FIELDS, source=LEXICON_SOURCE, path=LEXICON_PATH):
+        """
+        If `binary` is true counts are clipped to 1.
+        If `dense` is true the result is a numpy ndarray instead of a scipy
+        sparse CSR matrix.
+        `fields`, `source` and `path` are as in `InquirerLexTransform`.
+        """
+        self.binary = binary
+        self.dense = dense
+        self.dtype = dtype
+        self.fields = tuple(fields)
+        self.source = source
+        self.path = path
+
+    def _transform(self, X):
+        """
+        `X` is expected to be a list of `str` instances containing the phrases.
+        Return value is a matrix of shape (n_samples, n_categories) in which
+        the i-th row counts the lexicon categories of the words in `X[i]`.
+        """
+        columns, word_columns = self._get_columns()
+        indptr = [0]
+        indices = []
+        for phrase in X:
+            for word in phrase.split():
+                indices.extend(word_columns.get(word.lower(), ()))
+            indptr.append(len(indices))
+        data = numpy.ones(len(indices), dtype=self.dtype)
+        Z = csr_matrix((data, indices, indptr), shape=(len(indptr) - 1, len(columns)))
+        Z.sum_duplicates()
+        if self.binary:
+            Z.data[:] = 1
+        if self.dense:
+            return Z.toarray()
+        return Z
+
+    def get_feature_names(self):
+        return list(self._get_columns()[0])
+
+    def data_stamp(self):
+        return lexicon_stamp(self.source, self.path)
+
+    def _get_columns(self):
+        """
+        Private method that returns the sorted category names and a dictionary
+        mapping every word of the lexicon to the columns of its categories.
+        """
+        return _lexicon_columns(self.fields, self.source, self.path)
+
+
+@lru_cache(maxsize=None)
+def _lexicon_columns(fields, source, path):
+    corpus = _word_categories(fields, source, path)
+    columns = sorted(set(x for xs in corpus.values() for x in xs))
+    index = {x: i for i, x in enumerate(columns)}
+    word_columns = {word: tuple(index[x] for x in xs)
+                    for word, xs in corpus.items() if xs}
+    return columns, word_columns
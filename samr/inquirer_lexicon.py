@@ -0,0 +1,247 @@
+"""
+A compiled, memory-mappable form of the Harvard Inquirer lexicon.
+
+Parsing the lexicon tsv (about 11k entries of 185 columns) is slow, so it is
+compiled once into arrays holding every category of every word (for all the
+columns, not only the ones used by samr) and saved next to the source. The
+compiled lexicon is recompiled automatically when the source changes (its
+size, modification time and, if those changed, its sha1) and is loaded with
+memory mapping, so processes share it read-only.
+"""
+import csv
+import hashlib
+import os
+import shutil
+from functools import lru_cache
+
+import numpy
+
+from samr.settings import DATA_PATH
+from samr.storage import StringArray, save_arrays, load_arrays, load_header
+
+
+FIELDS = ("Entry, Source, Positiv, Negativ, Pstv, Affil, Ngtv, Hostile, Strong,"
+          " Power, Weak, Submit, Active, Passive, Pleasur, Pain, Feel, Arousal,"
+          " EMOT, Virtue, Vice, Ovrst, Undrst, Academ, Doctrin, Econ, Exch, "
+          "ECON, Exprsv, Legal, Milit, Polit, POLIT, Relig, Role, COLL, Work, "
+          "Ritual, SocRel, Race, Kin, MALE, Female, Nonadlt, HU, ANI, PLACE, "
+          "Social, Region, Route, Aquatic, Land, Sky, Object, Tool, Food, "
+          "Vehicle, BldgPt, ComnObj, NatObj, BodyPt, ComForm, COM, Say, Need, "
+          "Goal, Try, Means, Persist, Complet, Fail, NatrPro, Begin, Vary, "
+          "Increas, Decreas, Finish, Stay, Rise, Exert, Fetch, Travel, Fall, "
+          "Think, Know, Causal, Ought, Perceiv, Compare, Eval, EVAL, Solve, "
+          "Abs, ABS, Quality, Quan, NUMB, ORD, CARD, FREQ, DIST, Time, TIME, "
+          "Space, POS, DIM, Rel, COLOR, Self, Our, You, Name, Yes, No, Negate, "
+          "Intrj, IAV, DAV, SV, IPadj, IndAdj, PowGain, PowLoss, PowEnds, "
+          "PowAren, PowCon, PowCoop, PowAuPt, PowPt, PowDoct, PowAuth, PowOth, "
+          "PowTot, RcEthic, RcRelig, RcGain, RcLoss, RcEnds, RcTot, RspGain, "
+          "RspLoss, RspOth, RspTot, AffGain, AffLoss, AffPt, AffOth, AffTot, "
+          "WltPt, WltTran, WltOth, WltTot, WlbGain, WlbLoss, WlbPhys, WlbPsyc, "
+          "WlbPt, WlbTot, EnlGain, EnlLoss, EnlEnds, EnlPt, EnlOth, EnlTot, "
+          "SklAsth, SklPt, SklOth, SklTot, TrnGain, TrnLoss, TranLw, MeansLw, "
+          "EndsLw, ArenaLw, PtLw, Nation, Anomie, NegAff, PosAff, SureLw, If, "
+          "NotLw, TimeSpc, FormLw, Othtags, Defined").split(", ")
+FIELDS = tuple(x.strip() for x in FIELDS)
+
+LEXICON_SOURCE = os.path.join(DATA_PATH, "inquirerbasicttabsclean")
+LEXICON_PATH = os.path.join(DATA_PATH, "inquirer_lexicon")
+LEXICON_KIND = "samr-inquirer-lexicon"
+LEXICON_VERSION = 1
+
+
+def normalize_entry(entry):
+    """
+    Returns the word of a lexicon entry: lowercased and without the sense
+    number (ex: "ABOUT#1" -> "about").
+    """
+    entry = entry.lower()
+    if "#" in entry:
+        entry = entry[:entry.index("#")]
+    return entry
+
+
+class InquirerLexicon:
+    """
+    The categories of every word of the lexicon, stored as arrays:
+        - `words`: the sorted words (see `normalize_entry`).
+        - `categories`: the sorted category names, "{field}_{value}" (ex:
+          "Positiv_Positiv").
+        - `category_fields`: the position in `FIELDS` of each category.
+        - `indptr`, `indices` and `entries`: the categories of the i-th word
+          are `indices[indptr[i]:indptr[i + 1]]`, in the order of the source,
+          and `entries` tells the entry (sense) of the source each one comes
+          from.
+    """
+    def __init__(self, words, categories, category_fields, indptr, indices,
+                 entries):
+        self.words = words
+        self.categories = categories
+        self.category_fields = category_fields
+        self.indptr = indptr
+        self.indices = indices
+        self.entries = entries
+
+    @classmethod
+    def from_source(cls, source=LEXICON_SOURCE):
+        """
+        Parses the lexicon tsv file `source`.
+        Raises `ValueError` if its rows don't have the expected columns.
+        """
+        items = {}
+        with open(source) as f:
+            rows = csv.reader(f, delimiter="\t")
+            next(rows)  # Drop header row
+            for n, row in enumerate(rows):
+                if len(row) != len(FIELDS):
+                    raise ValueError("Expected {} columns in {} but found {}"
+                                     .format(len(FIELDS), source, len(row)))
+                word_items = items.setdefault(normalize_entry(row[0]), [])
+                for i in range(1, len(FIELDS)):
+                    if row[i]:
+                        word_items.append((n, i, "{}_{}".format(FIELDS[i], row[i])))
+        categories = sorted(set((x, i) for xs in items.values() for _, i, x in xs))
+        index = {x: k for k, (x, _) in enumerate(categories)}
+        words = sorted(items)
+        indptr = numpy.zeros(len(words) + 1, dtype=numpy.int64)
+        numpy.cumsum([len(items[x]) for x in words], out=indptr[1:])
+        flat = [item for x in words for item in items[x]]
+        return cls(StringArray.from_strings(words),
+                   StringArray.from_strings(x for x, _ in categories),
+                   numpy.array([i for _, i in categories], dtype=numpy.int16),
+                   indptr,
+                   numpy.array([index[x] for _, _, x in flat], dtype=numpy.int32),
+                   numpy.array([n for n, _, _ in flat], dtype=numpy.int32))
+
+    @classmethod
+    def load(cls, path=LEXICON_PATH):
+        _, arrays = load_arrays(path, LEXICON_KIND, LEXICON_VERSION)
+        return cls(StringArray.from_arrays(arrays, "words"),
+                   StringArray.from_arrays(arrays, "categories"),
+                   arrays["category_fields"], arrays["indptr"],
+                   arrays["indices"], arrays["entries"])
+
+    def save(self, path=LEXICON_PATH, header=None):
+        arrays = self.words.arrays("words")
+        arrays.update(self.categories.arrays("categories"))
+        arrays.update(category_fields=self.category_fields, indptr=self.indptr,
+                      indices=self.indices, entries=self.entries)
+        save_arrays(path, LEXICON_KIND, LEXICON_VERSION, arrays, header=header)
+
+    def word_categories(self, fields):
+        """
+        Returns a dict mapping every word of the lexicon to the list of its
+        categories of the given `fields` (a sequence of names of `FIELDS`).
+        Categories are listed by entry of the source and, within an entry, in
+        the order of `fields`.
+        Raises `ValueError` if some field is unknown.
+        """
+        field_rank = numpy.full(len(FIELDS), -1, dtype=numpy.int64)
+        for rank, field in enumerate(fields):
+            field_rank[FIELDS.index(field)] = rank
+        rank = field_rank[self.category_fields][self.indices]
+        word = numpy.repeat(numpy.arange(len(self.words)), numpy.diff(self.indptr))
+        keep = numpy.flatnonzero(rank >= 0)
+        keep = keep[numpy.lexsort((rank[keep], self.entries[keep], word[keep]))]
+        categories = list(self.categories)
+        result = {x: [] for x in self.words}
+        words = list(self.words)
+        for i, k in zip(word[keep].tolist(), self.indices[keep].tolist()):
+            result[words[i]].append(categories[k])
+        return result
+
+    def __len__(self):
+        return len(self.words)
+
+
+def source_stamp(source):
+    stat = os.stat(source)
+    return {"source_size": stat.st_size, "source_mtime": stat.st_mtime}
+
+
+def source_sha1(source):
+    h = hashlib.sha1()
+    with open(source, "rb") as f:
+        for block in iter(lambda: f.read(2 ** 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def lexicon_stamp(source=LEXICON_SOURCE, path=LEXICON_PATH):
+    """
+    Returns a dict that identifies the contents of the lexicon read from
+    `source` (or only from `path`, the compiled lexicon, if there's no
+    source), to tell when results computed with it are outdated. The sha1 of
+    the source is computed once per size and modification time.
+    """
+    if os.path.isfile(source):
+        stamp = source_stamp(source)
+        sha1 = _source_sha1(source, stamp["source_size"], stamp["source_mtime"])
+        return {"version": LEXICON_VERSION, "source_sha1": sha1}
+    if os.path.isdir(path):
+        header = load_header(path)
+        return {"version": header.get("version"), "source_sha1": header.get("source_sha1")}
+    return {}
+
+
+@lru_cache(maxsize=None)
+def _source_sha1(source, size, mtime):
+    return source_sha1(source)
+
+
+def compile_lexicon(source=LEXICON_SOURCE, path=LEXICON_PATH):
+    """
+    Compiles the lexicon tsv file `source` into the folder `path`.
+    Return value is the new `InquirerLexicon`.
+    """
+    lexicon = InquirerLexicon.from_source(source)
+    header = source_stamp(source)
+    header["source_sha1"] = source_sha1(source)
+    # Written aside and moved into place so that concurrent readers never
+    # see a half written lexicon
+    tmp = "{}.tmp-{}".format(path, os.getpid())
+    lexicon.save(tmp, header=header)
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    try:
+        os.rename(tmp, path)
+    except OSError:  # Another process compiled it meanwhile
+        shutil.rmtree(tmp, ignore_errors=True)
+    get_lexicon.cache_clear()
+    return lexicon
+
+
+def _is_current(path, source):
+    """
+    Private function that tells if the lexicon compiled at `path` is up to
+    date with `source`. The sha1 of the source is only computed when its size
+    or modification time changed.
+    """
+    if not os.path.isdir(path):
+        return False
+    if not os.path.isfile(source):
+        return True  # Only the compiled lexicon is available
+    header = load_header(path)
+    if header.get("kind") != LEXICON_KIND or header.get("version") != LEXICON_VERSION:
+        return False
+    stamp = source_stamp(source)
+    if all(header.get(key) == value for key, value in stamp.items()):
+        return True
+    return header.get("source_sha1") == source_sha1(source)
+
+
+@lru_cache(maxsize=None)
+def get_lexicon(source=LEXICON_SOURCE, path=LEXICON_PATH):
+    """
+    Returns the `InquirerLexicon` compiled from `source` at `path` (loading it
+    only once per process), compiling it first if it's missing or outdated.
+    If `path` can't be written the lexicon is parsed from `source` instead.
+    """
+    if _is_current(path, source):
+        return InquirerLexicon.load(path)
+    try:
+        compile_lexicon(source, path)
+    except OSError:
+        if not os.path.isfile(source):
+            raise
+        return InquirerLexicon.from_source(source)
+    return InquirerLexicon.load(path)
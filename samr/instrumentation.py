@@ -0,0 +1,172 @@
+"""
+Opt-in instrumentation of the steps of a `PhraseSentimentPredictor`.
+
+`Profiler.instrument` wraps every step of a scikit-learn pipeline (recursing
+into pipelines and feature unions) with an `Instrumented` step that records,
+for each call to fit/transform/predict, the wall and cpu time spent, the rows
+given and returned, the shape and number of non-zeros of the output and the
+memory growth of the process.
+"""
+import resource
+import time
+
+import numpy
+from scipy.sparse import issparse
+
+try:
+    import tracemalloc
+except ImportError:  # Python < 3.4
+    tracemalloc = None
+
+
+def _n_rows(X):
+    if hasattr(X, "shape"):
+        return X.shape[0]
+    try:
+        return len(X)
+    except TypeError:
+        return None
+
+
+def _describe_output(Z):
+    if issparse(Z):
+        return {"output_shape": list(Z.shape), "output_nnz": int(Z.nnz)}
+    if isinstance(Z, numpy.ndarray):
+        return {"output_shape": list(Z.shape),
+                "output_nnz": int(numpy.count_nonzero(Z))}
+    rows = _n_rows(Z)
+    return {"output_shape": None if rows is None else [rows]}
+
+
+class Profiler:
+    """
+    Collects the records of `Instrumented` steps. Each record is a dict, see
+    `Instrumented` for its contents.
+    """
+    def __init__(self, callback=None):
+        """
+        `callback`, if given, is called with every new record (ex: to send it
+        to a metrics system).
+        """
+        self.callback = callback
+        self.records = []
+
+    def add(self, record):
+        self.records.append(record)
+        if self.callback:
+            self.callback(record)
+
+    def summary(self):
+        """
+        Returns a dict mapping `(step, method)` tuples to the amount of calls
+        and the total wall and cpu time recorded for them.
+        """
+        result = {}
+        for record in self.records:
+            key = (record["step"], record["method"])
+            total = result.setdefault(key, {"calls": 0, "wall_seconds": 0.0,
+                                            "cpu_seconds": 0.0})
+            total["calls"] += 1
+            total["wall_seconds"] += record["wall_seconds"]
+            total["cpu_seconds"] += record["cpu_seconds"]
+        return result
+
+    def instrument(self, estimator, name):
+        """
+        Returns `estimator` wrapped as an `Instrumented` step named `name`. If
+        it is a scikit-learn `Pipeline` or `FeatureUnion` its inner steps are
+        instrumented too (in place), with names prefixed by `name` + "/".
+        """
+        for attribute in ["steps", "transformer_list"]:
+            steps = getattr(estimator, attribute, None)
+            if steps is not None:
+                for i, (step_name, step) in enumerate(steps):
+                    step_path = "{}/{}".format(name, step_name)
+                    steps[i] = (step_name, self.instrument(step, step_path))
+        return Instrumented(estimator, name, self)
+
+
+class Instrumented:
+    """
+    Wraps a transformation or classifier recording every call to `fit`,
+    `transform`, `fit_transform`, `partial_fit` and `predict` into a
+    `Profiler`. Records are dicts with the keys:
+        - `step` and `method`: the name of the step and the method called.
+        - `wall_seconds` and `cpu_seconds`: the time spent.
+        - `rows_in` and `rows_out`: the amount of rows given and returned.
+        - `output_shape` and `output_nnz`: the shape and non-zero entries of
+          the output (when it's a matrix).
+        - `maxrss_delta_kb`: the growth of the peak resident memory.
+        - `memory_delta_bytes`: the growth of allocated memory (only if
+          `tracemalloc` is tracing).
+    Other attributes are forwarded to the wrapped estimator. The profiler is
+    not pickled.
+    """
+    def __init__(self, estimator, name, profiler):
+        self.estimator = estimator
+        self.name = name
+        self.profiler = profiler
+
+    def fit(self, X, y=None):
+        self._call("fit", X, self.estimator.fit, X, y)
+        return self
+
+    @property
+    def partial_fit(self):
+        # A property so that `hasattr` tells if the estimator has partial_fit
+        partial_fit = self.estimator.partial_fit
+
+        def wrapper(X, y=None, **kwargs):
+            self._call("partial_fit", X, partial_fit, X, y, **kwargs)
+            return self
+        return wrapper
+
+    def transform(self, X):
+        return self._call("transform", X, self.estimator.transform, X)
+
+    def fit_transform(self, X, y=None):
+        if hasattr(self.estimator, "fit_transform"):
+            return self._call("fit_transform", X, self.estimator.fit_transform,
+                              X, y)
+        self.fit(X, y)
+        return self.transform(X)
+
+    def predict(self, X):
+        return self._call("predict", X, self.estimator.predict, X)
+
+    def _call(self, method, X, function, *args, **kwargs):
+        if self.profiler is None:
+            return function(*args, **kwargs)
+        tracing = tracemalloc is not None and tracemalloc.is_tracing()
+        if tracing:
+            start_memory = tracemalloc.get_traced_memory()[0]
+        start_maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start_cpu = time.process_time()
+        start = time.perf_counter()
+        Z = function(*args, **kwargs)
+        record = {"step": self.name, "method": method,
+                  "wall_seconds": time.perf_counter() - start,
+                  "cpu_seconds": time.process_time() - start_cpu,
+                  "rows_in": _n_rows(X)}
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        record["maxrss_delta_kb"] = maxrss - start_maxrss
+        if tracing:
+            memory = tracemalloc.get_traced_memory()[0]
+            record["memory_delta_bytes"] = memory - start_memory
+        if Z is self.estimator:
+            record.update(rows_out=None, output_shape=None)
+        else:
+            record["rows_out"] = _n_rows(Z)
+            record.update(_describe_output(Z))
+        self.profiler.add(record)
+        return Z
+
+    def __getattr__(self, name):
+        if name.startswith("__") or name == "estimator":
+            raise AttributeError(name)
+        return getattr(self.estimator, name)
+
+    def __getstate__(self):
+        state = dict(vars(self))
+        state["profiler"] = None
+        return state
@@ -0,0 +1,374 @@
+"""
+A k-nearest-neighbours classifier for the low dimensional features that the
+pairwise classifiers of samr produce, with a pluggable neighbour search
+index:
+    - "brute": exact search by blocks of float32 matrix products.
+    - "tree": exact search with a KD-tree (`scipy.spatial.cKDTree`).
+    - "ivf": approximate search with an inverted file: the training points
+      are grouped in `n_lists` k-means clusters and only the `n_probe`
+      clusters nearest to each query are searched. Raising `n_probe` trades
+      speed for recall (`n_probe == n_lists` is exact search).
+
+Points are stored as float32 and queries are answered in batches, in several
+threads if asked to. `compare_to_exact` measures the recall and accuracy lost
+by an approximate index.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy
+
+from samr.parallel import effective_n_jobs
+
+
+class BruteForceIndex:
+    """
+    Exact nearest neighbour search over the rows of `X`.
+    """
+    def __init__(self, X):
+        self.X = X
+        self.norms = _squared_norms(X)
+
+    def query(self, Q, k):
+        """
+        Returns a `(distances, indices)` tuple of `(len(Q), k)` arrays with
+        the squared euclidean distances and the row indexes of the `k` rows of
+        `X` nearest to each row of `Q`, nearest first. Rows are padded with
+        infinite distances and -1 indexes if `X` has less than `k` rows.
+        """
+        return _nearest(Q, self.X, self.norms, k)
+
+
+class TreeIndex:
+    """
+    Exact nearest neighbour search over the rows of `X` with a KD-tree. The
+    tree is not pickled but built again on load, so that `X` can be memory
+    mapped.
+    """
+    def __init__(self, X):
+        self.X = X
+        self._build()
+
+    def _build(self):
+        from scipy.spatial import cKDTree
+        self.tree = cKDTree(self.X)
+
+    def __getstate__(self):
+        state = dict(vars(self))
+        del state["tree"]
+        return state
+
+    def __setstate__(self, state):
+        vars(self).update(state)
+        self._build()
+
+    def query(self, Q, k):
+        """
+        Same as `BruteForceIndex.query`.
+        """
+        distances, indices = self.tree.query(Q, k=k)
+        distances = distances.reshape(len(Q), k).astype(numpy.float32) ** 2
+        indices = indices.reshape(len(Q), k).astype(numpy.int64)
+        indices[indices == len(self.X)] = -1
+        return distances, indices
+
+
+class IVFIndex:
+    """
+    Approximate nearest neighbour search over the rows of `X` with an
+    inverted file of `n_lists` k-means clusters (by default about the square
+    root of the amount of rows), searching the `n_probe` clusters nearest to
+    each query. The clusters are computed on at most `sample_size` rows.
+    """
+    def __init__(self, X, n_lists=None, n_probe=8, sample_size=100000, seed=0):
+        from scipy.cluster.vq import kmeans2
+        if n_lists is None:
+            n_lists = max(1, int(numpy.sqrt(len(X))))
+        n_lists = min(n_lists, len(X))
+        self.n_probe = n_probe
+        rng = numpy.random.RandomState(seed)
+        sample = X
+        if len(X) > sample_size:
+            sample = X[rng.choice(len(X), sample_size, replace=False)]
+        sample = sample.astype(numpy.float64)
+        centroids, _ = kmeans2(sample, _kmeans_seeds(sample, n_lists, rng),
+                               minit="matrix")
+        self.centroids = centroids.astype(numpy.float32)
+        self.centroid_norms = _squared_norms(self.centroids)
+        _, lists = _nearest(X, self.centroids, self.centroid_norms, 1)
+        lists = lists[:, 0]
+        # The points of the i-th list are rows order[offsets[i]:offsets[i + 1]]
+        self.order = numpy.argsort(lists, kind="mergesort")
+        self.offsets = numpy.zeros(n_lists + 1, dtype=numpy.int64)
+        numpy.cumsum(numpy.bincount(lists, minlength=n_lists), out=self.offsets[1:])
+        self.X = X[self.order]
+        self.norms = _squared_norms(self.X)
+
+    def query(self, Q, k):
+        """
+        Same as `BruteForceIndex.query`, except that the neighbours are only
+        looked for in the `n_probe` lists nearest to each query.
+        """
+        n_probe = min(self.n_probe, len(self.centroids))
+        _, probes = _nearest(Q, self.centroids, self.centroid_norms, n_probe)
+        distances = numpy.full((len(Q), n_probe * k), numpy.inf, dtype=numpy.float32)
+        indices = numpy.full((len(Q), n_probe * k), -1, dtype=numpy.int64)
+        for rank in range(n_probe):
+            columns = slice(rank * k, (rank + 1) * k)
+            for i in numpy.unique(probes[:, rank]):
+                queries = numpy.flatnonzero(probes[:, rank] == i)
+                start, end = self.offsets[i], self.offsets[i + 1]
+                d, j = _nearest(Q[queries], self.X[start:end], self.norms[start:end], k)
+                distances[queries, columns] = d
+                indices[queries, columns] = numpy.where(j >= 0, j + start, -1)
+        best = _smallest(distances, k)
+        distances = _take(distances, best)
+        indices = _take(indices, best)
+        found = indices >= 0
+        indices[found] = self.order[indices[found]]
+        return distances, indices
+
+
+# Neighbour search indexes by name, see `register_index`
+_indexes = {
+    "brute": BruteForceIndex,
+    "tree": TreeIndex,
+    "ivf": IVFIndex,
+}
+
+
+def register_index(name, index):
+    """
+    Makes `index` available as the `index` of `NeighborsClassifier` under
+    `name`.
+    `index` is expected to be a class (or callable) that takes the training
+    points (a float32 array) and the `index_args` as keyword arguments, and
+    returns an object with a `query(Q, k)` method like
+    `BruteForceIndex.query`.
+    """
+    _indexes[name] = index
+
+
+class NeighborsClassifier:
+    """
+    A k-nearest-neighbours classifier (with uniform votes, ties going to the
+    first class) over a pluggable search index, to be used as the main
+    classifier of `samr.predictor.PhraseSentimentPredictor` as "ann".
+    """
+    def __init__(self, n_neighbors=5, index="ivf", index_args=None,
+                 batch_size=4096, n_jobs=1):
+        """
+        Parameter description:
+            - `n_neighbors`: The amount of neighbours that vote.
+            - `index`: The name of the search index: "brute", "tree", "ivf"
+              or one given to `register_index`.
+            - `index_args`: A dict to be passed as arguments to the index (ex:
+              `{"n_probe": 16}` for "ivf").
+            - `batch_size`: The amount of points queried at once.
+            - `n_jobs`: The amount of threads that query batches, -1 means one
+              per cpu.
+        """
+        if index not in _indexes:
+            raise ValueError("Unknown index {!r}, valid values are: {}".format(
+                             index, ", ".join(sorted(_indexes))))
+        self.n_neighbors = n_neighbors
+        self.index = index
+        self.index_args = index_args
+        self.batch_size = batch_size
+        self.n_jobs = n_jobs
+
+    def fit(self, X, y):
+        X = numpy.ascontiguousarray(X, dtype=numpy.float32)
+        self.classes_, self.codes = numpy.unique(y, return_inverse=True)
+        self.index_ = _indexes[self.index](X, **(self.index_args or {}))
+        return self
+
+    def kneighbors(self, X, n_neighbors=None):
+        """
+        Returns a `(distances, indices)` tuple with the (squared euclidean)
+        distances and training row indexes of the nearest neighbours of each
+        row of `X`, nearest first.
+        """
+        k = n_neighbors or self.n_neighbors
+        X = numpy.ascontiguousarray(X, dtype=numpy.float32)
+        batches = [X[i:i + self.batch_size] for i in range(0, len(X), self.batch_size)]
+        if not batches:
+            return (numpy.zeros((0, k), dtype=numpy.float32),
+                    numpy.zeros((0, k), dtype=numpy.int64))
+        n_jobs = min(effective_n_jobs(self.n_jobs), len(batches))
+        if n_jobs == 1:
+            results = [self.index_.query(Q, k) for Q in batches]
+        else:
+            # The searches spend most of their time in numpy and scipy, which
+            # release the GIL
+            with ThreadPoolExecutor(n_jobs) as executor:
+                results = list(executor.map(lambda Q: self.index_.query(Q, k), batches))
+        return (numpy.concatenate([d for d, _ in results]),
+                numpy.concatenate([i for _, i in results]))
+
+    def predict(self, X):
+        _, indices = self.kneighbors(X)
+        return self._vote(indices)
+
+    def _vote(self, indices):
+        votes = numpy.zeros((len(indices), len(self.classes_)), dtype=numpy.int64)
+        found = indices >= 0
+        rows = numpy.repeat(numpy.arange(len(indices)), found.sum(axis=1))
+        numpy.add.at(votes, (rows, self.codes[indices[found]]), 1)
+        return self.classes_[votes.argmax(axis=1)]
+
+    def score(self, X, y):
+        return float(numpy.mean(self.predict(X) == numpy.asarray(y)))
+
+
+def compare_to_exact(classifier, X, y=None, tolerance=1e-4):
+    """
+    Measures how the fitted `NeighborsClassifier` `classifier` compares to
+    exact search on the points `X` (with true labels `y`, if given).
+    Return value is a dict with:
+        - `recall`: the fraction of the neighbours found that are as near as
+          the k-th exact nearest neighbour (up to a relative `tolerance`).
+          Distances are compared instead of row indexes because points are
+          often duplicated, and any of several equally near rows is a right
+          answer.
+        - `agreement`: the fraction of predictions equal to the ones of exact
+          search (which breaks distance ties by row index). Exact indexes can
+          still disagree where tied neighbours have different labels.
+        - `seconds` and `exact_seconds`: the time spent predicting.
+        - `accuracy`, `exact_accuracy` and `accuracy_loss` (only if `y` is
+          given).
+    """
+    points = _training_points(classifier.index_)
+    exact = NeighborsClassifier(classifier.n_neighbors, index="brute",
+                                batch_size=classifier.batch_size,
+                                n_jobs=classifier.n_jobs)
+    exact.classes_ = classifier.classes_
+    exact.codes = classifier.codes
+    exact.index_ = BruteForceIndex(points)
+    start = time.perf_counter()
+    _, indices = classifier.kneighbors(X)
+    predicted = classifier._vote(indices)
+    seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    _, exact_indices = exact.kneighbors(X)
+    exact_predicted = exact._vote(exact_indices)
+    exact_seconds = time.perf_counter() - start
+    X = numpy.asarray(X, dtype=numpy.float64)
+    distances = _exact_distances(points, X, indices)
+    kth = _exact_distances(points, X, exact_indices)
+    kth = numpy.where(exact_indices >= 0, kth, 0).max(axis=1)
+    found = (distances <= (kth * (1 + tolerance) + tolerance)[:, numpy.newaxis]).sum()
+    report = {"recall": found / max(numpy.sum(exact_indices >= 0), 1),
+              "agreement": float(numpy.mean(predicted == exact_predicted)),
+              "seconds": seconds, "exact_seconds": exact_seconds}
+    if y is not None:
+        y = numpy.asarray(y)
+        report["accuracy"] = float(numpy.mean(predicted == y))
+        report["exact_accuracy"] = float(numpy.mean(exact_predicted == y))
+        report["accuracy_loss"] = report["exact_accuracy"] - report["accuracy"]
+    return report
+
+
+def _exact_distances(points, X, indices):
+    """
+    Private function that returns the squared distances (in float64) from
+    each row of `X` to the rows of `points` in the same row of `indices`,
+    infinite where the index is -1.
+    """
+    distances = numpy.full(indices.shape, numpy.inf)
+    for column in range(indices.shape[1]):
+        found = indices[:, column] >= 0
+        diff = points[indices[found, column]].astype(numpy.float64) - X[found]
+        distances[found, column] = _squared_norms(diff)
+    return distances
+
+
+def _training_points(index):
+    """
+    Private function that returns the training points of `index` (an index
+    with an `X` attribute) in their original order.
+    """
+    if hasattr(index, "order"):
+        X = numpy.empty_like(index.X)
+        X[index.order] = index.X
+        return X
+    return index.X
+
+
+def _squared_norms(X):
+    return numpy.einsum("ij,ij->i", X, X)
+
+
+def _smallest(distances, k):
+    """
+    Private function that returns the column indexes of the `k` smallest
+    values of each row of `distances`, smallest first. Ties are broken by
+    column index, so that columns in row index order give an exact search
+    that doesn't depend on how the points were partitioned.
+    """
+    if k < distances.shape[1]:
+        kth = numpy.partition(distances, k - 1, axis=1)[:, k - 1:k]
+        smaller = distances < kth
+        ties = distances == kth
+        # Of the values equal to the k-th, keep the first ones
+        needed = k - smaller.sum(axis=1, keepdims=True)
+        selected = smaller | (ties & (numpy.cumsum(ties, axis=1) <= needed))
+        columns = numpy.nonzero(selected)[1].reshape(len(distances), k)
+    else:
+        columns = numpy.tile(numpy.arange(distances.shape[1]), (len(distances), 1))
+    order = numpy.argsort(_take(distances, columns), axis=1, kind="mergesort")
+    return _take(columns, order)
+
+
+def _take(A, columns):
+    """
+    Private function that returns the elements of each row of `A` at the
+    column indexes in the same row of `columns`.
+    """
+    return A[numpy.arange(len(A))[:, numpy.newaxis], columns]
+
+
+def _kmeans_seeds(X, k, rng):
+    """
+    Private function that returns `k` rows of `X` chosen with the k-means++
+    rule (each one with probability proportional to its squared distance to
+    the nearest of the ones already chosen) with the `numpy.random.RandomState`
+    `rng`, as initial centroids for `scipy.cluster.vq.kmeans2`.
+    """
+    seeds = numpy.empty((k, X.shape[1]), dtype=X.dtype)
+    seeds[0] = X[rng.randint(len(X))]
+    distances = _squared_norms(X - seeds[0])
+    for i in range(1, k):
+        total = distances.sum()
+        if total > 0:
+            seeds[i] = X[rng.choice(len(X), p=distances / total)]
+        else:
+            seeds[i] = X[rng.randint(len(X))]
+        distances = numpy.minimum(distances, _squared_norms(X - seeds[i]))
+    return seeds
+
+
+def _nearest(Q, X, norms, k, block_size=2 ** 24):
+    """
+    Private function that returns the squared distances and indexes of the
+    `k` rows of `X` (whose squared norms are `norms`) nearest to each row of
+    `Q`, padded with infinite distances and -1 indexes if `X` has less than
+    `k` rows. Distances are computed for blocks of about `block_size`
+    (query, point) pairs at a time.
+    """
+    distances = numpy.full((len(Q), k), numpy.inf, dtype=numpy.float32)
+    indices = numpy.full((len(Q), k), -1, dtype=numpy.int64)
+    if not len(Q):
+        return distances, indices
+    Q_norms = _squared_norms(Q)[:, numpy.newaxis]
+    step = max(k, block_size // len(Q))
+    for start in range(0, len(X), step):
+        D = norms[numpy.newaxis, start:start + step] - 2 * Q.dot(X[start:start + step].T)
+        D += Q_norms
+        numpy.maximum(D, 0, out=D)
+        D = numpy.hstack([distances, D])
+        best = _smallest(D, k)
+        distances = _take(D, best)
+        indices = numpy.where(best < k, _take(indices, numpy.minimum(best, k - 1)),
+                              best - k + start)
+    return distances, indices
@@ -0,0 +1,220 @@
+"""
+The execution context of samr: a single pool of worker processes that is
+created the first time it's needed and reused by every later parallel step
+(the stateless transformations, the pairwise classifiers of every feature
+extraction, of every fold...), so that the cost of starting the workers is
+paid only once per process.
+
+Its size is `samr.settings.N_JOBS` (set with the SAMR_N_JOBS environment
+variable, -1 means one per cpu) or the one given to `set_n_jobs`, and every
+`n_jobs` of samr is capped to it (see `effective_n_jobs`).
+
+`share` passes big read-only arrays to the workers through a memory mapped
+file instead of a copy for each task.
+"""
+import atexit
+import itertools
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+import numpy
+from scipy.sparse import issparse, vstack, csr_matrix, csc_matrix
+
+from samr import settings
+from samr.data import PhraseTexts
+from samr.storage import save_arrays, load_arrays
+
+
+SHARED_KIND = "samr-shared-array"
+SHARED_VERSION = 1
+
+_context = {"n_jobs": settings.N_JOBS, "pool": None, "pid": None, "folder": None,
+            "folder_pid": None}
+_shared_ids = itertools.count()
+
+
+def cpu_count():
+    try:
+        return multiprocessing.cpu_count()
+    except NotImplementedError:
+        return 1
+
+
+def pool_size():
+    """
+    Returns the amount of worker processes of the execution context.
+    """
+    n_jobs = _context["n_jobs"]
+    if n_jobs is None or n_jobs < 0:
+        return cpu_count()
+    return max(1, n_jobs)
+
+
+def set_n_jobs(n_jobs):
+    """
+    Changes the size of the execution context to `n_jobs` processes (-1
+    means one per cpu). The current pool, if any, is closed.
+    """
+    if n_jobs != _context["n_jobs"]:
+        close_pool()
+        _context["n_jobs"] = n_jobs
+
+
+def effective_n_jobs(n_jobs):
+    """
+    Returns the amount of processes meant by `n_jobs`: itself if it's
+    positive, or all the ones of the execution context if it's negative,
+    but never more than those (see `pool_size`).
+    """
+    if n_jobs is None or n_jobs == 0:
+        return 1
+    if n_jobs < 0:
+        return pool_size()
+    return min(n_jobs, pool_size())
+
+
+def can_fork():
+    """
+    Tells if this process can start worker processes: the platform must
+    support the "fork" start method (workers inherit the state of this
+    process, like the loaded corpus) and this can't be a worker of a
+    `multiprocessing.Pool`.
+    """
+    if "fork" not in multiprocessing.get_all_start_methods():
+        return False
+    return not multiprocessing.current_process().daemon
+
+
+def fork_pool(processes, initializer=None, initargs=()):
+    """
+    Returns a `multiprocessing.Pool` of `processes` forked workers, whatever
+    the default start method of the platform is. Check `can_fork` first.
+    """
+    context = multiprocessing.get_context("fork")
+    return context.Pool(processes, initializer=initializer, initargs=initargs)
+
+
+def get_pool():
+    """
+    Returns the `multiprocessing.Pool` of the execution context, starting it
+    if this is the first call (or the first after `set_n_jobs`). Workers are
+    forked (see `fork_pool`).
+    """
+    if _context["pool"] is None or _context["pid"] != os.getpid():
+        # A forked process can't use the pool of its parent
+        _context["pool"] = fork_pool(pool_size())
+        _context["pid"] = os.getpid()
+    return _context["pool"]
+
+
+@atexit.register
+def close_pool():
+    """
+    Terminates the pool made by `get_pool` and removes the arrays made by
+    `share`, if this is the process that made them.
+    """
+    pool, _context["pool"] = _context["pool"], None
+    if pool is not None and _context["pid"] == os.getpid():
+        pool.terminate()
+    folder, _context["folder"] = _context["folder"], None
+    # Forked processes (ex: pool workers) inherit the folder but don't own it
+    if folder is not None and _context["folder_pid"] == os.getpid():
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def concatenate(parts):
+    """
+    Joins the results of a function applied to consecutive chunks of an
+    input: lists are concatenated, numpy arrays and scipy sparse matrices are
+    stacked by rows. The sentence ids of `samr.data.PhraseTexts` are kept.
+    """
+    first = parts[0]
+    if issparse(first):
+        return vstack(parts, format=first.format)
+    if isinstance(first, numpy.ndarray):
+        return numpy.concatenate(parts)
+    result = [x for part in parts for x in part]
+    if isinstance(first, PhraseTexts):
+        sentenceids = [x for part in parts for x in part.sentenceids]
+        return PhraseTexts(result, sentenceids)
+    return result
+
+
+def _call(args):
+    function, chunk = args
+    return function(chunk)
+
+
+def parallel_map(function, chunks):
+    """
+    Returns the list of the results of `function` on each element of
+    `chunks`, computed in the worker processes of the execution context (see
+    `get_pool`).
+    `function` and the chunks are pickled, so `function` should be a module
+    level function or a bound method of a picklable object, and big arrays
+    are better sent with `share`. Processes that can't fork (see `can_fork`)
+    compute them serially.
+    """
+    if not can_fork():
+        return [function(chunk) for chunk in chunks]
+    return get_pool().map(_call, [(function, chunk) for chunk in chunks])
+
+
+class SharedArray:
+    """
+    A read-only numpy array or scipy sparse matrix, `value`, stored in a file
+    (see `share`) so that it's pickled as the name of that file and
+    unpickled by memory mapping it.
+    """
+    def __init__(self, value, path):
+        self.value = value
+        self.path = path
+
+    def __getstate__(self):
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.path = state["path"]
+        header, arrays = load_arrays(self.path, SHARED_KIND, SHARED_VERSION)
+        if header["format"] == "dense":
+            self.value = arrays["data"]
+        else:
+            matrix = csr_matrix if header["format"] == "csr" else csc_matrix
+            self.value = matrix((arrays["data"], arrays["indices"], arrays["indptr"]),
+                                shape=header["shape"])
+
+    def release(self):
+        """
+        Removes the file of the array. Copies already unpickled keep working.
+        """
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+def share(X):
+    """
+    Returns a `SharedArray` with `X` (a numpy array or a scipy sparse matrix,
+    which is stored as csr unless it's csc) to be sent to the worker
+    processes without copying it. The file is written to shared memory if
+    available, and should be removed with `SharedArray.release` once the
+    workers are done (otherwise it's removed by `close_pool` at exit).
+    """
+    if issparse(X):
+        if X.format != "csc":
+            X = X.tocsr()
+        arrays = {"data": X.data, "indices": X.indices, "indptr": X.indptr}
+        header = {"format": X.format, "shape": list(X.shape)}
+    else:
+        X = numpy.asarray(X)
+        if X.dtype.hasobject:
+            raise ValueError("Arrays of objects can't be shared")
+        arrays = {"data": X}
+        header = {"format": "dense"}
+    if _context["folder"] is None or _context["folder_pid"] != os.getpid():
+        base = "/dev/shm" if os.access("/dev/shm", os.W_OK) else None
+        _context["folder"] = tempfile.mkdtemp(prefix="samr-shared-", dir=base)
+        _context["folder_pid"] = os.getpid()
+    path = os.path.join(_context["folder"], "array{}".format(next(_shared_ids)))
+    save_arrays(path, SHARED_KIND, SHARED_VERSION, arrays, header=header)
+    return SharedArray(X, path)
@@ -0,0 +1,201 @@
+"""
+A bag-of-words vectorizer that takes advantage of the phrase tree of the SAMR
+corpus.
+
+In the SAMR data every phrase is a contiguous span of tokens of its sentence,
+so instead of extracting the n-grams of every phrase `PhraseTreeVectorizer`
+extracts them once per sentence and builds the row of each phrase out of the
+n-grams that lie within its span. An n-gram of length `k` lies within the
+span `[a, b)` when it starts in `[a, b - k]`, so keeping the n-grams of each
+length sorted by start position makes the n-grams of any span a slice of
+them, and the whole matrix is assembled with a few numpy operations.
+"""
+import numbers
+
+import numpy
+from scipy.sparse import coo_matrix
+from sklearn.feature_extraction.text import CountVectorizer
+
+
+class PhraseTreeVectorizer(CountVectorizer):
+    """
+    A `CountVectorizer` (with the same parameters and output) that computes
+    the n-grams of each sentence only once when the input texts have a
+    `sentenceids` attribute (see `samr.data.PhraseTexts`).
+    The n-grams of a sentence are taken from its longest text in the input,
+    and texts that are not a span of tokens of it are processed on their own.
+    Inputs without sentence ids and the options this class doesn't handle
+    (`max_features`, a fixed `vocabulary`, a custom `preprocessor`,
+    `strip_accents` or a non "word" `analyzer`) are left to `CountVectorizer`.
+    """
+    def fit(self, raw_documents, y=None):
+        self.fit_transform(raw_documents)
+        return self
+
+    def fit_transform(self, raw_documents, y=None):
+        if not self._uses_spans(raw_documents):
+            return CountVectorizer.fit_transform(self, raw_documents, y)
+        terms = {}
+        X = self._count(raw_documents, terms, grow=True)
+        self.fixed_vocabulary_ = False
+        n_doc = X.shape[0]
+        max_doc_count = self.max_df
+        if not isinstance(max_doc_count, numbers.Integral):
+            max_doc_count *= n_doc
+        min_doc_count = self.min_df
+        if not isinstance(min_doc_count, numbers.Integral):
+            min_doc_count *= n_doc
+        if max_doc_count < min_doc_count:
+            raise ValueError("max_df corresponds to < documents than min_df")
+        if not terms:
+            raise ValueError("empty vocabulary; perhaps the documents only "
+                             "contain stop words")
+        df = numpy.bincount(X.indices, minlength=len(terms))
+        keep = (df >= min_doc_count) & (df <= max_doc_count)
+        if not keep.any():
+            raise ValueError("After pruning, no terms remain. Try a lower "
+                             "min_df or a higher max_df.")
+        names = numpy.empty(len(terms), dtype=object)
+        names[list(terms.values())] = list(terms.keys())
+        kept = sorted(names[keep].tolist())
+        self.vocabulary_ = {term: i for i, term in enumerate(kept)}
+        self.stop_words_ = set(names[~keep].tolist())
+        remap = numpy.full(len(terms), -1, dtype=numpy.int64)
+        remap[keep] = [self.vocabulary_[x] for x in names[keep]]
+        X = X.tocoo()
+        cols = remap[X.col]
+        selected = cols >= 0
+        X = coo_matrix((X.data[selected], (X.row[selected], cols[selected])),
+                       shape=(n_doc, len(kept)), dtype=self.dtype).tocsr()
+        X.sort_indices()
+        return X
+
+    def transform(self, raw_documents):
+        if not self._uses_spans(raw_documents):
+            return CountVectorizer.transform(self, raw_documents)
+        self._check_vocabulary()
+        return self._count(raw_documents, self.vocabulary_, grow=False)
+
+    def _uses_spans(self, raw_documents):
+        return (getattr(raw_documents, "sentenceids", None) is not None and
+                self.analyzer == "word" and self.max_features is None and
+                self.vocabulary is None and self.preprocessor is None and
+                self.strip_accents is None)
+
+    def _count(self, texts, terms, grow):
+        """
+        Private method that returns the CSR matrix of n-gram counts of
+        `texts`, with the column of each n-gram given by `terms`. If `grow` is
+        true n-grams missing from `terms` are added to it, otherwise they are
+        ignored.
+        """
+        tokenizer = self.build_tokenizer()
+        lowercase = self.lowercase
+
+        def tokenize(text):
+            return tokenizer(text.lower() if lowercase else text)
+
+        bases, spans = _phrase_spans(texts, tokenize, self.get_stop_words())
+        min_n, max_n = self.ngram_range
+        # The ids of the n-grams of all bases, grouped by length and base and
+        # sorted by start position, plus the position in `ids` of the first
+        # n-gram of each length and base
+        ids = []
+        first = numpy.zeros((max_n - min_n + 1, len(bases)), dtype=numpy.int64)
+        for k in range(min_n, max_n + 1):
+            for b, tokens in enumerate(bases):
+                first[k - min_n, b] = len(ids)
+                for p in range(len(tokens) - k + 1):
+                    term = " ".join(tokens[p:p + k])
+                    if grow:
+                        ids.append(terms.setdefault(term, len(terms)))
+                    else:
+                        ids.append(terms.get(term, -1))
+        ids = numpy.array(ids, dtype=numpy.int64)
+        base, start, end = spans
+        rows = []
+        starts = []
+        counts = []
+        for k in range(min_n, max_n + 1):
+            rows.append(numpy.arange(len(base)))
+            starts.append(first[k - min_n, base] + start)
+            counts.append(numpy.maximum(end - start - k + 1, 0))
+        rows = numpy.concatenate(rows)
+        starts = numpy.concatenate(starts)
+        counts = numpy.concatenate(counts)
+        offsets = numpy.cumsum(counts) - counts
+        positions = numpy.repeat(starts - offsets, counts) + numpy.arange(counts.sum())
+        cols = ids[positions]
+        rows = numpy.repeat(rows, counts)
+        selected = cols >= 0
+        data = numpy.ones(selected.sum(), dtype=self.dtype)
+        X = coo_matrix((data, (rows[selected], cols[selected])),
+                       shape=(len(base), len(terms)), dtype=self.dtype).tocsr()
+        X.sum_duplicates()
+        X.sort_indices()
+        if self.binary:
+            X.data.fill(1)
+        return X
+
+
+def _phrase_spans(texts, tokenize, stop_words):
+    """
+    Private function that locates every text of `texts` as a span of tokens
+    of its base: the longest text with the same sentence id, or the text
+    itself if it's not a span of it.
+    Return value is a `(bases, (base, start, end))` tuple where `bases` is a
+    list with the tokens of each base (without stop words) and the i-th text
+    is the span `[start[i], end[i])` of the tokens of `bases[base[i]]`.
+    """
+    longest = {}
+    for text, sentenceid in zip(texts, texts.sentenceids):
+        if len(text) > len(longest.get(sentenceid, "")):
+            longest[sentenceid] = text
+    bases = []
+    index = {}
+    base = numpy.zeros(len(texts), dtype=numpy.int64)
+    start = numpy.zeros(len(texts), dtype=numpy.int64)
+    end = numpy.zeros(len(texts), dtype=numpy.int64)
+    for i, (text, sentenceid) in enumerate(zip(texts, texts.sentenceids)):
+        tokens = tokenize(text)
+        b, span = _find_span(longest.get(sentenceid, ""), tokens, tokenize, stop_words,
+                             bases, index)
+        if span is None:
+            b, span = _find_span(text, tokens, tokenize, stop_words, bases, index)
+        base[i] = b
+        start[i], end[i] = span
+    return [x[0] for x in bases], (base, start, end)
+
+
+def _find_span(base_text, tokens, tokenize, stop_words, bases, index):
+    """
+    Private function that returns the index of `base_text` in `bases` (adding
+    it if needed) and the span of its tokens without stop words that covers
+    `tokens`, or `None` if they are not consecutive tokens of it.
+    """
+    if base_text not in index:
+        base_tokens = tokenize(base_text)
+        joined = "\x00".join(base_tokens)
+        positions = {}
+        kept = [0]
+        i = 0
+        for n, token in enumerate(base_tokens):
+            positions[i] = n
+            i += len(token) + 1
+            kept.append(kept[-1] + (0 if stop_words and token in stop_words else 1))
+        filtered = [x for x in base_tokens if not (stop_words and x in stop_words)]
+        index[base_text] = len(bases)
+        bases.append((filtered, joined, positions, kept))
+    b = index[base_text]
+    _, joined, positions, kept = bases[b]
+    if not tokens:
+        return b, (0, 0)
+    needle = "\x00".join(tokens)
+    i = joined.find(needle)
+    while i != -1:
+        j = i + len(needle)
+        if i in positions and (j == len(joined) or joined[j] == "\x00"):
+            first = positions[i]
+            return b, (kept[first], kept[first + len(tokens)])
+        i = joined.find(needle, i + 1)
+    return b, None
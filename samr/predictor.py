@@ -3,29 +3,82 @@ SAMR main module, PhraseSentimentPredictor is the class that does the
 prediction and therefore one of the main entry points to the library.
 """
 from collections import defaultdict
+import hashlib
+import importlib
+import warnings
+
+import numpy
+
+import sklearn
 
-from sklearn.linear_model import SGDClassifier
-from sklearn.neighbors import KNeighborsClassifier
-from sklearn.svm import SVC
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.feature_extraction.text import CountVectorizer
 from sklearn.pipeline import make_pipeline, make_union
-from sklearn.metrics import accuracy_score
 
 from samr.transformations import (ExtractText, ReplaceText, MapToSynsets,
-                                  Densifier, ClassifierOvOAsFeatures)
-from samr.inquirer_lex_transform import InquirerLexTransform
+                                  Densifier, ClassifierOvOAsFeatures,
+                                  StatelessTransform, pad_linear_model,
+                                  writable_linear_model)
+from samr.inquirer_lex_transform import InquirerLexTransform, InquirerLexFeatures
+from samr.feature_cache import CachedStages
+from samr.corpus import iter_chunks
+from samr.data import PhraseBatch
+from samr.storage import save_object, load_object, StringArray, Vocabulary
+from samr.parallel import effective_n_jobs
+
 
+MODEL_KIND = "samr-phrase-sentiment-predictor"
+MODEL_VERSION = 4
 
+
+# Main classifiers by name, as "module:attribute" strings that are imported
+# only when used (see `register_classifier`).
 _valid_classifiers = {
-    "sgd": SGDClassifier,
-    "knn": KNeighborsClassifier,
-    "svc": SVC,
-    "randomforest": RandomForestClassifier,
+    "sgd": "sklearn.linear_model:SGDClassifier",
+    "knn": "sklearn.neighbors:KNeighborsClassifier",
+    "svc": "sklearn.svm:SVC",
+    "randomforest": "sklearn.ensemble:RandomForestClassifier",
+    "ann": "samr.neighbors:NeighborsClassifier",
 }
 
 
+def register_classifier(name, classifier):
+    """
+    Makes `classifier` available as a main classifier of
+    `PhraseSentimentPredictor` under `name`.
+    `classifier` is expected to be a class (or any callable that takes the
+    `classifier_args` as keyword arguments and returns an estimator) or a
+    "module:attribute" string naming one, which is imported the first time
+    it's used.
+    """
+    _valid_classifiers[name] = classifier
+
+
+def get_classifier(name):
+    """
+    Returns the main classifier registered under `name`, importing it if
+    necessary. Raises `ValueError` if there is none.
+    """
+    if name not in _valid_classifiers:
+        raise ValueError("Unknown classifier {!r}, valid values are: {}".format(
+                         name, ", ".join(sorted(_valid_classifiers))))
+    classifier = _valid_classifiers[name]
+    if isinstance(classifier, str):
+        module, attribute = classifier.split(":")
+        classifier = getattr(importlib.import_module(module), attribute)
+    return classifier
+
+
+def _accuracy_score(gold, predicted):
+    from sklearn.metrics import accuracy_score
+    return accuracy_score(gold, predicted)
+
+
+# The sentiment labels of the SAMR corpus
+SENTIMENTS = ["0", "1", "2", "3", "4"]
+
+
 def target(phrases):
+    if isinstance(phrases, PhraseBatch):
+        return phrases.labels()
     return [datapoint.sentiment for datapoint in phrases]
 
 
@@ -55,11 +108,15 @@ class PhraseSentimentPredictor:
     def __init__(self, classifier="sgd", classifier_args=None, lowercase=True,
                  text_replacements=None, map_to_synsets=False, binary=False,
                  min_df=0, ngram=1, stopwords=None, limit_train=None,
-                 map_to_lex=False, duplicates=False):
+                 map_to_lex=False, duplicates=False,
+                 sentence_tokenization=False, direct_lex=False,
+                 hash_features=None, verify_duplicates=False, phrase_tree=False):
         """
-        Parameter description:
+        Parameter description (the parameters are also kept in `self.config`):
             - `classifier`: The type of classifier used as main classifier,
-              valid values are "sgd", "knn", "svc", "randomforest".
+              valid values are "sgd", "knn", "svc", "randomforest", "ann" (a
+              k-nearest-neighbours with a faster, pluggable search index, see
+              `samr.neighbors`) and the names given to `register_classifier`.
             - `classifier_args`: A dict to be passed as arguments to the main
               classifier.
             - `lowercase`: wheter or not all words are lowercased at the start of
@@ -86,43 +143,119 @@ class PhraseSentimentPredictor:
               features.
             - `duplicates`: Whether or not to check for identical phrases between
               train and prediction.
+            - `sentence_tokenization`: Whether or not to tokenize each sentence
+              once and take the tokens of every phrase from its sentence
+              instead of tokenizing every phrase on its own.
+            - `direct_lex`: Whether or not to count the Harvard Inquirer lexicon
+              features directly into a matrix instead of going through a
+              bag-of-words of the lexicon categories. `min_df` and `ngram` do
+              not apply to these features in that case.
+            - `hash_features`: If given, the bag-of-words representations are
+              stateless hashes of the words (and ngrams) into this many
+              columns instead of vocabularies learnt during training, so that
+              memory doesn't grow with the vocabulary. `min_df` does not apply
+              in that case, and the lexicon features are counted directly (as
+              with `direct_lex`).
+            - `verify_duplicates`: Whether or not to also keep the training
+              phrases to rule out (very unlikely) collisions of their hashes
+              when checking for duplicates.
+            - `phrase_tree`: Whether or not to compute the bag-of-words of
+              the text features once per sentence and derive the ones of its
+              phrases from their spans (see `samr.phrase_tree`). The result
+              is the same, but faster when phrases are spans of sentences (as
+              in the SAMR corpus). Ignored if `hash_features` is given.
         """
+        self.config = dict(locals())
+        del self.config["self"]
         self.limit_train = limit_train
         self.duplicates = duplicates
 
         # Build pre-processing common to every extraction
-        pipeline = [ExtractText(lowercase)]
+        pipeline = [ExtractText(lowercase, sentence_tokenization)]
         if text_replacements:
             pipeline.append(ReplaceText(text_replacements))
 
         # Build feature extraction schemes
         ext = [build_text_extraction(binary=binary, min_df=min_df,
-                                     ngram=ngram, stopwords=stopwords)]
+                                     ngram=ngram, stopwords=stopwords,
+                                     hash_features=hash_features,
+                                     phrase_tree=phrase_tree)]
         if map_to_synsets:
             ext.append(build_synset_extraction(binary=binary, min_df=min_df,
-                                               ngram=ngram))
+                                               ngram=ngram,
+                                               hash_features=hash_features))
         if map_to_lex:
+            direct = direct_lex or hash_features is not None
             ext.append(build_lex_extraction(binary=binary, min_df=min_df,
-                                            ngram=ngram))
+                                            ngram=ngram, direct=direct))
         ext = make_union(*ext)
         pipeline.append(ext)
 
         # Build classifier and put everything togheter
         if classifier_args is None:
             classifier_args = {}
-        classifier = _valid_classifiers[classifier](**classifier_args)
+        classifier = get_classifier(classifier)(**classifier_args)
+        if getattr(classifier, "n_jobs", None) is not None:
+            # Sized like the rest of samr (see `samr.parallel`)
+            classifier.n_jobs = effective_n_jobs(classifier.n_jobs)
         self.pipeline = make_pipeline(*pipeline)
         self.classifier = classifier
 
+    def set_feature_cache(self, cache):
+        """
+        Makes the stateless steps of the pipeline (the text pre-processing and
+        the stateless start of each feature extraction) take their outputs
+        from `cache`, a `samr.feature_cache.FeatureCache`, whenever the input
+        phrases come from its corpus. Outputs for the whole corpus are
+        computed here if they are not in the cache yet.
+        """
+        steps = self.pipeline.steps
+        prefix = CachedStages([step for _, step in steps[:-1]], cache)
+        for _, branch in steps[-1][1].transformer_list:
+            n = 0
+            while n < len(branch.steps) and isinstance(branch.steps[n][1], StatelessTransform):
+                n += 1
+            if n:
+                heads = CachedStages([step for _, step in branch.steps[:n]], cache, prefix)
+                branch.steps[:n] = [("cachedstages", heads)]
+                heads.outputs()
+        steps[:-1] = [("cachedstages", prefix)]
+        prefix.outputs()
+
+    def instrument(self, callback=None):
+        """
+        Starts recording the time, rows, output size and memory growth of
+        every step of the pipeline (including each feature extraction and its
+        steps) and of the main classifier. `callback`, if given, is called
+        with every record.
+        Return value is the `samr.instrumentation.Profiler` holding the
+        records, also available as `self.profiler`.
+        If used together with `set_feature_cache` this should be called last.
+        """
+        from samr.instrumentation import Profiler
+        self.profiler = Profiler(callback)
+        steps = self.pipeline.steps
+        for i, (name, step) in enumerate(steps):
+            steps[i] = (name, self.profiler.instrument(step, name))
+        self.classifier = self.profiler.instrument(self.classifier, "classifier")
+        return self.profiler
+
+    def __getstate__(self):
+        # The profiler (and its callback) is not pickled, see `instrument`
+        state = dict(vars(self))
+        state.pop("profiler", None)
+        return state
+
     def fit(self, phrases, y=None):
         """
-        `phrases` should be a list of `Datapoint` instances.
+        `phrases` should be a list of `Datapoint` instances or a
+        `samr.data.PhraseBatch`.
         `y` should be a list of `str` instances representing the sentiments to
         be learnt.
         """
         y = target(phrases)
         if self.duplicates:
-            self.dupes = DuplicatesHandler()
+            self.dupes = DuplicatesHandler(verify=self.config["verify_duplicates"])
             self.dupes.fit(phrases, y)
         Z = self.pipeline.fit_transform(phrases, y)
         if self.limit_train:
@@ -131,28 +264,187 @@ class PhraseSentimentPredictor:
             self.classifier.fit(Z, y)
         return self
 
+    def fit_incremental(self, phrases, epochs=1, chunk_size=10000,
+                        classes=SENTIMENTS):
+        """
+        Out-of-core alternative to `fit` that trains the predictor with
+        `partial_fit` on chunks of `chunk_size` phrases, so that memory use
+        depends on `chunk_size` and not on the amount of phrases.
+        `phrases` should be a function that returns a new iterable of
+        `Datapoint` instances each time it's called (ex:
+        `lambda: iter_data_file("train.tsv")`) because the data is read
+        several times: `epochs` passes to train the pairwise classifiers of the
+        feature extractions and then `epochs` passes to train the main
+        classifier on their (final) outputs.
+        `classes` is the list of every sentiment that can appear in the data.
+        Requires `hash_features` to be set (so that bag-of-words need no
+        vocabulary) and a main classifier that supports `partial_fit` (ex:
+        "sgd"). `limit_train` is not applied. If `duplicates` is set the
+        handler still keeps every distinct training phrase in memory.
+        """
+        if self.config["hash_features"] is None:
+            raise ValueError("Incremental training requires hash_features")
+        if not hasattr(self.classifier, "partial_fit"):
+            raise ValueError("Main classifier {!r} does not support incremental "
+                             "training".format(self.config["classifier"]))
+        prefix = [step for _, step in self.pipeline.steps[:-1]]
+        branches = [branch for _, branch in self.pipeline.steps[-1][1].transformer_list]
+        if self.duplicates:
+            self.dupes = DuplicatesHandler(verify=self.config["verify_duplicates"])
+        stateful = any(not _is_stateless(step) for branch in branches
+                       for _, step in branch.steps)
+        for epoch in range(epochs if stateful else 0):
+            for chunk in iter_chunks(phrases(), chunk_size):
+                y = target(chunk)
+                if self.duplicates and epoch == 0:
+                    self.dupes.partial_fit(chunk, y)
+                X = _transform_steps(prefix, chunk)
+                for branch in branches:
+                    Z = X
+                    for _, step in branch.steps:
+                        if not _is_stateless(step):
+                            step.partial_fit(Z, y, classes=classes)
+                        Z = step.transform(Z)
+        for epoch in range(epochs):
+            for chunk in iter_chunks(phrases(), chunk_size):
+                y = target(chunk)
+                if self.duplicates and not stateful and epoch == 0:
+                    self.dupes.partial_fit(chunk, y)
+                Z = self.pipeline.transform(chunk)
+                self.classifier.partial_fit(Z, y, classes=classes)
+        return self
+
+    def update(self, phrases, epochs=1):
+        """
+        Updates the fitted predictor with the newly labelled `phrases` (a list
+        of `Datapoint` instances or a `samr.data.PhraseBatch`) instead of
+        training it again from scratch:
+            - The vocabularies of the bag-of-words get the new words (and
+              ngrams) of `phrases` that pass `min_df` among them, as new
+              columns after the existing ones.
+            - The pairwise classifiers of the feature extractions and the main
+              classifier continue training from their current weights with
+              `epochs` passes of `partial_fit` over `phrases` (new columns
+              start with zero weights).
+            - The phrases are added to the duplicates handler.
+        Only `phrases` are used, so the result is close to (but not the same
+        as) fitting on the old and new data together, and it drifts further
+        with each update; a full `fit` now and then is advisable.
+        Requires a main classifier that supports `partial_fit` (ex: "sgd").
+        Raises `ValueError` if `phrases` have sentiments that were not seen
+        by `fit`. `limit_train` is not applied. Works on loaded predictors
+        too (their memory mapped weights are copied).
+        """
+        classifier = getattr(self.classifier, "estimator", self.classifier)
+        if not hasattr(classifier, "partial_fit"):
+            raise ValueError("Main classifier {!r} does not support incremental "
+                             "training".format(self.config["classifier"]))
+        y = target(phrases)
+        unknown = set(y) - set(getattr(classifier, "classes_", y))
+        if unknown:
+            raise ValueError("Sentiments {} were not seen when fitting, update can't "
+                             "learn new ones".format(", ".join(sorted(unknown))))
+        if self.duplicates:
+            self.dupes.partial_fit(phrases, y)
+        X = _transform_steps([step for _, step in self.pipeline.steps[:-1]], phrases)
+        branches = [branch for _, branch in self.pipeline.steps[-1][1].transformer_list]
+        old_widths = [branch.transform(X[:1]).shape[1] for branch in branches]
+        for epoch in range(epochs):
+            for branch in branches:
+                Z = X
+                for _, step in branch.steps:
+                    estimator = getattr(step, "estimator", step)
+                    if _has_vocabulary(estimator):
+                        if epoch == 0:
+                            _extend_vocabulary(estimator, Z)
+                    elif not _is_stateless(step):
+                        step.partial_fit(Z, y)
+                    Z = step.transform(Z)
+        widths = [branch.transform(X[:1]).shape[1] for branch in branches]
+        # Zero weights for the new columns at the end of each feature extraction
+        ends = numpy.cumsum(old_widths)
+        positions = [end for end, old, new in zip(ends, old_widths, widths)
+                     for _ in range(new - old)]
+        writable_linear_model(classifier)
+        if positions:
+            pad_linear_model(classifier, positions)
+        Z = self.pipeline.steps[-1][1].transform(X)
+        for _ in range(epochs):
+            self.classifier.partial_fit(Z, y)
+        return self
+
     def predict(self, phrases):
         """
-        `phrases` should be a list of `Datapoint` instances.
+        `phrases` should be a list of `Datapoint` instances or a
+        `samr.data.PhraseBatch`.
         Return value is a list of `str` instances with the predicted sentiments.
         """
         Z = self.pipeline.transform(phrases)
-        labels = self.classifier.predict(Z)
+        labels = numpy.asarray(self.classifier.predict(Z))
         if self.duplicates:
-            for i, phrase in enumerate(phrases):
-                label = self.dupes.get(phrase)
-                if label is not None:
-                    labels[i] = label
+            rows, known = self.dupes.lookup(phrases)
+            labels[rows] = known
         return labels
 
+    def predict_iter(self, phrases, chunk_size=10000):
+        """
+        `phrases` should be an iterable of `Datapoint` instances or a
+        `samr.data.PhraseBatch` (which is sliced into chunks).
+        Returns an iterator over the predicted sentiments (`str` instances).
+        Phrases are predicted `chunk_size` at a time, so memory use depends on
+        `chunk_size` and not on the amount of phrases.
+        """
+        if isinstance(phrases, PhraseBatch):
+            chunks = (phrases[i:i + chunk_size] for i in range(0, len(phrases), chunk_size))
+        else:
+            chunks = iter_chunks(phrases, chunk_size)
+        for chunk in chunks:
+            for label in self.predict(chunk):
+                yield label
+
     def score(self, phrases):
         """
-        `phrases` should be a list of `Datapoint` instances.
+        `phrases` should be a list of `Datapoint` instances or a
+        `samr.data.PhraseBatch`.
         Return value is a `float` with the classification accuracy of the
         input.
         """
         pred = self.predict(phrases)
-        return accuracy_score(target(phrases), pred)
+        return _accuracy_score(target(phrases), pred)
+
+    def save(self, path):
+        """
+        Saves the fitted predictor into the folder `path`, together with a
+        header containing its configuration. Big arrays (ex: classifier
+        weights or trees) are saved in separate files that `load` memory maps.
+        Vocabularies are saved as `samr.storage.Vocabulary` arrays too.
+        """
+        header = {"config": self.config, "sklearn": sklearn.__version__}
+        vectorizers = [x for x in _iter_steps(self.pipeline)
+                       if isinstance(getattr(x, "vocabulary_", None), dict)]
+        originals = [dict(vars(x)) for x in vectorizers]
+        try:
+            for vectorizer in vectorizers:
+                vectorizer.vocabulary_ = Vocabulary.from_dict(vectorizer.vocabulary_)
+                # Only kept for introspection, and it holds every pruned term
+                vars(vectorizer).pop("stop_words_", None)
+            save_object(path, MODEL_KIND, MODEL_VERSION, self, header=header)
+        finally:
+            for vectorizer, state in zip(vectorizers, originals):
+                vars(vectorizer).clear()
+                vars(vectorizer).update(state)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Returns the fitted predictor saved with `save` in the folder `path`.
+        If `mmap` is true its big arrays are memory mapped read-only.
+        """
+        header, predictor = load_object(path, MODEL_KIND, MODEL_VERSION, mmap=mmap)
+        if header["sklearn"] != sklearn.__version__:
+            warnings.warn("Model at {} was saved with scikit-learn {} but {} is "
+                          "installed".format(path, header["sklearn"], sklearn.__version__))
+        return predictor
 
     def error_matrix(self, phrases):
         predictions = self.predict(phrases)
@@ -163,45 +455,223 @@ class PhraseSentimentPredictor:
         return matrix
 
 
-def build_text_extraction(binary, min_df, ngram, stopwords):
-    return make_pipeline(CountVectorizer(binary=binary,
-                                         tokenizer=lambda x: x.split(),
-                                         min_df=min_df,
-                                         ngram_range=(1, ngram),
-                                         stop_words=stopwords),
+def split_words(text):
+    """
+    Tokenizer used by the bag-of-words representations (defined at module
+    level so that fitted predictors can be pickled).
+    """
+    return text.split()
+
+
+def _is_stateless(step):
+    """
+    Private function that tells if a pipeline step needs no training (looking
+    through instrumentation wrappers).
+    """
+    from sklearn.feature_extraction.text import HashingVectorizer
+    step = getattr(step, "estimator", step)
+    return isinstance(step, (StatelessTransform, HashingVectorizer))
+
+
+def _transform_steps(steps, X):
+    for step in steps:
+        X = step.transform(X)
+    return X
+
+
+def _iter_steps(estimator):
+    """
+    Private function that yields `estimator` and, recursively, the steps of
+    the pipelines and feature unions in it (looking through instrumentation
+    wrappers).
+    """
+    estimator = getattr(estimator, "estimator", estimator)
+    yield estimator
+    for _, step in getattr(estimator, "steps", []) + getattr(estimator, "transformer_list", []):
+        yield from _iter_steps(step)
+
+
+def _has_vocabulary(step):
+    from sklearn.feature_extraction.text import CountVectorizer
+    return isinstance(step, CountVectorizer)
+
+
+def _extend_vocabulary(vectorizer, raw_documents):
+    """
+    Private function that adds to the vocabulary of the fitted `vectorizer`
+    (a `CountVectorizer`) the terms of `raw_documents` that it would keep
+    when fitted on them alone. New terms get the columns after the existing
+    ones, in alphabetical order, so existing columns are not reindexed.
+    """
+    from sklearn.base import clone
+    try:
+        terms = clone(vectorizer).fit(raw_documents).vocabulary_
+    except ValueError:  # No terms left (ex: only stop words)
+        return
+    if not isinstance(vectorizer.vocabulary_, dict):  # A loaded `Vocabulary`
+        vectorizer.vocabulary_ = dict(vectorizer.vocabulary_.items())
+    vocabulary = vectorizer.vocabulary_
+    for term in sorted(terms):
+        if term not in vocabulary:
+            vocabulary[term] = len(vocabulary)
+
+
+def build_bag_of_words(binary, min_df, ngram, stopwords=None, hash_features=None,
+                       phrase_tree=False):
+    from sklearn.feature_extraction.text import CountVectorizer, HashingVectorizer
+    if hash_features is None:
+        vectorizer = CountVectorizer
+        if phrase_tree:
+            from samr.phrase_tree import PhraseTreeVectorizer as vectorizer
+        return vectorizer(binary=binary, tokenizer=split_words,
+                          min_df=min_df, ngram_range=(1, ngram),
+                          stop_words=stopwords)
+    # Hashed counts must not change sign, the option to disable that was
+    # renamed in scikit-learn 0.19
+    if "non_negative" in HashingVectorizer().get_params():
+        sign = {"non_negative": True}
+    else:
+        sign = {"alternate_sign": False}
+    return HashingVectorizer(binary=binary, tokenizer=split_words,
+                             ngram_range=(1, ngram), stop_words=stopwords,
+                             n_features=int(hash_features), norm=None, **sign)
+
+
+def build_text_extraction(binary, min_df, ngram, stopwords, hash_features=None,
+                          phrase_tree=False):
+    return make_pipeline(build_bag_of_words(binary, min_df, ngram, stopwords,
+                                            hash_features, phrase_tree),
                          ClassifierOvOAsFeatures())
 
 
-def build_synset_extraction(binary, min_df, ngram):
+def build_synset_extraction(binary, min_df, ngram, hash_features=None):
     return make_pipeline(MapToSynsets(),
-                         CountVectorizer(binary=binary,
-                                         tokenizer=lambda x: x.split(),
-                                         min_df=min_df,
-                                         ngram_range=(1, ngram)),
+                         build_bag_of_words(binary, min_df, ngram,
+                                            hash_features=hash_features),
                          ClassifierOvOAsFeatures())
 
 
-def build_lex_extraction(binary, min_df, ngram):
+def build_lex_extraction(binary, min_df, ngram, direct=False):
+    if direct:
+        return make_pipeline(InquirerLexFeatures(binary=binary, dense=True))
     return make_pipeline(InquirerLexTransform(),
-                         CountVectorizer(binary=binary,
-                                         tokenizer=lambda x: x.split(),
-                                         min_df=min_df,
-                                         ngram_range=(1, ngram)),
+                         build_bag_of_words(binary, min_df, ngram),
                          Densifier())
 
 
 class DuplicatesHandler:
+    """
+    Remembers the label of every training phrase (lowercased and with
+    normalized whitespace) so that exact duplicates can be looked up.
+    Phrases are stored as a sorted array of their 64-bit hashes plus a
+    parallel array of label codes, which is compact and can be searched for a
+    whole batch at once. If `verify` is true the phrases are kept too (as a
+    `samr.storage.StringArray`, in the order they were first seen, plus an
+    array with the position of the phrase of each hash) to rule out hash
+    collisions on lookup.
+    When a phrase appears more than once the last label seen is kept.
+    """
+    def __init__(self, verify=False):
+        self.verify = verify
+
     def fit(self, phrases, target):
-        self.dupes = {}
-        for phrase, label in zip(phrases, target):
-            self.dupes[self._key(phrase)] = label
+        self.hashes = numpy.zeros(0, dtype=numpy.uint64)
+        self.codes = numpy.zeros(0, dtype=numpy.int8)
+        self.classes = numpy.zeros(0, dtype=str)
+        self.keys = StringArray.from_strings([]) if self.verify else None
+        self.positions = numpy.zeros(0, dtype=numpy.int64) if self.verify else None
+        return self.partial_fit(phrases, target)
+
+    def partial_fit(self, phrases, target):
+        """
+        Adds `phrases` (with labels `target`) to the ones already seen. The
+        new hashes are merged into the sorted ones and the new phrases
+        appended to the kept ones, so the cost of a call doesn't grow with the
+        amount of previous calls beyond copying the arrays.
+        """
+        if not hasattr(self, "hashes"):
+            return self.fit(phrases, target)
+        keys = self._keys(phrases)
+        target = numpy.array(target)
+        if not keys:
+            return self
+        classes = numpy.union1d(self.classes, target)
+        if len(classes) != len(self.classes):
+            self.codes = numpy.searchsorted(classes, self.classes)[self.codes].astype(numpy.int8)
+            self.classes = classes
+        hashes = _hash_strings(keys)
+        # Stable sort and keep the last of each run of equal hashes, so that
+        # newer labels replace older ones
+        order = numpy.argsort(hashes, kind="mergesort")
+        hashes = hashes[order]
+        last = numpy.ones(len(hashes), dtype=bool)
+        last[:-1] = hashes[1:] != hashes[:-1]
+        order = order[last]
+        hashes = hashes[last]
+        codes = numpy.searchsorted(classes, target[order]).astype(numpy.int8)
+        where = numpy.searchsorted(self.hashes, hashes)
+        found = where < len(self.hashes)
+        found[found] = self.hashes[where[found]] == hashes[found]
+        new = ~found
+        # Positions of the phrases already seen once the new ones are
+        # inserted (the arrays may be read-only memory maps, insert copies)
+        seen = where[found] + numpy.searchsorted(where[new], where[found], side="right")
+        self.hashes = numpy.insert(self.hashes, where[new], hashes[new])
+        self.codes = numpy.insert(self.codes, where[new], codes[new])
+        self.codes[seen] = codes[found]
+        if self.verify:
+            start = len(self.keys)
+            self.positions = numpy.insert(self.positions, where[new],
+                                          start + numpy.arange(new.sum()))
+            added = [keys[i] for i in order[new]]
+            # A phrase that collides with a previous one replaces it
+            for i, j in zip(order[found], seen):
+                if self.keys[self.positions[j]] != keys[i]:
+                    self.positions[j] = start + len(added)
+                    added.append(keys[i])
+            self.keys = self.keys.extend(added)
+        return self
+
+    def lookup(self, phrases):
+        """
+        Returns a `(rows, labels)` tuple where `rows` is an array with the
+        positions of the elements of `phrases` that were seen during training
+        and `labels` an array with their labels.
+        """
+        keys = self._keys(phrases)
+        if not keys or not len(self.hashes):
+            return numpy.zeros(0, dtype=int), self.classes[:0]
+        hashes = _hash_strings(keys)
+        positions = numpy.searchsorted(self.hashes, hashes)
+        positions[positions == len(self.hashes)] = 0
+        rows = numpy.flatnonzero(self.hashes[positions] == hashes)
+        if self.verify:
+            rows = numpy.array([i for i in rows
+                                if self.keys[self.positions[positions[i]]] == keys[i]],
+                               dtype=int)
+        return rows, self.classes[self.codes[positions[rows]]]
 
     def get(self, phrase):
-        key = self._key(phrase)
-        return self.dupes.get(key)
+        rows, labels = self.lookup([phrase])
+        if len(rows):
+            return labels[0]
+        return None
 
-    def _key(self, x):
-        return " ".join(x.phrase.lower().split())
+    def _keys(self, phrases):
+        if isinstance(phrases, PhraseBatch):
+            texts = phrases.phrase
+        else:
+            texts = (x.phrase for x in phrases)
+        return [" ".join(x.lower().split()) for x in texts]
+
+
+def _hash_strings(strings):
+    """
+    Private function that returns an uint64 array with the hashes of
+    `strings` (the first 8 bytes of their md5 digests).
+    """
+    digests = b"".join(hashlib.md5(x.encode("utf-8")).digest()[:8] for x in strings)
+    return numpy.frombuffer(digests, dtype="<u8").astype(numpy.uint64)
 
 
 class _Baseline:
@@ -214,4 +684,4 @@ class _Baseline:
     def score(self, X):
         gold = target(X)
         pred = self.predict(X)
-        return accuracy_score(gold, pred)
+        return _accuracy_score(gold, pred)
@@ -0,0 +1,196 @@
+"""
+Model selection over many predictor configurations with successive halving.
+
+Every configuration is evaluated on the same cross validation folds as
+`samr.evaluation.cross_validation`, a few folds at a time: after each round
+only the best `1 / eta` of the configurations (by mean score over the folds
+done so far) are evaluated on more folds, until the survivors are evaluated
+on all of them. Fold scores are appended to a ledger (a json lines file) as
+they are computed, so an interrupted search run again with the same ledger
+only evaluates the missing folds.
+"""
+import glob
+import hashlib
+import itertools
+import json
+import math
+import os
+from functools import partial
+
+from samr.corpus import split_indices
+from samr.evaluation import score_folds
+from samr.predictor import PhraseSentimentPredictor
+
+
+def load_configs(paths):
+    """
+    Returns a list of `(name, config)` tuples with the predictor
+    configurations (dicts of `PhraseSentimentPredictor` arguments) found in
+    `paths`, a list of:
+        - json files with one configuration (ex: data/model2.json), named
+          after the file.
+        - json files with a grid of configurations, as a dict with a "base"
+          configuration and a "grid" dict mapping arguments to lists of
+          values. Every combination of values is added to the base, and
+          named after the file and the values (ex: "grid[binary=true,ngram=2]").
+        - folders, meaning all their json files.
+    Raises `ValueError` if two configurations get the same name.
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, "*.json"))))
+        else:
+            files.append(path)
+    configs = []
+    for filename in files:
+        name = os.path.splitext(os.path.basename(filename))[0]
+        with open(filename) as f:
+            config = json.load(f)
+        if "grid" in config:
+            configs.extend(expand_grid(name, config.get("base", {}), config["grid"]))
+        else:
+            configs.append((name, config))
+    names = [name for name, _ in configs]
+    for name in names:
+        if names.count(name) > 1:
+            raise ValueError("Duplicated configuration name {!r}".format(name))
+    return configs
+
+
+def expand_grid(name, base, grid):
+    """
+    Returns a list of `(name, config)` tuples with `base` updated with every
+    combination of the values of `grid` (see `load_configs`).
+    """
+    keys = sorted(grid)
+    configs = []
+    for values in itertools.product(*[grid[key] for key in keys]):
+        config = dict(base)
+        config.update(zip(keys, values))
+        label = ",".join("{}={}".format(key, json.dumps(value, sort_keys=True))
+                         for key, value in zip(keys, values))
+        configs.append(("{}[{}]".format(name, label), config))
+    return configs
+
+
+def config_key(config):
+    """
+    Returns a string that identifies `config` in the ledger, so that renamed
+    configurations are still found there and changed ones are not.
+    """
+    text = json.dumps(config, sort_keys=True)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def read_ledger(path):
+    """
+    Returns the list of records (dicts) written to the ledger at `path`, which
+    may not exist. A partially written last record is ignored.
+    """
+    if not os.path.isfile(path):
+        return []
+    records = []
+    with open(path) as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                pass
+    return records
+
+
+def append_ledger(path, record):
+    """
+    Appends `record` (a dict) to the ledger at `path`, creating it if needed.
+    """
+    prefix = ""
+    if os.path.isfile(path) and os.path.getsize(path):
+        with open(path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                prefix = "\n"  # The last record was cut short
+    with open(path, "a") as f:
+        f.write(prefix + json.dumps(record, sort_keys=True) + "\n")
+
+
+def successive_halving(configs, seed="robot rock", K=10, min_folds=2, eta=2,
+                       ledger=None, callback=None, n_jobs=1,
+                       feature_cache=None):
+    """
+    Searches the best of `configs` (a list of `(name, config)` tuples, see
+    `load_configs`) with successive halving over `K` cross validation folds
+    made with `seed` (the same ones as `cross_validation(factory, seed, K)`).
+    The first round evaluates every configuration on `min_folds` folds, and
+    each later round keeps the best `1 / eta` of them (at least one) and
+    multiplies the amount of folds by `eta`, up to `K`. A single survivor
+    goes straight to `K` folds. Within a round folds are interleaved (the
+    first fold of every configuration, then the second...) so all of them
+    progress at the same pace.
+    `ledger`, if given, is the path of a json lines file where every fold
+    score is appended, and from where the scores of previous runs with the
+    same seed and `K` are taken instead of being computed again.
+    `callback`, if given, is called with `(name, fold, score)` for every new
+    fold score. `n_jobs` and `feature_cache` are as in
+    `samr.evaluation.cross_validation`.
+    Return value is a list of dicts with the `name`, `config`, amount of
+    `folds` evaluated and mean `score` of each configuration, the best
+    first (configurations that got further come first).
+    """
+    if eta < 2:
+        raise ValueError("eta must be at least 2")
+    if not configs:
+        raise ValueError("No configurations to search")
+    seed = str(seed)
+    factories = {}
+    for name, config in configs:
+        factories[name] = partial(PhraseSentimentPredictor, **config)
+        factories[name]()  # Fail early on invalid configurations
+    keys = {name: config_key(config) for name, config in configs}
+    scores = {name: {} for name, _ in configs}
+    by_key = {}
+    for name, _ in configs:
+        by_key.setdefault(keys[name], []).append(name)
+    for record in read_ledger(ledger) if ledger else []:
+        if record.get("seed") == seed and record.get("K") == K:
+            for name in by_key.get(record.get("key"), []):
+                scores[name][record["fold"]] = record["score"]
+    splits = {}
+    alive = [name for name, _ in configs]
+    reached = {}
+    folds = min(max(1, min_folds), K)
+    while True:
+        reached.update((name, folds) for name in alive)
+        tasks = [(name, k) for k in range(folds) for name in alive
+                 if k not in scores[name]]
+        for k in set(k for _, k in tasks) - set(splits):
+            splits[k] = split_indices(seed + str(k))
+        results = score_folds([(factories[name],) + splits[k] for name, k in tasks],
+                              n_jobs=n_jobs, feature_cache=feature_cache)
+        for i, score in results:
+            name, k = tasks[i]
+            scores[name][k] = score
+            if ledger:
+                append_ledger(ledger, {"name": name, "key": keys[name], "seed": seed,
+                                       "K": K, "fold": k, "score": score})
+            if callback:
+                callback(name, k, score)
+        if folds == K:
+            break
+        alive.sort(key=lambda name: -_mean(scores[name], folds))
+        alive = alive[:max(1, int(math.ceil(len(alive) / eta)))]
+        folds = K if len(alive) == 1 else min(K, folds * eta)
+    results = []
+    for name, config in configs:
+        results.append({"name": name, "config": config, "folds": reached[name],
+                        "score": _mean(scores[name], reached[name])})
+    results.sort(key=lambda x: (-x["folds"], -x["score"]))
+    return results
+
+
+def _mean(scores, folds):
+    """
+    Private function that returns the mean of the scores of the first
+    `folds` folds, so that configurations are compared on the same folds.
+    """
+    return sum(scores[k] for k in range(folds)) / folds
@@ -0,0 +1,201 @@
+"""
+A long-lived prediction service for fitted `PhraseSentimentPredictor`s.
+
+The model is loaded once and served over HTTP on a local address:
+    - `POST /predict` with a json body `{"phrases": ["...", ...]}` answers
+      `{"sentiments": ["...", ...]}`.
+    - `GET /stats` answers throughput and latency counters.
+
+Concurrent requests are merged by a `MicroBatcher` into a single call to
+`predict`, because the pipeline is much cheaper per phrase on big batches.
+"""
+import json
+import queue
+import threading
+import time
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+
+from samr.data import Datapoint
+
+
+class _Request:
+    def __init__(self, phrases):
+        self.phrases = phrases
+        self.created = time.time()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class MicroBatcher:
+    """
+    Merges the phrases of concurrent `submit` calls into batches that are
+    predicted together in a background thread.
+    A batch is predicted when it reaches `max_batch` phrases or when its
+    oldest request has waited `max_latency` seconds, whatever comes first.
+    """
+    def __init__(self, predict, max_batch=1024, max_latency=0.01):
+        """
+        `predict` is expected to be a function that takes a list of `Datapoint`
+        instances and returns a list with their sentiments.
+        """
+        self.predict = predict
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._counters = dict(requests=0, phrases=0, batches=0, errors=0,
+                              predict_seconds=0.0, latency_seconds=0.0,
+                              max_latency_seconds=0.0)
+        self._started = time.time()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def submit(self, phrases):
+        """
+        `phrases` is expected to be a list of `str` instances.
+        Blocks until they are predicted and returns their sentiments.
+        """
+        request = _Request(phrases)
+        self._queue.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def close(self):
+        """
+        Predicts the requests already submitted and stops the background
+        thread.
+        """
+        self._queue.put(None)
+        self._thread.join()
+
+    def stats(self):
+        """
+        Returns a dict with the counters of the requests served so far.
+        """
+        with self._lock:
+            stats = dict(self._counters)
+        stats["uptime_seconds"] = time.time() - self._started
+        stats["phrases_per_second"] = stats["phrases"] / stats["uptime_seconds"]
+        if stats["requests"]:
+            stats["mean_latency_seconds"] = stats["latency_seconds"] / stats["requests"]
+        if stats["batches"]:
+            stats["mean_batch_size"] = stats["phrases"] / stats["batches"]
+        return stats
+
+    def _run(self):
+        stop = False
+        while not stop:
+            request = self._queue.get()
+            if request is None:
+                break
+            batch = [request]
+            size = len(request.phrases)
+            deadline = request.created + self.max_latency
+            while size < self.max_batch:
+                timeout = deadline - time.time()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if request is None:
+                    stop = True
+                    break
+                batch.append(request)
+                size += len(request.phrases)
+            self._predict_batch(batch)
+
+    def _predict_batch(self, batch):
+        phrases = [x for request in batch for x in request.phrases]
+        datapoints = [Datapoint(phraseid=str(i), sentenceid=str(i), phrase=x,
+                                sentiment=None) for i, x in enumerate(phrases)]
+        start = time.time()
+        error = None
+        try:
+            labels = [str(x) for x in self.predict(datapoints)]
+        except Exception as e:
+            error = e
+        end = time.time()
+        i = 0
+        for request in batch:
+            n = len(request.phrases)
+            if error is None:
+                request.result = labels[i:i + n]
+            else:
+                request.error = error
+            i += n
+        with self._lock:
+            self._counters["requests"] += len(batch)
+            self._counters["phrases"] += len(phrases)
+            self._counters["batches"] += 1
+            self._counters["errors"] += 0 if error is None else len(batch)
+            self._counters["predict_seconds"] += end - start
+            for request in batch:
+                latency = end - request.created
+                self._counters["latency_seconds"] += latency
+                self._counters["max_latency_seconds"] = max(
+                    self._counters["max_latency_seconds"], latency)
+        for request in batch:
+            request.done.set()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/stats":
+            return self._reply(404, {"error": "Not found"})
+        self._reply(200, self.server.batcher.stats())
+
+    def do_POST(self):
+        if self.path != "/predict":
+            return self._reply(404, {"error": "Not found"})
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            phrases = json.loads(self.rfile.read(length).decode("utf-8"))["phrases"]
+            if not isinstance(phrases, list):
+                raise ValueError("Phrases must be a list")
+            if not all(isinstance(x, str) for x in phrases):
+                raise ValueError("Phrases must be strings")
+        except (ValueError, KeyError, TypeError) as e:
+            return self._reply(400, {"error": "Bad request: {}".format(e)})
+        if not phrases:
+            return self._reply(200, {"sentiments": []})
+        try:
+            sentiments = self.server.batcher.submit(phrases)
+        except Exception as e:
+            return self._reply(500, {"error": str(e)})
+        self._reply(200, {"sentiments": sentiments})
+
+    def _reply(self, code, content):
+        body = json.dumps(content).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class PredictionServer(ThreadingMixIn, HTTPServer):
+    """
+    An HTTP server answering the requests described in the module docstring
+    with the predictions of `predictor` made through a `MicroBatcher`.
+    """
+    daemon_threads = True
+
+    def __init__(self, predictor, host="127.0.0.1", port=8000, max_batch=1024,
+                 max_latency=0.01):
+        self.batcher = MicroBatcher(predictor.predict, max_batch=max_batch,
+                                    max_latency=max_latency)
+        HTTPServer.__init__(self, (host, port), _Handler)
+
+    def server_close(self):
+        HTTPServer.server_close(self)
+        self.batcher.close()
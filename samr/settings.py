@@ -1,4 +1,9 @@
+import os
 from os.path import join, dirname, abspath
 
 
 DATA_PATH = abspath(join(dirname(__file__), "..", "data"))
+
+# Amount of worker processes used by samr (see `samr.parallel`), -1 means one
+# per cpu.
+N_JOBS = int(os.environ.get("SAMR_N_JOBS", -1))
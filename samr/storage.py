@@ -0,0 +1,261 @@
+"""
+Helpers to save numpy arrays into folders that can later be loaded with
+memory mapping, so that many processes can share the same read-only data.
+
+A folder written by `save_arrays` contains one `.npy` file per array and a
+`header.json` file with the kind and version of the data plus any extra
+information given by the caller.
+"""
+import json
+import os
+import pickle
+from collections.abc import Mapping
+
+import numpy
+
+
+HEADER_FILENAME = "header.json"
+
+
+def save_arrays(path, kind, version, arrays, header=None):
+    """
+    Saves the `arrays` dict (of name -> numpy array) into the `path` folder,
+    creating it if necessary.
+    `kind` and `version` identify the format of the data and are checked
+    when loading. `header` is an optional json-serializable dict with extra
+    information to store.
+    """
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    for name, array in arrays.items():
+        numpy.save(os.path.join(path, name + ".npy"), array)
+    header = dict(header or {})
+    header.update(kind=kind, version=version, arrays=sorted(arrays))
+    with open(os.path.join(path, HEADER_FILENAME), "w") as f:
+        json.dump(header, f, sort_keys=True)
+
+
+def load_header(path):
+    """
+    Returns the header dict of a folder written by `save_arrays`.
+    """
+    with open(os.path.join(path, HEADER_FILENAME)) as f:
+        return json.load(f)
+
+
+def load_arrays(path, kind, version, mmap=True):
+    """
+    Loads a folder written by `save_arrays`.
+    Raises `ValueError` if `kind` or `version` don't match the stored ones.
+    If `mmap` is true arrays are memory mapped read-only instead of read.
+    Return value is a `(header, arrays)` tuple.
+    """
+    header = load_header(path)
+    if header.get("kind") != kind or header.get("version") != version:
+        raise ValueError("Expected {} version {} at {} but found {} version {}"
+                         .format(kind, version, path, header.get("kind"),
+                                 header.get("version")))
+    mmap_mode = "r" if mmap else None
+    arrays = {}
+    for name in header["arrays"]:
+        filename = os.path.join(path, name + ".npy")
+        arrays[name] = numpy.load(filename, mmap_mode=mmap_mode)
+    return header, arrays
+
+
+# Numpy arrays at least this big are saved by `save_object` as separate files.
+MIN_ARRAY_BYTES = 2 ** 16
+
+
+def save_object(path, kind, version, obj, header=None):
+    """
+    Pickles `obj` into the `path` folder (see `save_arrays`) storing the
+    numpy arrays it contains of at least `MIN_ARRAY_BYTES` bytes as separate
+    files, so that they can be memory mapped by `load_object`.
+    """
+    arrays = {}
+    names = {}
+
+    class Pickler(pickle.Pickler):
+        def persistent_id(self, x):
+            if not isinstance(x, numpy.ndarray) or x.dtype.hasobject or \
+                    x.nbytes < MIN_ARRAY_BYTES:
+                return None
+            if id(x) not in names:
+                names[id(x)] = "array{}".format(len(names))
+                arrays[names[id(x)]] = x
+            return names[id(x)]
+
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    with open(os.path.join(path, "object.pickle"), "wb") as f:
+        Pickler(f, pickle.HIGHEST_PROTOCOL).dump(obj)
+    save_arrays(path, kind, version, arrays, header=header)
+
+
+def load_object(path, kind, version, mmap=True):
+    """
+    Loads an object saved with `save_object`, memory mapping its big arrays
+    if `mmap` is true.
+    Return value is a `(header, obj)` tuple.
+    """
+    header, arrays = load_arrays(path, kind, version, mmap=mmap)
+
+    class Unpickler(pickle.Unpickler):
+        def persistent_load(self, name):
+            return arrays[name]
+
+    with open(os.path.join(path, "object.pickle"), "rb") as f:
+        return header, Unpickler(f).load()
+
+
+class StringArray:
+    """
+    An immutable sequence of `str` stored as a single UTF-8 encoded byte array
+    plus an array of offsets, so that it can be saved with `save_arrays` and
+    memory mapped.
+    """
+    def __init__(self, blob, offsets):
+        """
+        `blob` is expected to be an uint8 array with the encoded strings and
+        `offsets` an integer array of length `len(self) + 1` such that the
+        i-th string is `blob[offsets[i]:offsets[i + 1]]`.
+        """
+        self.blob = blob
+        self.offsets = offsets
+
+    @classmethod
+    def from_strings(cls, strings):
+        encoded = [x.encode("utf-8") for x in strings]
+        blob = numpy.array(bytearray(b"".join(encoded)), dtype=numpy.uint8)
+        offsets = numpy.zeros(len(encoded) + 1, dtype=numpy.int64)
+        numpy.cumsum([len(x) for x in encoded], out=offsets[1:])
+        return cls(blob, offsets)
+
+    @classmethod
+    def from_arrays(cls, arrays, prefix):
+        return cls(arrays[prefix + "_blob"], arrays[prefix + "_offsets"])
+
+    def arrays(self, prefix):
+        """
+        Returns a dict of arrays suitable for `save_arrays` with names starting
+        with `prefix`.
+        """
+        return {prefix + "_blob": self.blob, prefix + "_offsets": self.offsets}
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start, stop, step = i.indices(len(self))
+            if step != 1:
+                return self.take(numpy.arange(start, stop, step))
+            # Contiguous slices share the blob, offsets just don't start at 0
+            return StringArray(self.blob, self.offsets[start:max(start, stop) + 1])
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("StringArray index out of range")
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return bytes(self.blob[start:end]).decode("utf-8")
+
+    def __iter__(self):
+        offsets = self.offsets.tolist()
+        if not offsets:
+            return
+        base = offsets[0]
+        blob = bytes(self.blob[base:offsets[-1]])
+        for start, end in zip(offsets, offsets[1:]):
+            yield blob[start - base:end - base].decode("utf-8")
+
+    def extend(self, strings):
+        """
+        Returns a new `StringArray` with the strings of this one followed by
+        `strings`, copying the bytes of this one but without decoding them.
+        """
+        other = StringArray.from_strings(strings)
+        start, end = self.offsets[0], self.offsets[-1]
+        blob = numpy.concatenate([numpy.asarray(self.blob)[start:end], other.blob])
+        offsets = numpy.concatenate([self.offsets - start, other.offsets[1:] + (end - start)])
+        return StringArray(blob, offsets)
+
+    def take(self, indices):
+        """
+        Returns a new `StringArray` with the strings at the positions
+        `indices` (an integer array), copying their bytes.
+        """
+        indices = numpy.asarray(indices, dtype=numpy.int64)
+        starts = self.offsets[indices]
+        lengths = self.offsets[indices + 1] - starts
+        offsets = numpy.zeros(len(indices) + 1, dtype=numpy.int64)
+        numpy.cumsum(lengths, out=offsets[1:])
+        positions = numpy.repeat(starts - offsets[:-1], lengths)
+        positions += numpy.arange(offsets[-1], dtype=numpy.int64)
+        return StringArray(numpy.asarray(self.blob)[positions], offsets)
+
+    def index(self, string):
+        """
+        Returns the position of `string` in this array or -1 if it's not
+        present. The array is expected to be sorted.
+        """
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self[mid] < string:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self) and self[lo] == string:
+            return lo
+        return -1
+
+
+class Vocabulary(Mapping):
+    """
+    A read-only mapping from terms to column indexes (like the `vocabulary_`
+    of a fitted `CountVectorizer`) stored as a sorted `StringArray` of the
+    terms plus an array with their columns, so that `save_object` stores it
+    as arrays that `load_object` memory maps. The dict used for lookups is
+    only built when the first one is made.
+    """
+    def __init__(self, terms, columns):
+        """
+        `terms` is expected to be a sorted `StringArray` and `columns` an
+        integer array with the column of each term.
+        """
+        self.terms = terms
+        self.columns = columns
+        self._dict = None
+
+    @classmethod
+    def from_dict(cls, mapping):
+        terms = sorted(mapping)
+        columns = numpy.array([mapping[x] for x in terms], dtype=numpy.int64)
+        return cls(StringArray.from_strings(terms), columns)
+
+    def __getstate__(self):
+        return {"terms": self.terms, "columns": self.columns}
+
+    def __setstate__(self, state):
+        self.__init__(state["terms"], state["columns"])
+
+    def _lookup(self):
+        if self._dict is None:
+            self._dict = dict(zip(self.terms, self.columns.tolist()))
+        return self._dict
+
+    def __getitem__(self, term):
+        return self._lookup()[term]
+
+    def get(self, term, default=None):
+        return self._lookup().get(term, default)
+
+    def __contains__(self, term):
+        return term in self._lookup()
+
+    def __iter__(self):
+        return iter(self.terms)
+
+    def __len__(self):
+        return len(self.terms)
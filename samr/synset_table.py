@@ -0,0 +1,146 @@
+"""
+A precomputed word to Wordnet synsets table for `MapToSynsets`.
+
+Looking up synsets in Wordnet is slow and needs the Wordnet corpus loaded in
+every process, so the synsets of the words in the corpus vocabulary are
+computed once by `build_synset_table` and saved in a memory-mappable folder.
+Words missing from the table are looked up in Wordnet and kept in an
+in-process LRU cache.
+"""
+import os
+from functools import lru_cache
+
+from samr.settings import DATA_PATH
+from samr.storage import (StringArray, save_arrays, load_arrays, load_header,
+                          HEADER_FILENAME)
+
+
+SYNSET_TABLE_PATH = os.path.join(DATA_PATH, "synset_table")
+SYNSET_TABLE_KIND = "samr-synset-table"
+SYNSET_TABLE_VERSION = 1
+
+# Maximum amount of words whose synsets are cached by `lookup_synsets`.
+SYNSET_CACHE_SIZE = 2 ** 16
+
+
+def word_synsets(word):
+    """
+    Returns a `str` with the space separated names of the non-noun Wordnet
+    synsets of `word`.
+    """
+    import nltk
+    names = (str(s) for s in nltk.wordnet.wordnet.synsets(word))
+    return " ".join(x for x in names if ".n." not in x)
+
+
+class SynsetTable:
+    """
+    A read-only mapping from words to the string returned by `word_synsets`.
+    """
+    def __init__(self, words, synsets):
+        """
+        `words` and `synsets` are expected to be `StringArray` instances,
+        `words` must be sorted.
+        """
+        self.words = words
+        self.synsets = synsets
+
+    @classmethod
+    def load(cls, path=SYNSET_TABLE_PATH):
+        _, arrays = load_arrays(path, SYNSET_TABLE_KIND, SYNSET_TABLE_VERSION)
+        return cls(StringArray.from_arrays(arrays, "words"),
+                   StringArray.from_arrays(arrays, "synsets"))
+
+    def save(self, path=SYNSET_TABLE_PATH):
+        arrays = self.words.arrays("words")
+        arrays.update(self.synsets.arrays("synsets"))
+        save_arrays(path, SYNSET_TABLE_KIND, SYNSET_TABLE_VERSION, arrays,
+                    header={"size": len(self.words)})
+
+    @classmethod
+    def from_dict(cls, mapping):
+        words = sorted(mapping)
+        return cls(StringArray.from_strings(words),
+                   StringArray.from_strings(mapping[x] for x in words))
+
+    def get(self, word):
+        """
+        Returns the synsets of `word` or `None` if it's not in the table.
+        """
+        i = self.words.index(word)
+        if i == -1:
+            return None
+        return self.synsets[i]
+
+    def __len__(self):
+        return len(self.words)
+
+
+def build_synset_table(words, path=SYNSET_TABLE_PATH):
+    """
+    Looks up in Wordnet the synsets of every word in the iterable `words` and
+    saves them as a `SynsetTable` in `path`.
+    Return value is the new `SynsetTable`.
+    """
+    table = SynsetTable.from_dict({x: word_synsets(x) for x in set(words)})
+    table.save(path)
+    get_synset_table.cache_clear()
+    lookup_synsets.cache_clear()
+    return table
+
+
+def synsets_stamp(path=SYNSET_TABLE_PATH):
+    """
+    Returns a dict that identifies the synsets given by `lookup_synsets`: the
+    version, size and modification time of the table at `path` (if any) and
+    the nltk version and Wordnet data used for the words missing from it.
+    """
+    stamp = {"wordnet": _wordnet_stamp()}
+    if os.path.isdir(path):
+        header = load_header(path)
+        mtime = os.stat(os.path.join(path, HEADER_FILENAME)).st_mtime
+        stamp["table"] = [header.get("version"), header.get("size"), mtime]
+    return stamp
+
+
+def _wordnet_stamp():
+    """
+    Private function that returns a list with the nltk version and the
+    location and modification time of its Wordnet data, or `None` if it's
+    not installed.
+    """
+    import nltk
+    try:
+        location = nltk.data.find("corpora/wordnet")
+    except LookupError:
+        return None
+    filename = getattr(location, "path", None)
+    if filename is None:  # A zip file
+        filename = location.zipfile.filename
+    return [nltk.__version__, filename, os.stat(filename).st_mtime]
+
+
+@lru_cache(maxsize=None)
+def get_synset_table(path=SYNSET_TABLE_PATH):
+    """
+    Returns the `SynsetTable` stored at `path` (loading it only once per
+    process) or `None` if there is no table there.
+    """
+    if not os.path.isdir(path):
+        return None
+    return SynsetTable.load(path)
+
+
+@lru_cache(maxsize=SYNSET_CACHE_SIZE)
+def lookup_synsets(word, path=SYNSET_TABLE_PATH):
+    """
+    Returns `word_synsets(word)`, taking it from the `SynsetTable` at `path`
+    when there is one containing `word` so that Wordnet is not loaded.
+    Results are kept in an in-process LRU cache.
+    """
+    table = get_synset_table(path)
+    if table is not None:
+        synsets = table.get(word)
+        if synsets is not None:
+            return synsets
+    return word_synsets(word)
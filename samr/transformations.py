@@ -5,44 +5,208 @@ scikit-learn documentation for the convension fit/transform convensions.
 
 import numpy
 import re
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
-from sklearn.linear_model import SGDClassifier
-import sklearn
-if int(sklearn.__version__.split('.')[1]) > 16:  # fix TYPO
-    from sklearn.multiclass import OneVsOneClassifier  # fix TYPO
-else:
-    from sklearn.multiclass import fit_ovo
-import nltk
+
+from samr.data import PhraseBatch, PhraseTexts
+from samr.parallel import (effective_n_jobs, can_fork, parallel_map,
+                           concatenate, share)
+from samr.synset_table import SYNSET_TABLE_PATH, lookup_synsets, synsets_stamp
+
+
+# Maximum amount of tokenized sentences kept by `ExtractText` in sentence
+# tokenization mode.
+SENTENCE_CACHE_SIZE = 2 ** 14
 
 
 class StatelessTransform:
     """
     Base class for all transformations that do not depend on training (ie, are
     stateless).
+    Subclasses implement `_transform`, which `transform` calls on the whole
+    input or, if `n_jobs` is not 1 and the input has at least
+    `min_parallel_rows` rows, on consecutive chunks of it in the worker
+    processes of `samr.parallel` (-1 means all of them), joining the results
+    in order. `n_jobs` can be set per instance or for every transformation on
+    this class.
     """
+    n_jobs = 1
+    min_parallel_rows = 10000
+    chunks_per_job = 4
+
     def fit(self, X, y=None):
         return self
 
+    def transform(self, X):
+        n_jobs = effective_n_jobs(self.n_jobs)
+        if n_jobs == 1 or not can_fork():
+            return self._transform(X)
+        if not isinstance(X, (list, PhraseBatch)):
+            X = list(X)  # Chunks are sent to the workers, so no views
+        if len(X) < max(self.min_parallel_rows, 2):
+            return self._transform(X)
+        chunks = self._chunks(X, n_jobs * self.chunks_per_job)
+        return concatenate(parallel_map(self._transform, chunks))
+
+    def _transform(self, X):
+        raise NotImplementedError
+
+    def data_stamp(self):
+        """
+        Returns something (json-like) that identifies the data files this
+        transformation reads, if any, so that its cached outputs (see
+        `samr.feature_cache`) are computed again when they change.
+        """
+        return None
+
+    def _chunks(self, X, n):
+        bounds = self._chunk_bounds(X, n)
+        return [X[start:end] for start, end in zip(bounds, bounds[1:])]
+
+    def _chunk_bounds(self, X, n):
+        """
+        Private method that returns the bounds of (at most) `n` consecutive
+        chunks of `X` of similar size.
+        """
+        return sorted(set(numpy.linspace(0, len(X), n + 1).astype(int).tolist()))
+
 
 class ExtractText(StatelessTransform):
     """
     This should be the first transformation on a samr pipeline, it extracts
     the phrase text from the richer `Datapoint` class.
     """
-    def __init__(self, lowercase=False):
+    def __init__(self, lowercase=False, sentence_tokenization=False):
+        """
+        If `sentence_tokenization` is true every sentence is tokenized only
+        once (and cached between calls) and the tokens of a phrase are taken
+        from the span it covers in its sentence. Phrases that can't be located
+        in their sentence are tokenized on their own.
+        """
         self.lowercase = lowercase
+        self.sentence_tokenization = sentence_tokenization
 
-    def transform(self, X):
+    def _transform(self, X):
         """
-        `X` is expected to be a list of `Datapoint` instances.
+        `X` is expected to be a list of `Datapoint` instances or a
+        `samr.data.PhraseBatch`.
         Return value is a list of `str` instances in which words were tokenized
         and are separated by a single space " ". Optionally words are also
-        lowercased depending on the argument given at __init__.
+        lowercased depending on the argument given at __init__. The list is a
+        `samr.data.PhraseTexts` that also holds the sentence id of each text.
         """
-        it = (" ".join(nltk.word_tokenize(datapoint.phrase)) for datapoint in X)
+        if isinstance(X, PhraseBatch):
+            phrases = list(X.phrase)
+        else:
+            X = list(X)
+            phrases = [datapoint.phrase for datapoint in X]
+        sentenceids = _sentenceids(X)
+        if self.sentence_tokenization:
+            it = (" ".join(x) for x in _tokenize_by_sentence(phrases, sentenceids))
+        else:
+            it = (" ".join(_word_tokenize(phrase)) for phrase in phrases)
         if self.lowercase:
-            return [x.lower() for x in it]
-        return list(it)
+            it = (x.lower() for x in it)
+        return PhraseTexts(it, sentenceids)
+
+    def _chunk_bounds(self, X, n):
+        bounds = StatelessTransform._chunk_bounds(self, X, n)
+        if not self.sentence_tokenization:
+            return bounds
+        # Sentences are tokenized from their longest phrase, so consecutive
+        # phrases of a sentence are kept in the same chunk
+        sentenceids = _sentenceids(X)
+        result = [0]
+        for bound in bounds[1:-1]:
+            bound = max(bound, result[-1])
+            while 0 < bound < len(X) and sentenceids[bound] == sentenceids[bound - 1]:
+                bound += 1
+            if result[-1] < bound < len(X):
+                result.append(bound)
+        result.append(len(X))
+        return result
+
+
+def _sentenceids(X):
+    if isinstance(X, PhraseBatch):
+        return X.sentenceid.tolist()
+    return [datapoint.sentenceid for datapoint in X]
+
+
+def _word_tokenize(text):
+    # nltk is slow to import, so it's only loaded when text is tokenized
+    import nltk
+    return nltk.word_tokenize(text)
+
+
+def _tokenize_by_sentence(phrases, sentenceids):
+    """
+    Private function that returns the tokens of each phrase in `phrases` by
+    taking them from the tokenization of the longest phrase with the same
+    sentence id (in the SAMR corpus that is the whole sentence).
+    """
+    sentences = {}
+    for phrase, sentenceid in zip(phrases, sentenceids):
+        phrase = phrase.strip()
+        if len(phrase) > len(sentences.get(sentenceid, "")):
+            sentences[sentenceid] = phrase
+    result = []
+    for phrase, sentenceid in zip(phrases, sentenceids):
+        sentence = sentences.get(sentenceid, "")
+        tokens = _phrase_span(phrase.strip(), sentence)
+        if tokens is None:
+            tokens = _word_tokenize(phrase)
+        result.append(tokens)
+    return result
+
+
+def _phrase_span(phrase, sentence):
+    """
+    Private function that returns the tokens of `sentence` covered by
+    `phrase`, or `None` if `phrase` does not start and end at token
+    boundaries of `sentence`.
+    """
+    if not phrase:
+        return []
+    aligned = _tokenize_sentence(sentence)
+    if aligned is None:
+        return None
+    tokens, starts, ends = aligned
+    start = sentence.find(phrase)
+    if start == -1:
+        return None
+    end = start + len(phrase)
+    i = bisect_left(starts, start)
+    j = bisect_left(ends, end)
+    if i == len(starts) or j == len(ends) or starts[i] != start or ends[j] != end:
+        return None
+    return tokens[i:j + 1]
+
+
+@lru_cache(maxsize=SENTENCE_CACHE_SIZE)
+def _tokenize_sentence(sentence):
+    """
+    Private function that tokenizes `sentence` and aligns every token to its
+    position in `sentence`. Results are cached by sentence text, so they are
+    shared by every `ExtractText` in the process (ie, between `fit`,
+    `predict` and cross-validation folds).
+    Return value is a `(tokens, starts, ends)` tuple of lists, or `None` if
+    the tokens can't be aligned (ex: nltk rewrote the quotes).
+    """
+    tokens = _word_tokenize(sentence)
+    starts = []
+    ends = []
+    i = 0
+    for token in tokens:
+        i = sentence.find(token, i)
+        if i == -1:
+            return None
+        starts.append(i)
+        i += len(token)
+        ends.append(i)
+    return tokens, starts, ends
 
 
 class ReplaceText(StatelessTransform):
@@ -53,7 +217,7 @@ class ReplaceText(StatelessTransform):
         self.rdict = dict(replacements)
         self.pat = re.compile("|".join(re.escape(origin) for origin, _ in replacements))
 
-    def transform(self, X):
+    def _transform(self, X):
         """
         `X` is expected to be a list of `str` instances.
         Return value is also a list of `str` instances with the replacements
@@ -61,7 +225,10 @@ class ReplaceText(StatelessTransform):
         """
         if not self.rdict:
             return X
-        return [self.pat.sub(self._repl_fun, x) for x in X]
+        result = [self.pat.sub(self._repl_fun, x) for x in X]
+        if isinstance(X, PhraseTexts):
+            return PhraseTexts(result, X.sentenceids)
+        return result
 
     def _repl_fun(self, match):
         return self.rdict[match.group()]
@@ -77,7 +244,15 @@ class MapToSynsets(StatelessTransform):
 
     [0] For example "bank": http://wordnetweb.princeton.edu/perl/webwn?s=bank
     """
-    def transform(self, X):
+    def __init__(self, table_path=SYNSET_TABLE_PATH):
+        """
+        `table_path` is the folder of a precomputed `SynsetTable` (see
+        `samr.synset_table`) used to avoid Wordnet lookups. Words missing from
+        it, or every word if there's no table, are looked up in Wordnet.
+        """
+        self.table_path = table_path
+
+    def _transform(self, X):
         """
         `X` is expected to be a list of `str` instances.
         It returns a list of `str` instances such that the i-th element
@@ -88,12 +263,12 @@ class MapToSynsets(StatelessTransform):
         """
         return [self._text_to_synsets(x) for x in X]
 
+    def data_stamp(self):
+        return synsets_stamp(self.table_path)
+
     def _text_to_synsets(self, text):
-        result = []
-        for word in text.split():
-            ss = nltk.wordnet.wordnet.synsets(word)
-            result.extend(str(s) for s in ss if ".n." not in str(s))
-        return " ".join(result)
+        result = (lookup_synsets(word, self.table_path) for word in text.split())
+        return " ".join(x for x in result if x)
 
 
 class Densifier(StatelessTransform):
@@ -118,22 +293,199 @@ class ClassifierOvOAsFeatures:
     It's useful to reduce the dimension bag-of-words feature-set into features
     that are richer in information.
     """
+    # Amount of processes used to fit the pairwise classifiers, -1 means all
+    # the ones of `samr.parallel`.
+    n_jobs = -1
+
+    def __init__(self, chunk_size=None, dtype=numpy.float64):
+        """
+        If `chunk_size` is given `transform` processes the input that many
+        rows at a time, writing into a preallocated output of type `dtype`.
+        """
+        self.chunk_size = chunk_size
+        self.dtype = dtype
+
     def fit(self, X, y):
         """
         `X` is expected to be an array-like or a sparse matrix.
         `y` is expected to be an array-like containing the classes to learn.
+        The pairwise classifiers are fitted in the worker processes of
+        `samr.parallel`, which get `X` through shared memory, or in threads
+        where processes can't be started (ex: in the fold workers of
+        `samr.evaluation`), since `SGDClassifier` releases the GIL while
+        fitting.
         """
-        if int(sklearn.__version__.split('.')[1]) > 16:  # fix TYPO
-            self.classifiers = OneVsOneClassifier(SGDClassifier(), n_jobs=-1).fit(X, numpy.array(y)).estimators_
+        self.classes_, codes = numpy.unique(y, return_inverse=True)
+        pairs = self._pairs()
+        n_jobs = min(effective_n_jobs(self.n_jobs), len(pairs))
+        if n_jobs <= 1:
+            self.classifiers = [_fit_pair(X, codes, i, j) for i, j in pairs]
+        elif not can_fork():
+            with ThreadPoolExecutor(n_jobs) as executor:
+                self.classifiers = list(executor.map(lambda pair: _fit_pair(X, codes, *pair),
+                                                     pairs))
         else:
-            self.classifiers = fit_ovo(SGDClassifier(), X, numpy.array(y), n_jobs=-1)[0]
+            shared = [share(X), share(codes)]
+            try:
+                self.classifiers = parallel_map(_fit_shared_pair,
+                                                [shared + [i, j] for i, j in pairs])
+            finally:
+                for x in shared:
+                    x.release()
+        self._set_n_features(X.shape[1])
         return self
 
+    def partial_fit(self, X, y, classes=None):
+        """
+        Incremental version of `fit` that updates the pairwise classifiers with
+        one more chunk of data.
+        `classes` is the list of all the classes that `y` can contain, it's
+        required on the first call.
+        `X` can have more columns than the data seen before (ex: after
+        extending a vocabulary), the weights of the extra columns start at
+        zero.
+        """
+        from sklearn.linear_model import SGDClassifier
+        y = numpy.asarray(y)
+        if not hasattr(self, "classes_"):
+            self.classes_ = numpy.unique(classes)
+            self.classifiers = [SGDClassifier() for _ in self._pairs()]
+        for (i, j), classifier in zip(self._pairs(), self.classifiers):
+            writable_linear_model(classifier)
+            n_features = getattr(classifier, "coef_", X).shape[1]
+            if n_features < X.shape[1]:
+                # New columns at the end (ex: an extended vocabulary)
+                pad_linear_model(classifier, [n_features] * (X.shape[1] - n_features))
+            rows = numpy.flatnonzero((y == self.classes_[i]) | (y == self.classes_[j]))
+            if len(rows):
+                y_binary = (y[rows] == self.classes_[j]).astype(int)
+                classifier.partial_fit(X[rows], y_binary, classes=[0, 1])
+        self._set_n_features(X.shape[1])
+        return self
+
+    def _pairs(self):
+        """
+        Private method that returns the pairs of class indexes separated by
+        each classifier, in the same order as `OneVsOneClassifier`.
+        """
+        n = len(self.classes_)
+        return [(i, j) for i in range(n) for j in range(i + 1, n)]
+
     def transform(self, X, y=None):
         """
         `X` is expected to be an array-like or a sparse matrix.
         It returns a dense matrix of shape (n_samples, m_features) where
             m_features = (n_classes * (n_classes - 1)) / 2
         """
-        xs = [clf.decision_function(X).reshape(-1, 1) for clf in self.classifiers]
-        return numpy.hstack(xs)
+        if not self.chunk_size:
+            return self._decision_function(X)
+        n = X.shape[0]
+        result = numpy.empty((n, len(self.intercept_)), dtype=self.dtype)
+        for start in range(0, n, self.chunk_size):
+            end = start + self.chunk_size
+            result[start:end] = self._decision_function(X[start:end])
+        return result
+
+    @property
+    def coef_(self):
+        """
+        The weights of the pairwise classifiers stacked into a single
+        (n_features, n_classifiers) matrix, so that all the decision functions
+        are computed with one matrix product.
+        """
+        if self._stacked is None:
+            self._stack_classifiers()
+        return self._stacked[0]
+
+    @property
+    def intercept_(self):
+        """
+        The intercepts of the pairwise classifiers, as the columns of `coef_`.
+        """
+        if self._stacked is None:
+            self._stack_classifiers()
+        return self._stacked[1]
+
+    def __getstate__(self):
+        # Only the weights of the pairwise classifiers are pickled, they are
+        # stacked again when needed (see `coef_`)
+        state = dict(vars(self))
+        state["_stacked"] = None
+        return state
+
+    def _set_n_features(self, n_features):
+        """
+        Private method called after the pairwise classifiers change, so that
+        their weights are stacked again (only once for several calls to
+        `partial_fit`) the next time they are needed.
+        """
+        self.n_features_in_ = n_features
+        self._stacked = None
+
+    def _stack_classifiers(self):
+        """
+        Private method that builds `coef_` and `intercept_`. Classifiers that
+        were not trained yet get zero weights.
+        """
+        coef = numpy.zeros((self.n_features_in_, len(self.classifiers)), dtype=self.dtype)
+        intercept = numpy.zeros(len(self.classifiers), dtype=self.dtype)
+        for i, classifier in enumerate(self.classifiers):
+            if hasattr(classifier, "coef_"):
+                coef[:, i] = classifier.coef_.ravel()
+                intercept[i] = classifier.intercept_[0]
+        self._stacked = (coef, intercept)
+
+    def _decision_function(self, X):
+        Z = numpy.asarray(X.dot(self.coef_))
+        Z += self.intercept_
+        return Z.astype(self.dtype, copy=False)
+
+
+def _fit_pair(X, codes, i, j):
+    """
+    Private function that returns a `SGDClassifier` that separates the rows
+    of `X` of the class `i` (labelled 0) from the ones of the class `j`
+    (labelled 1), where `codes` is the class of each row. This is what
+    `OneVsOneClassifier` does for each pair of classes.
+    """
+    from sklearn.linear_model import SGDClassifier
+    rows = numpy.flatnonzero((codes == i) | (codes == j))
+    return SGDClassifier().fit(X[rows], (codes[rows] == j).astype(int))
+
+
+def _fit_shared_pair(args):
+    X, codes, i, j = args
+    return _fit_pair(X.value, codes.value, i, j)
+
+
+def pad_linear_model(model, positions):
+    """
+    Inserts zero weights into the fitted linear `model` (ex: a
+    `SGDClassifier`) so that it takes inputs with extra columns, without
+    changing its decisions on the existing ones.
+    `positions` is expected to be a list of column indexes of the current
+    input, a new column is inserted before each of them (as in
+    `numpy.insert`).
+    """
+    positions = list(positions)
+    if not positions:
+        return
+    for name in ("coef_", "_standard_coef", "_average_coef"):
+        coef = getattr(model, name, None)
+        if coef is not None:
+            setattr(model, name, numpy.insert(coef, positions, 0, axis=-1))
+    if hasattr(model, "n_features_in_"):
+        model.n_features_in_ = model.coef_.shape[-1]
+
+
+def writable_linear_model(model):
+    """
+    Replaces the weights of the linear `model` that are read-only (ex: memory
+    mapped by `PhraseSentimentPredictor.load`) with writable copies, so that
+    it can continue training with `partial_fit`.
+    """
+    for name in ("coef_", "intercept_", "_standard_coef", "_standard_intercept",
+                 "_average_coef", "_average_intercept"):
+        weights = getattr(model, name, None)
+        if isinstance(weights, numpy.ndarray) and not weights.flags.writeable:
+            setattr(model, name, numpy.array(weights))
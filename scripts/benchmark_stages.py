@@ -0,0 +1,53 @@
+"""
+Time each stage of the samr pipeline on synthetic corpora of several sizes and
+print the results as json lines (one per stage, operation and size), so that
+runs can be compared.
+"""
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    import os
+    import shutil
+    import sys
+    import tempfile
+
+    from samr.benchmark import (write_synthetic_corpus, benchmark_stages,
+                                environment, tracemalloc)
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default="10000,100000,1000000",
+                        help="Comma separated amounts of phrases of the corpora")
+    parser.add_argument("--classifiers", help="Comma separated main classifiers to time (default: all)")
+    parser.add_argument("--classifier-rows", type=int, default=50000,
+                        help="Maximum amount of rows given to the main classifiers")
+    parser.add_argument("--ngram", type=int, default=1)
+    parser.add_argument("--memory", action="store_true",
+                        help="Also report the peak memory allocated by each stage (slower)")
+    parser.add_argument("--data-dir", help="Folder to keep the generated corpora in")
+    parser.add_argument("--output", help="File to write the results to (default: stdout)")
+    config = parser.parse_args()
+
+    if config.memory:
+        if tracemalloc is None:
+            parser.error("--memory needs Python 3.4 or newer")
+        tracemalloc.start()
+    classifiers = config.classifiers.split(",") if config.classifiers else None
+    data_dir = config.data_dir or tempfile.mkdtemp()
+    if not os.path.isdir(data_dir):
+        os.makedirs(data_dir)
+    output = open(config.output, "w") if config.output else sys.stdout
+    try:
+        for size in [int(x) for x in config.sizes.split(",")]:
+            path = os.path.join(data_dir, "synthetic-{}.tsv".format(size))
+            if not os.path.isfile(path):
+                write_synthetic_corpus(path, size)
+            for result in benchmark_stages(path, classifiers, config.classifier_rows,
+                                           config.ngram):
+                result.update(environment(), size=size, ngram=config.ngram)
+                output.write(json.dumps(result, sort_keys=True) + "\n")
+                output.flush()
+    finally:
+        if not config.data_dir:
+            shutil.rmtree(data_dir)
@@ -0,0 +1,26 @@
+"""
+Precompute the Wordnet synsets of every word in train.tsv and test.tsv into a
+synset table used by the `map_to_synsets` option of samr.
+"""
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from samr.corpus import iter_corpus, iter_test_corpus
+    from samr.synset_table import SYNSET_TABLE_PATH, build_synset_table
+    from samr.transformations import ExtractText
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--output", default=SYNSET_TABLE_PATH,
+                        help="Folder to write the table to (default: {})".format(SYNSET_TABLE_PATH))
+    config = parser.parse_args()
+
+    data = list(iter_corpus()) + list(iter_test_corpus())
+    words = set()
+    for text in ExtractText().transform(data):
+        for word in text.split():
+            words.add(word)
+            words.add(word.lower())
+    table = build_synset_table(words, config.output)
+    print("Synset table with {} words written to {}".format(len(table), config.output))
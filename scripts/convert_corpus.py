@@ -0,0 +1,24 @@
+"""
+Convert train.tsv and test.tsv into the columnar binary format that samr loads
+with memory mapping, which is faster to start and shares memory between
+processes.
+"""
+
+
+if __name__ == "__main__":
+    import argparse
+    import os
+
+    from samr.corpus import convert_data_file
+    from samr.settings import DATA_PATH
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("filenames", nargs="*", default=["train.tsv", "test.tsv"])
+    config = parser.parse_args()
+
+    for filename in config.filenames:
+        if not os.path.isfile(os.path.join(DATA_PATH, filename)):
+            print("{} not found in {}, skipping".format(filename, DATA_PATH))
+            continue
+        convert_data_file(filename)
+        print("Converted {}".format(filename))
@@ -40,18 +40,31 @@ if __name__ == "__main__":
     import argparse
     import json
 
+    from samr.corpus import iter_corpus
     from samr.evaluation import cross_validation
+    from samr.feature_cache import FeatureCache
     from samr.predictor import PhraseSentimentPredictor
 
     parser = argparse.ArgumentParser(description=__doc__)
     parser.add_argument("filename")
-    config = parser.parse_args()
-    config = json.load(open(config.filename))
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="Amount of folds to evaluate in parallel, -1 means one per cpu")
+    parser.add_argument("--cache", action="store_true",
+                        help="Compute the stateless features once for all folds")
+    parser.add_argument("--cache-dir",
+                        help="Like --cache, but also keep the features in this folder between runs")
+    args = parser.parse_args()
+    config = json.load(open(args.filename))
 
     factory = lambda: PhraseSentimentPredictor(**config)
     factory()  # Run once to check config is ok
 
+    feature_cache = None
+    if args.cache or args.cache_dir:
+        feature_cache = FeatureCache(iter_corpus(), path=args.cache_dir)
+
     report = PrintPartialCV()
-    result = cross_validation(factory, seed="robot rock", callback=report.report)
+    result = cross_validation(factory, seed="robot rock", callback=report.report,
+                              n_jobs=args.jobs, feature_cache=feature_cache)
 
     print("10-fold cross validation score {}%".format(result * 100))
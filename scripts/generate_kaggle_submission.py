@@ -28,19 +28,45 @@ if __name__ == "__main__":
     import json
     import csv
     import sys
+    import itertools
 
-    from samr.corpus import iter_corpus, iter_test_corpus
+    from samr.corpus import iter_corpus, iter_data_file
     from samr.predictor import PhraseSentimentPredictor
 
     parser = argparse.ArgumentParser(description=__doc__)
-    parser.add_argument("filename")
-    config = parser.parse_args()
-    config = json.load(open(config.filename))
-
-    predictor = PhraseSentimentPredictor(**config)
-    predictor.fit(list(iter_corpus()))
-    test = list(iter_test_corpus())
-    prediction = predictor.predict(test)
+    parser.add_argument("filename", nargs="?",
+                        help="json configuration of the model to train")
+    parser.add_argument("--model",
+                        help="Folder of a saved model to use instead of training one")
+    parser.add_argument("--save-model",
+                        help="Folder to save the trained model to")
+    parser.add_argument("--input", default="test.tsv",
+                        help="tsv file with the phrases to predict (default: test.tsv of the data folder)")
+    parser.add_argument("--chunk-size", type=int, default=10000,
+                        help="Amount of phrases predicted (or trained, with --incremental) at a time")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Train reading train.tsv in chunks instead of loading it "
+                             "(requires hash_features and the sgd classifier)")
+    parser.add_argument("--epochs", type=int, default=1,
+                        help="Passes over train.tsv when training with --incremental")
+    args = parser.parse_args()
+    if (args.filename is None) == (args.model is None):
+        parser.error("Give either a configuration filename or --model")
+
+    if args.model:
+        predictor = PhraseSentimentPredictor.load(args.model)
+    else:
+        config = json.load(open(args.filename))
+        predictor = PhraseSentimentPredictor(**config)
+        if args.incremental:
+            predictor.fit_incremental(lambda: iter_data_file("train.tsv"),
+                                      epochs=args.epochs, chunk_size=args.chunk_size)
+        else:
+            predictor.fit(list(iter_corpus()))
+    if args.save_model:
+        predictor.save(args.save_model)
+    test, to_predict = itertools.tee(iter_data_file(args.input))
+    prediction = predictor.predict_iter(to_predict, chunk_size=args.chunk_size)
 
     writer = csv.writer(sys.stdout)
     writer.writerow(("PhraseId", "Sentiment"))
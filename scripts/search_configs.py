@@ -0,0 +1,60 @@
+"""
+Search the best of several samr model configurations (json files, folders of
+them or grids, see `samr.search.load_configs`) with cross validation and
+successive halving: configurations that do badly on the first folds are
+dropped early. Fold scores are kept in a ledger so that an interrupted search
+resumes where it stopped.
+"""
+import sys
+import time
+
+
+class PrintFolds:
+    def __init__(self):
+        self.last = time.time()
+
+    def report(self, name, fold, score):
+        new = time.time()
+        print("{} fold {} score={}% took {} seconds".format(name, fold, score * 100,
+                                                           new - self.last))
+        sys.stdout.flush()
+        self.last = new
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from samr.corpus import iter_corpus
+    from samr.feature_cache import FeatureCache
+    from samr.search import load_configs, successive_halving
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("paths", nargs="+", help="Configuration files or folders")
+    parser.add_argument("--ledger", default="search_ledger.jsonl",
+                        help="File where fold scores are kept (default: %(default)s)")
+    parser.add_argument("--seed", default="robot rock")
+    parser.add_argument("--folds", type=int, default=10, help="Total amount of folds")
+    parser.add_argument("--min-folds", type=int, default=2,
+                        help="Amount of folds of the first round")
+    parser.add_argument("--eta", type=int, default=2,
+                        help="Only the best 1/eta configurations go to the next round")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="Amount of folds to evaluate in parallel, -1 means one per cpu")
+    parser.add_argument("--cache", action="store_true",
+                        help="Compute the stateless features once for all folds")
+    parser.add_argument("--cache-dir",
+                        help="Like --cache, but also keep the features in this folder between runs")
+    args = parser.parse_args()
+
+    configs = load_configs(args.paths)
+    feature_cache = None
+    if args.cache or args.cache_dir:
+        feature_cache = FeatureCache(iter_corpus(), path=args.cache_dir)
+
+    report = PrintFolds()
+    results = successive_halving(configs, seed=args.seed, K=args.folds,
+                                 min_folds=args.min_folds, eta=args.eta,
+                                 ledger=args.ledger, callback=report.report,
+                                 n_jobs=args.jobs, feature_cache=feature_cache)
+    for result in results:
+        print("{name}: {score:.4%} over {folds} folds".format(**result))
@@ -0,0 +1,33 @@
+"""
+Serve the predictions of a saved samr model over HTTP on a local address, see
+`samr.server` for the protocol.
+"""
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from samr.predictor import PhraseSentimentPredictor
+    from samr.server import PredictionServer
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("model", help="Folder of a model saved with --save-model")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--max-batch", type=int, default=1024,
+                        help="Maximum amount of phrases predicted together")
+    parser.add_argument("--max-latency", type=float, default=0.01,
+                        help="Maximum seconds a request waits for others to batch with")
+    config = parser.parse_args()
+
+    predictor = PhraseSentimentPredictor.load(config.model)
+    server = PredictionServer(predictor, config.host, config.port,
+                              max_batch=config.max_batch,
+                              max_latency=config.max_latency)
+    print("Serving {} on http://{}:{}".format(config.model, *server.server_address))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -17,5 +17,10 @@ setup(
     install_requires=reqs,
     scripts=["scripts/generate_kaggle_submission.py",
              "scripts/cross_validate_config.py",
-             "scripts/download_3rdparty_data.py"]
+             "scripts/download_3rdparty_data.py",
+             "scripts/build_synset_table.py",
+             "scripts/convert_corpus.py",
+             "scripts/serve_model.py",
+             "scripts/benchmark_stages.py",
+             "scripts/search_configs.py"]
 )
@@ -0,0 +1,34 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from samr.benchmark import write_synthetic_corpus, measure
+from samr.corpus import iter_data_file
+
+
+class TestSyntheticCorpus(TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_phrase_tree_structure(self):
+        filename = os.path.join(self.path, "train.tsv")
+        write_synthetic_corpus(filename, 500, seed=3)
+        data = list(iter_data_file(filename))
+        self.assertEqual(len(data), 500)
+        self.assertEqual(len(set(x.phraseid for x in data)), 500)
+        sentences = {}
+        for x in data:
+            sentence = sentences.setdefault(x.sentenceid, x.phrase)
+            self.assertIn(x.phrase, sentence)
+            self.assertIn(x.sentiment, "0 1 2 3 4".split())
+        self.assertTrue(len(sentences) > 1)
+
+    def test_measure(self):
+        result, stats = measure(sorted, [3, 1, 2])
+        self.assertEqual(result, [1, 2, 3])
+        self.assertTrue(stats["seconds"] >= 0)
+        self.assertTrue(stats["maxrss_kb"] > 0)
@@ -1,7 +1,12 @@
 import os
+import shutil
+import tempfile
 from unittest import TestCase
 
+import numpy
+
 from samr import corpus
+from samr.data import PhraseBatch, CorpusView
 
 
 TESTDATA_PATH = os.path.join(os.path.dirname(__file__), "data")
@@ -39,6 +44,27 @@ class TestCorpus(TestCase):
         test_ids = set(x.sentenceid for x in test)
         self.assertEqual(train_ids & test_ids, set())
 
+    def test_split_indices_same_as_make_train_test_split(self):
+        train, test = corpus.split_indices("semis", proportion=0.5)
+        data = list(corpus.iter_corpus())
+        expected_train, expected_test = corpus.make_train_test_split("semis", proportion=0.5)
+        self.assertEqual([data[i] for i in train], expected_train)
+        self.assertEqual(list(CorpusView(data, test)), expected_test)
+
+    def test_kfold_indices(self):
+        data = list(corpus.iter_corpus())
+        folds = list(corpus.kfold_indices("semis", K=3))
+        self.assertEqual(len(folds), 3)
+        tested = sorted(i for _, test in folds for i in test)
+        self.assertEqual(tested, list(range(len(data))))
+        for train, test in folds:
+            self.assertEqual(sorted(list(train) + list(test)), list(range(len(data))))
+            train_ids = set(data[i].sentenceid for i in train)
+            test_ids = set(data[i].sentenceid for i in test)
+            self.assertEqual(train_ids & test_ids, set())
+        with self.assertRaises(ValueError):
+            list(corpus.kfold_indices("semis", K=100))
+
     def test_iter_test_corpus_simple(self):
         test = list(corpus.iter_test_corpus())
         self.assertEqual(len(test), 4)
@@ -47,6 +73,56 @@ class TestCorpus(TestCase):
         self.assertIn("yo mama so fat", [x.phrase for x in test])
         self.assertEqual(set([None]), set(x.sentiment for x in test))
 
+    def test_iter_chunks(self):
+        chunks = list(corpus.iter_chunks(iter(range(7)), 3))
+        self.assertEqual(chunks, [[0, 1, 2], [3, 4, 5], [6]])
+        self.assertEqual(list(corpus.iter_chunks([], 3)), [])
+
     def test_iter_data_file_bad_header(self):
         with self.assertRaises(ValueError):
             list(corpus._iter_data_file("badheader.tsv"))
+
+
+class TestColumnarCorpus(TestCase):
+    def setUp(self):
+        self.__original_path = corpus.DATA_PATH
+        self.path = tempfile.mkdtemp()
+        for filename in ["train.tsv", "test.tsv"]:
+            shutil.copy(os.path.join(TESTDATA_PATH, filename), self.path)
+        corpus.DATA_PATH = self.path
+
+    def tearDown(self):
+        corpus.DATA_PATH = self.__original_path
+        shutil.rmtree(self.path)
+
+    def test_same_as_tsv(self):
+        for filename in ["train.tsv", "test.tsv"]:
+            expected = list(corpus._iter_data_file(filename))
+            corpus.convert_data_file(filename)
+            data = corpus._load_data_file(filename)
+            self.assertIsInstance(data, PhraseBatch)
+            self.assertEqual(len(data), len(expected))
+            self.assertEqual(list(data), expected)
+            self.assertEqual([data[i] for i in range(len(data))], expected)
+
+    def test_batch_slicing(self):
+        expected = list(corpus._iter_data_file("train.tsv"))
+        batch = PhraseBatch.from_datapoints(expected)
+        view = batch[2:5]
+        self.assertIsInstance(view, PhraseBatch)
+        self.assertEqual(list(view), expected[2:5])
+        self.assertIs(view.corpus, batch)
+        self.assertEqual(list(view.indices), [2, 3, 4])
+        taken = batch.take([5, 0])
+        self.assertEqual(list(taken), [expected[5], expected[0]])
+        mask = numpy.arange(len(batch)) % 2 == 0
+        self.assertEqual(list(batch[mask]), expected[::2])
+        self.assertEqual(batch.labels(), [x.sentiment for x in expected])
+
+    def test_outdated_conversion_is_ignored(self):
+        corpus.convert_data_file("test.tsv")
+        with open(os.path.join(self.path, "test.tsv"), "a") as f:
+            f.write("200\t10\tnew phrase\n")
+        data = corpus.iter_test_corpus()
+        self.assertNotIsInstance(data, PhraseBatch)
+        self.assertIn("new phrase", [x.phrase for x in data])
@@ -0,0 +1,56 @@
+import multiprocessing
+import os
+from unittest import TestCase
+
+from samr import corpus, parallel
+from samr.evaluation import cross_validation
+from samr.predictor import PhraseSentimentPredictor
+
+
+TESTDATA_PATH = os.path.join(os.path.dirname(__file__), "data")
+
+
+class TestCrossValidation(TestCase):
+    def setUp(self):
+        self.__original_path = corpus.DATA_PATH
+        corpus.DATA_PATH = TESTDATA_PATH
+
+    def tearDown(self):
+        corpus.DATA_PATH = self.__original_path
+
+    def test_serial(self):
+        scores = []
+        result = cross_validation(PhraseSentimentPredictor, seed="cool", K=3,
+                                  callback=scores.append)
+        self.assertEqual(len(scores), 3)
+        self.assertAlmostEqual(result, sum(scores) / 3)
+
+    def test_parallel(self):
+        scores = []
+        result = cross_validation(PhraseSentimentPredictor, seed="cool", K=3,
+                                  callback=scores.append, n_jobs=2)
+        self.assertEqual(len(scores), 3)
+        self.assertAlmostEqual(result, sum(scores) / 3)
+        for score in scores:
+            self.assertTrue(0 <= score <= 1)
+
+    def test_kfold_splits(self):
+        scores = []
+        splits = corpus.kfold_indices("cool", K=2)
+        cross_validation(PhraseSentimentPredictor, seed="cool",
+                         callback=scores.append, splits=splits)
+        self.assertEqual(len(scores), 2)
+
+    def test_forks_whatever_the_start_method(self):
+        original_method = multiprocessing.get_start_method()
+        original_n_jobs = parallel.pool_size()
+        multiprocessing.set_start_method("spawn", force=True)
+        parallel.set_n_jobs(2)
+        try:
+            scores = []
+            cross_validation(lambda: PhraseSentimentPredictor(), seed="cool",
+                             K=2, callback=scores.append, n_jobs=2)
+            self.assertEqual(len(scores), 2)
+        finally:
+            multiprocessing.set_start_method(original_method, force=True)
+            parallel.set_n_jobs(original_n_jobs)
@@ -0,0 +1,82 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from samr import corpus, feature_cache
+from samr.data import Datapoint, CorpusView
+from samr.evaluation import cross_validation
+from samr.feature_cache import FeatureCache, CachedStages, CachedRows, stages_key
+from samr.inquirer_lex_transform import InquirerLexTransform
+from samr.predictor import PhraseSentimentPredictor
+from samr.transformations import ExtractText, ReplaceText
+
+
+TESTDATA_PATH = os.path.join(os.path.dirname(__file__), "data")
+
+
+class TestFeatureCache(TestCase):
+    def setUp(self):
+        self.__original_path = corpus.DATA_PATH
+        corpus.DATA_PATH = TESTDATA_PATH
+        self.corpus = list(corpus._iter_data_file("train.tsv"))
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        corpus.DATA_PATH = self.__original_path
+        shutil.rmtree(self.path)
+
+    def test_rows(self):
+        cache = FeatureCache(self.corpus)
+        self.assertEqual(cache.rows(self.corpus[3:1:-1]), [3, 2])
+        other = Datapoint(phraseid="1", sentenceid="1", phrase="x", sentiment="0")
+        self.assertEqual(cache.rows([other]), None)
+        view = CorpusView(self.corpus, [4, 1])
+        self.assertIs(cache.rows(view), view.indices)
+
+    def test_cached_stages_same_as_stages(self):
+        cache = FeatureCache(self.corpus)
+        stages = [ExtractText(lowercase=True), ReplaceText([("cat", "dog")])]
+        cached = CachedStages(stages, cache)
+        X = self.corpus[::2]
+        Z = cached.transform(X)
+        self.assertIsInstance(Z, CachedRows)
+        expected = X
+        for stage in stages:
+            expected = stage.transform(expected)
+        self.assertEqual(list(Z), expected)
+        other = [Datapoint(phraseid="x", sentenceid="x", phrase="A cat", sentiment=None)]
+        self.assertEqual(cached.transform(other), ["a dog"])
+
+    def test_persisted(self):
+        cached = CachedStages([ExtractText()], FeatureCache(self.corpus, self.path))
+        cached.outputs()
+        self.assertEqual(len(os.listdir(self.path)), 1)
+        cached = CachedStages([ExtractText()], FeatureCache(self.corpus, self.path))
+        cached._compute = lambda: self.fail("Outputs were not loaded from disk")
+        self.assertEqual(cached.outputs(), ExtractText().transform(self.corpus))
+
+    def test_key_depends_on_data_and_version(self):
+        source = os.path.join(self.path, "lexicon.tsv")
+        with open(source, "w") as f:
+            f.write("Entry\tSource\nGOOD\tH4\n")
+        stages = [InquirerLexTransform(source=source, path=os.path.join(self.path, "x"))]
+        key = stages_key(stages)
+        self.assertEqual(stages_key(stages), key)
+        with open(source, "a") as f:
+            f.write("BAD\tH4\n")
+        self.assertNotEqual(stages_key(stages), key)
+        key = stages_key(stages)
+        original = feature_cache.FEATURE_CACHE_VERSION
+        feature_cache.FEATURE_CACHE_VERSION += 1
+        try:
+            self.assertNotEqual(stages_key(stages), key)
+        finally:
+            feature_cache.FEATURE_CACHE_VERSION = original
+
+    def test_cross_validation(self):
+        cache = FeatureCache(corpus.iter_corpus())
+        scores = []
+        cross_validation(PhraseSentimentPredictor, seed="tardis", K=2,
+                         callback=scores.append, feature_cache=cache)
+        self.assertEqual(len(scores), 2)
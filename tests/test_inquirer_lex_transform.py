@@ -1,6 +1,6 @@
 from unittest import TestCase
 
-from samr.inquirer_lex_transform import InquirerLexTransform
+from samr.inquirer_lex_transform import InquirerLexTransform, InquirerLexFeatures
 
 
 class TestInquirerLexTransform(TestCase):
@@ -24,3 +24,26 @@ class TestInquirerLexTransform(TestCase):
         self.assertIn("negativ", Z[1].lower())
         self.assertNotIn("good", Z[0].lower())
         self.assertNotIn("awful", Z[1].lower())
+
+
+class TestInquirerLexFeatures(TestCase):
+    def test_empty(self):
+        m = InquirerLexFeatures()
+        Z = m.transform([])
+        self.assertEqual(Z.shape[0], 0)
+
+    def test_same_as_counting_lex_transform(self):
+        X = ["This was a good summer", "The food was awful", "", "good good"]
+        m = InquirerLexFeatures(dense=True)
+        Z = m.transform(X)
+        names = m.get_feature_names()
+        self.assertEqual(Z.shape, (4, len(names)))
+        for row, text in zip(Z, InquirerLexTransform().transform(X)):
+            expected = [text.split().count(name) for name in names]
+            self.assertEqual(list(row), expected)
+        self.assertTrue(Z[3].sum() > Z[0].sum() > 0)
+
+    def test_binary(self):
+        m = InquirerLexFeatures(binary=True)
+        Z = m.transform(["good good good"])
+        self.assertEqual(set(Z.data), set([1]))
@@ -0,0 +1,91 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from samr.inquirer_lexicon import (FIELDS, InquirerLexicon, compile_lexicon,
+                                   get_lexicon, load_header)
+from samr.inquirer_lex_transform import InquirerLexTransform, InquirerLexFeatures
+
+
+def _row(entry, **categories):
+    row = [""] * len(FIELDS)
+    row[0] = entry
+    for field, value in categories.items():
+        row[FIELDS.index(field)] = value
+    return "\t".join(row) + "\n"
+
+
+class TestInquirerLexicon(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.source = os.path.join(self.tmp, "lexicon.tsv")
+        self.path = os.path.join(self.tmp, "compiled")
+        with open(self.source, "w") as f:
+            f.write("\t".join(FIELDS) + "\n")
+            f.write(_row("GOOD#1", Positiv="Positiv", Strong="Strong", IAV="IAV"))
+            f.write(_row("GOOD#2", Positiv="Positiv", Pleasur="Pleasur"))
+            f.write(_row("AWFUL", Negativ="Negativ"))
+            f.write(_row("THE"))
+        get_lexicon.cache_clear()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+        get_lexicon.cache_clear()
+
+    def test_word_categories(self):
+        lexicon = InquirerLexicon.from_source(self.source)
+        self.assertEqual(list(lexicon.words), ["awful", "good", "the"])
+        categories = lexicon.word_categories(["Positiv", "Negativ", "IAV", "Strong"])
+        self.assertEqual(categories, {
+            "good": ["Positiv_Positiv", "IAV_IAV", "Strong_Strong", "Positiv_Positiv"],
+            "awful": ["Negativ_Negativ"],
+            "the": [],
+        })
+        self.assertEqual(lexicon.word_categories(["Pleasur"])["good"], ["Pleasur_Pleasur"])
+        with self.assertRaises(ValueError):
+            lexicon.word_categories(["Nope"])
+
+    def test_compile_and_load(self):
+        compile_lexicon(self.source, self.path)
+        lexicon = get_lexicon(self.source, self.path)
+        expected = InquirerLexicon.from_source(self.source)
+        self.assertEqual(list(lexicon.words), list(expected.words))
+        self.assertEqual(list(lexicon.categories), list(expected.categories))
+        self.assertEqual(lexicon.word_categories(FIELDS[1:]),
+                         expected.word_categories(FIELDS[1:]))
+        self.assertIs(get_lexicon(self.source, self.path), lexicon)
+
+    def test_compiled_on_first_use(self):
+        lexicon = get_lexicon(self.source, self.path)
+        self.assertEqual(len(lexicon), 3)
+        self.assertTrue(os.path.isdir(self.path))
+
+    def test_recompiled_when_source_changes(self):
+        compile_lexicon(self.source, self.path)
+        sha1 = load_header(self.path)["source_sha1"]
+        with open(self.source, "a") as f:
+            f.write(_row("BAD", Negativ="Negativ"))
+        get_lexicon.cache_clear()
+        lexicon = get_lexicon(self.source, self.path)
+        self.assertEqual(len(lexicon), 4)
+        self.assertNotEqual(load_header(self.path)["source_sha1"], sha1)
+
+    def test_touched_source_is_not_recompiled(self):
+        compile_lexicon(self.source, self.path)
+        header = load_header(self.path)
+        os.utime(self.source, (0, 0))
+        get_lexicon.cache_clear()
+        get_lexicon(self.source, self.path)
+        self.assertEqual(load_header(self.path), header)
+
+    def test_transforms(self):
+        X = ["a good thing", "awful", ""]
+        m = InquirerLexTransform(source=self.source, path=self.path)
+        self.assertEqual(m.transform(X), [
+            "Positiv_Positiv IAV_IAV Strong_Strong Positiv_Positiv",
+            "Negativ_Negativ", ""])
+        f = InquirerLexFeatures(dense=True, fields=["Positiv", "Pleasur"],
+                                source=self.source, path=self.path)
+        self.assertEqual(f.get_feature_names(), ["Pleasur_Pleasur", "Positiv_Positiv"])
+        self.assertEqual(f.transform(X).tolist(), [[1, 2], [0, 0], [0, 0]])
@@ -0,0 +1,40 @@
+import os
+from unittest import TestCase
+
+from samr import corpus
+from samr.predictor import PhraseSentimentPredictor
+
+
+TESTDATA_PATH = os.path.join(os.path.dirname(__file__), "data")
+
+
+class TestInstrumentation(TestCase):
+    def setUp(self):
+        self.__original_path = corpus.DATA_PATH
+        corpus.DATA_PATH = TESTDATA_PATH
+
+    def tearDown(self):
+        corpus.DATA_PATH = self.__original_path
+
+    def test_records_every_step(self):
+        train, test = corpus.make_train_test_split("kraftwerk")
+        predictor = PhraseSentimentPredictor(text_replacements=[("a", "b")])
+        received = []
+        profiler = predictor.instrument(callback=received.append)
+        predictor.fit(train)
+        predictions = predictor.predict(test)
+        self.assertEqual(len(predictions), len(test))
+        self.assertEqual(received, profiler.records)
+        steps = set(x["step"] for x in profiler.records)
+        for step in ["extracttext", "replacetext", "featureunion", "classifier"]:
+            self.assertIn(step, steps)
+        self.assertTrue(any(x.endswith("/countvectorizer") for x in steps))
+        self.assertTrue(any(x.endswith("/classifierovoasfeatures") for x in steps))
+        for record in profiler.records:
+            self.assertTrue(record["wall_seconds"] >= 0)
+        first = [x for x in profiler.records if x["step"] == "extracttext"][1]
+        self.assertEqual(first["method"], "transform")
+        self.assertEqual(first["rows_in"], len(train))
+        self.assertEqual(first["rows_out"], len(train))
+        summary = profiler.summary()
+        self.assertEqual(summary[("classifier", "predict")]["calls"], 1)
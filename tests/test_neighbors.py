@@ -0,0 +1,76 @@
+import pickle
+from unittest import TestCase
+
+import numpy
+from sklearn.neighbors import KNeighborsClassifier
+
+from samr.neighbors import NeighborsClassifier, compare_to_exact, register_index, _indexes
+
+
+class TestNeighborsClassifier(TestCase):
+    def setUp(self):
+        rng = numpy.random.RandomState(11)
+        self.X = rng.normal(size=(500, 4))
+        self.y = numpy.array([str(i) for i in (self.X[:, 0] > 0) + (self.X[:, 1] > 0.5)])
+        self.Q = rng.normal(size=(80, 4))
+
+    def test_exact_same_as_kneighbors(self):
+        expected = KNeighborsClassifier(n_neighbors=3).fit(self.X, self.y)
+        _, expected_indices = expected.kneighbors(self.Q)
+        for index in ["brute", "tree"]:
+            m = NeighborsClassifier(n_neighbors=3, index=index, batch_size=7, n_jobs=2)
+            m.fit(self.X, self.y)
+            _, indices = m.kneighbors(self.Q)
+            self.assertEqual(indices.tolist(), expected_indices.tolist())
+            self.assertEqual(list(m.predict(self.Q)), list(expected.predict(self.Q)))
+
+    def test_ivf_recall(self):
+        m = NeighborsClassifier(index="ivf", index_args={"n_lists": 10, "n_probe": 10})
+        report = compare_to_exact(m.fit(self.X, self.y), self.Q)
+        self.assertEqual(report["recall"], 1.0)  # Every list is probed
+        m = NeighborsClassifier(index="ivf", index_args={"n_lists": 10, "n_probe": 1})
+        report = compare_to_exact(m.fit(self.X, self.y), self.Q, self.y[:80])
+        self.assertLess(report["recall"], 1.0)
+        self.assertAlmostEqual(report["accuracy_loss"],
+                               report["exact_accuracy"] - report["accuracy"])
+
+    def test_duplicated_points(self):
+        X = numpy.repeat(self.X[:100], 4, axis=0)
+        y = numpy.array([str(i % 3) for i in range(len(X))])
+        m = NeighborsClassifier(n_neighbors=3, index="tree").fit(X, y)
+        self.assertEqual(compare_to_exact(m, self.Q)["recall"], 1.0)
+        m = NeighborsClassifier(n_neighbors=3, index="brute", batch_size=7).fit(X, y)
+        _, indices = m.kneighbors(X[:8])
+        # Ties are broken by row index
+        self.assertEqual(indices[:, 0].tolist(), [0, 0, 0, 0, 4, 4, 4, 4])
+        self.assertEqual(compare_to_exact(m, self.Q)["agreement"], 1.0)
+
+    def test_fewer_points_than_neighbors(self):
+        m = NeighborsClassifier(n_neighbors=5, index="ivf").fit(self.X[:3], self.y[:3])
+        distances, indices = m.kneighbors(self.Q)
+        self.assertTrue((indices[:, 3:] == -1).all())
+        self.assertTrue(numpy.isinf(distances[:, 3:]).all())
+        self.assertEqual(len(m.predict(self.Q)), len(self.Q))
+
+    def test_pickle(self):
+        m = NeighborsClassifier(index="tree").fit(self.X, self.y)
+        loaded = pickle.loads(pickle.dumps(m))
+        self.assertEqual(list(loaded.predict(self.Q)), list(m.predict(self.Q)))
+
+    def test_register_index(self):
+        class FirstRows:
+            def __init__(self, X):
+                self.X = X
+
+            def query(self, Q, k):
+                return (numpy.zeros((len(Q), k), dtype=numpy.float32),
+                        numpy.tile(numpy.arange(k), (len(Q), 1)))
+
+        register_index("first", FirstRows)
+        try:
+            m = NeighborsClassifier(n_neighbors=1, index="first").fit(self.X, self.y)
+            self.assertEqual(set(m.predict(self.Q)), {self.y[0]})
+        finally:
+            del _indexes["first"]
+        with self.assertRaises(ValueError):
+            NeighborsClassifier(index="first")
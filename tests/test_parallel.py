@@ -0,0 +1,66 @@
+import multiprocessing
+import os
+import pickle
+from unittest import TestCase
+
+import numpy
+from scipy.sparse import csr_matrix, csc_matrix
+
+from samr import parallel
+
+
+def _total(X):
+    return X.value.sum()
+
+
+class TestExecutionContext(TestCase):
+    def setUp(self):
+        self.__original_n_jobs = parallel.pool_size()
+        parallel.set_n_jobs(2)
+
+    def tearDown(self):
+        parallel.set_n_jobs(self.__original_n_jobs)
+
+    def test_effective_n_jobs(self):
+        self.assertEqual(parallel.effective_n_jobs(-1), 2)
+        self.assertEqual(parallel.effective_n_jobs(None), 1)
+        self.assertEqual(parallel.effective_n_jobs(1), 1)
+        self.assertEqual(parallel.effective_n_jobs(8), 2)
+
+    def test_pool_is_reused(self):
+        pool = parallel.get_pool()
+        self.assertIs(parallel.get_pool(), pool)
+        self.assertEqual(parallel.parallel_map(abs, [-1, 2, -3]), [1, 2, 3])
+        self.assertIs(parallel.get_pool(), pool)
+        parallel.set_n_jobs(3)
+        self.assertIsNot(parallel.get_pool(), pool)
+
+    def test_share(self):
+        dense = numpy.arange(12, dtype=numpy.float32).reshape(3, 4)
+        for X in [dense, csr_matrix(dense), csc_matrix(dense)]:
+            shared = parallel.share(X)
+            try:
+                loaded = pickle.loads(pickle.dumps(shared)).value
+                self.assertIsInstance(loaded, type(X))
+                self.assertEqual(loaded.dtype, X.dtype)
+                self.assertEqual(loaded.shape, X.shape)
+                self.assertEqual((loaded != X).sum(), 0)
+                self.assertEqual(parallel.parallel_map(_total, [shared, shared]), [66, 66])
+            finally:
+                shared.release()
+            self.assertFalse(os.path.exists(shared.path))
+
+    def test_children_keep_the_shared_folder(self):
+        shared = parallel.share(numpy.arange(3))
+        try:
+            # What the atexit hook does in a forked process
+            child = multiprocessing.get_context("fork").Process(target=parallel.close_pool)
+            child.start()
+            child.join()
+            self.assertTrue(os.path.exists(shared.path))
+        finally:
+            shared.release()
+
+    def test_share_objects(self):
+        with self.assertRaises(ValueError):
+            parallel.share(numpy.array(["a", None]))
@@ -0,0 +1,68 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from sklearn.feature_extraction.text import CountVectorizer
+
+from samr.benchmark import write_synthetic_corpus
+from samr.corpus import iter_data_file
+from samr.data import PhraseTexts
+from samr.phrase_tree import PhraseTreeVectorizer
+from samr.predictor import split_words
+from samr.transformations import ExtractText
+
+
+class TestPhraseTreeVectorizer(TestCase):
+    def setUp(self):
+        path = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(path, "train.tsv")
+            write_synthetic_corpus(filename, 600, seed=5)
+            data = list(iter_data_file(filename))
+        finally:
+            shutil.rmtree(path)
+        self.train = ExtractText().transform(data[:400])
+        self.test = ExtractText().transform(data[400:])
+        # Texts that are not spans of their sentence and empty ones
+        self.train.extend(["The film is not in the sentence", "", "  "])
+        self.train.sentenceids.extend(["1", "1", "999"])
+
+    def assertSameAsCountVectorizer(self, **params):
+        params.setdefault("tokenizer", split_words)
+        expected = CountVectorizer(**params)
+        vectorizer = PhraseTreeVectorizer(**params)
+        X = vectorizer.fit_transform(self.train)
+        Y = expected.fit_transform(self.train)
+        self.assertEqual(vectorizer.vocabulary_, expected.vocabulary_)
+        self.assertEqual(vectorizer.stop_words_, expected.stop_words_)
+        for Z, W in [(X, Y), (vectorizer.transform(self.test), expected.transform(self.test))]:
+            W = W.sorted_indices()  # CountVectorizer doesn't always sort them
+            self.assertEqual(Z.shape, W.shape)
+            self.assertEqual(Z.dtype, W.dtype)
+            self.assertEqual(Z.indptr.tolist(), W.indptr.tolist())
+            self.assertEqual(Z.indices.tolist(), W.indices.tolist())
+            self.assertEqual(Z.data.tolist(), W.data.tolist())
+
+    def test_unigrams(self):
+        self.assertSameAsCountVectorizer()
+
+    def test_ngrams(self):
+        self.assertSameAsCountVectorizer(ngram_range=(1, 3))
+        self.assertSameAsCountVectorizer(ngram_range=(2, 2), lowercase=False)
+
+    def test_options(self):
+        self.assertSameAsCountVectorizer(ngram_range=(1, 2), stop_words="english",
+                                         binary=True)
+        self.assertSameAsCountVectorizer(ngram_range=(1, 2), min_df=3, max_df=0.5)
+
+    def test_without_sentenceids(self):
+        texts = list(self.train)
+        X = PhraseTreeVectorizer(tokenizer=split_words).fit_transform(texts)
+        Y = CountVectorizer(tokenizer=split_words).fit_transform(texts)
+        self.assertEqual((X != Y).nnz, 0)
+
+    def test_empty_vocabulary(self):
+        texts = PhraseTexts(["the", "a the"], ["1", "1"])
+        with self.assertRaises(ValueError):
+            PhraseTreeVectorizer(stop_words="english").fit(texts)
@@ -1,9 +1,19 @@
 import os
+import shutil
+import subprocess
+import sys
+import tempfile
 from unittest import TestCase
 
+import numpy
+
 from samr import corpus
-from samr.predictor import PhraseSentimentPredictor
-from samr.data import Datapoint
+from samr.predictor import (PhraseSentimentPredictor, DuplicatesHandler,
+                            _hash_strings, _valid_classifiers, _Baseline,
+                            register_classifier, get_classifier)
+from samr.data import Datapoint, PhraseBatch
+from samr.phrase_tree import PhraseTreeVectorizer
+from samr.storage import Vocabulary
 
 
 TESTDATA_PATH = os.path.join(os.path.dirname(__file__), "data")
@@ -37,6 +47,124 @@ class TestPhraseSentimentPredictor(TestCase):
         predicted_labels = set(predictions)
         self.assertEqual(predicted_labels - train_labels, set())
 
+    def test_predict_iter(self):
+        train, test = corpus.make_train_test_split("hypnotized", proportion=0.5)
+        predictor = PhraseSentimentPredictor()
+        predictor.fit(train)
+        expected = list(predictor.predict(test))
+        predictions = predictor.predict_iter(iter(test), chunk_size=2)
+        self.assertEqual(list(predictions), expected)
+
+    def test_phrase_batch(self):
+        train, test = corpus.make_train_test_split("space oddity")
+        predictor = PhraseSentimentPredictor(duplicates=True)
+        predictor.fit(train)
+        expected = list(predictor.predict(test))
+        batch = PhraseBatch.from_datapoints(test)
+        self.assertEqual(list(predictor.predict(batch)), expected)
+        self.assertEqual(list(predictor.predict_iter(batch, chunk_size=3)), expected)
+        other = PhraseSentimentPredictor(duplicates=True)
+        other.fit(PhraseBatch.from_datapoints(train))
+        self.assertEqual(len(other.predict(batch)), len(test))
+
+    def test_save_load(self):
+        train, test = corpus.make_train_test_split("dreadlock holiday")
+        predictor = PhraseSentimentPredictor(ngram=2, duplicates=True)
+        predictor.fit(train)
+        path = tempfile.mkdtemp()
+        try:
+            predictor.save(path)
+            loaded = PhraseSentimentPredictor.load(path)
+            self.assertEqual(loaded.config, predictor.config)
+            extraction = loaded.pipeline.steps[-1][1].transformer_list[0][1]
+            vectorizer, ovo = extraction.steps[0][1], extraction.steps[1][1]
+            self.assertIsInstance(vectorizer.vocabulary_, Vocabulary)
+            self.assertIsNone(ovo._stacked)  # Only the pairwise weights are saved
+            self.assertEqual(list(loaded.predict(test)), list(predictor.predict(test)))
+            # The predictor that was saved keeps its dict vocabularies
+            extraction = predictor.pipeline.steps[-1][1].transformer_list[0][1]
+            self.assertIsInstance(extraction.steps[0][1].vocabulary_, dict)
+        finally:
+            shutil.rmtree(path)
+
+    def test_hash_features(self):
+        train, test = corpus.make_train_test_split("moonage daydream")
+        predictor = PhraseSentimentPredictor(hash_features=2 ** 10, ngram=3)
+        predictor.fit(train)
+        vectorizer = predictor.pipeline.steps[-1][1].transformer_list[0][1].steps[0][1]
+        self.assertEqual(vectorizer.transform(["a b c"]).shape, (1, 2 ** 10))
+        self.assertTrue((vectorizer.transform(["a b c a"]).data > 0).all())
+        predictions = predictor.predict(test)
+        self.assertEqual(len(predictions), len(test))
+
+    def test_phrase_tree(self):
+        train, test = corpus.make_train_test_split("life on mars")
+        predictor = PhraseSentimentPredictor(phrase_tree=True, ngram=2)
+        predictor.fit(train)
+        vectorizer = predictor.pipeline.steps[-1][1].transformer_list[0][1].steps[0][1]
+        self.assertIsInstance(vectorizer, PhraseTreeVectorizer)
+        predictions = predictor.predict(test)
+        self.assertEqual(len(predictions), len(test))
+
+    def test_fit_incremental(self):
+        train, test = corpus.make_train_test_split("ashes to ashes")
+        predictor = PhraseSentimentPredictor(hash_features=2 ** 10, ngram=2,
+                                             duplicates=True)
+        predictor.fit_incremental(lambda: iter(train), epochs=2, chunk_size=7)
+        predictions = predictor.predict(test)
+        self.assertEqual(len(predictions), len(test))
+        self.assertTrue(set(predictions) <= set("01234"))
+
+    def test_update(self):
+        train, test = corpus.make_train_test_split("heroes")
+        predictor = PhraseSentimentPredictor(ngram=2, duplicates=True)
+        predictor.fit(train)
+        vectorizer = predictor.pipeline.steps[-1][1].transformer_list[0][1].steps[0][1]
+        vocabulary = dict(vectorizer.vocabulary_)
+        predictor.update(test, epochs=2)
+        for term, column in vocabulary.items():
+            self.assertEqual(vectorizer.vocabulary_[term], column)
+        self.assertGreater(len(vectorizer.vocabulary_), len(vocabulary))
+        self.assertEqual(predictor.classifier.coef_.shape[1], 10)
+        # Every updated phrase is now a known duplicate
+        self.assertEqual(list(predictor.predict(test)), [x.sentiment for x in test])
+
+    def test_update_loaded(self):
+        train, test = corpus.make_train_test_split("sound and vision")
+        for params in [{"hash_features": 2 ** 14}, {}]:
+            predictor = PhraseSentimentPredictor(**params).fit(train)
+            path = tempfile.mkdtemp()
+            try:
+                predictor.save(path)
+                loaded = PhraseSentimentPredictor.load(path)
+                loaded.update(train)  # No new words
+                loaded.update(test)
+            finally:
+                shutil.rmtree(path)
+            self.assertEqual(len(loaded.predict(test)), len(test))
+
+    def test_update_unknown_sentiment(self):
+        train, test = corpus.make_train_test_split("heroes")
+        predictor = PhraseSentimentPredictor(duplicates=True).fit(train)
+        known = set(predictor.classifier.classes_)
+        phrase = Datapoint(phraseid="1", sentenceid="1", phrase="brand new words",
+                           sentiment="9")
+        with self.assertRaises(ValueError):
+            predictor.update([phrase])
+        self.assertIsNone(predictor.dupes.get(phrase))
+        self.assertEqual(set(predictor.classifier.classes_), known)
+
+    def test_update_needs_partial_fit(self):
+        train, test = corpus.make_train_test_split("starman")
+        predictor = PhraseSentimentPredictor(classifier="knn").fit(train)
+        with self.assertRaises(ValueError):
+            predictor.update(test)
+
+    def test_fit_incremental_needs_hashing(self):
+        predictor = PhraseSentimentPredictor()
+        with self.assertRaises(ValueError):
+            predictor.fit_incremental(lambda: iter([]))
+
     def test_simple_error_matrix(self):
         train, test = corpus.make_train_test_split("reflektor", proportion=0.4)
         predictor = PhraseSentimentPredictor()
@@ -64,3 +192,136 @@ class TestPhraseSentimentPredictor(TestCase):
         predictor.fit(train)
         predicted = predictor.predict(test)[0]
         self.assertEqual(predicted, "1")
+
+
+class TestDuplicatesHandler(TestCase):
+    def setUp(self):
+        phrases = ["a b", "A  b", "c", "d e f", "c"]
+        self.train = [Datapoint(phraseid=str(i), sentenceid="1", phrase=x,
+                                sentiment=None) for i, x in enumerate(phrases)]
+        self.target = ["1", "2", "3", "4", "0"]
+
+    def test_lookup(self):
+        handler = DuplicatesHandler()
+        handler.fit(self.train, self.target)
+        self.assertEqual(len(handler.hashes), 3)
+        test = [Datapoint("9", "9", x, None) for x in ["x", "a b", "c", "D e  F"]]
+        rows, labels = handler.lookup(test)
+        self.assertEqual(list(rows), [1, 2, 3])
+        self.assertEqual(list(labels), ["2", "0", "4"])
+        self.assertEqual(handler.get(test[0]), None)
+        self.assertEqual(handler.get(test[1]), "2")
+
+    def test_partial_fit(self):
+        handler = DuplicatesHandler(verify=True)
+        handler.fit(self.train[:3], self.target[:3])
+        handler.partial_fit(self.train[3:], self.target[3:])
+        expected = DuplicatesHandler()
+        expected.fit(self.train, self.target)
+        self.assertEqual(list(handler.hashes), list(expected.hashes))
+        self.assertEqual(list(handler.classes[handler.codes]),
+                         list(expected.classes[expected.codes]))
+        self.assertEqual(sorted(handler.keys), ["a b", "c", "d e f"])
+
+    def test_verify(self):
+        handler = DuplicatesHandler(verify=True)
+        handler.fit(self.train[:1], self.target[:1])
+        collision = Datapoint("9", "9", "not a b", None)
+        handler.hashes[:] = _hash_strings(["not a b"])  # Fake a collision
+        self.assertEqual(handler.get(collision), None)
+        handler.verify = False
+        self.assertEqual(handler.get(collision), "1")
+
+    def test_partial_fit_chunks(self):
+        handler = DuplicatesHandler(verify=True)
+        handler.fit(self.train[:1], self.target[:1])
+        for i in range(1, len(self.train), 2):
+            handler.partial_fit(self.train[i:i + 2], self.target[i:i + 2])
+        expected = DuplicatesHandler(verify=True)
+        expected.fit(self.train, self.target)
+        self.assertEqual(list(handler.hashes), list(expected.hashes))
+        self.assertEqual(list(handler.classes[handler.codes]),
+                         list(expected.classes[expected.codes]))
+        self.assertEqual(list(handler.keys), ["a b", "c", "d e f"])
+        rows, labels = handler.lookup(self.train)
+        self.assertEqual(list(rows), [0, 1, 2, 3, 4])
+        self.assertEqual(list(labels), ["2", "2", "0", "4", "0"])
+
+    def test_partial_fit_collision(self):
+        handler = DuplicatesHandler(verify=True)
+        handler.fit(self.train[:1], self.target[:1])
+        handler.hashes[:] = _hash_strings(["not a b"])  # Fake a collision
+        collision = Datapoint("9", "9", "not a b", None)
+        handler.partial_fit([collision], ["3"])
+        self.assertEqual(len(handler.hashes), 1)
+        self.assertEqual(handler.get(collision), "3")
+        self.assertEqual(handler.get(self.train[0]), None)
+
+
+class _ConstantClassifier:
+    def __init__(self, label="3"):
+        self.label = label
+
+    def fit(self, X, y):
+        return self
+
+    def predict(self, X):
+        return numpy.array([self.label] * X.shape[0])
+
+
+class _ListClassifier(_ConstantClassifier):
+    def predict(self, X):
+        return [self.label] * X.shape[0]
+
+
+class TestClassifierRegistry(TestCase):
+    def setUp(self):
+        self.__original_path = corpus.DATA_PATH
+        corpus.DATA_PATH = TESTDATA_PATH
+
+    def tearDown(self):
+        corpus.DATA_PATH = self.__original_path
+        _valid_classifiers.pop("constant", None)
+
+    def test_builtin_are_lazy(self):
+        self.assertIsInstance(_valid_classifiers["svc"], str)
+        from sklearn.svm import SVC
+        self.assertIs(get_classifier("svc"), SVC)
+
+    def test_optional_modules_are_lazy(self):
+        code = ("import sys, samr.predictor; "
+                "print(sorted(m for m in sys.modules if m in {}))").format(
+                    {"samr.neighbors", "samr.instrumentation"})
+        output = subprocess.check_output([sys.executable, "-c", code])
+        self.assertEqual(output.decode("utf-8").strip(), "[]")
+
+    def test_register_classifier(self):
+        register_classifier("constant", _ConstantClassifier)
+        train, test = corpus.make_train_test_split("heroes")
+        predictor = PhraseSentimentPredictor(classifier="constant",
+                                             classifier_args={"label": "4"})
+        predictor.fit(train)
+        self.assertEqual(set(predictor.predict(test)), {"4"})
+        register_classifier("constant", "samr.predictor:_Baseline")
+        self.assertIs(get_classifier("constant"), _Baseline)
+
+    def test_classifier_returning_lists(self):
+        register_classifier("constant", _ListClassifier)
+        train, test = corpus.make_train_test_split("heroes")
+        predictor = PhraseSentimentPredictor(classifier="constant",
+                                             classifier_args={"label": "4"},
+                                             duplicates=True)
+        predictor.fit(train)
+        predicted = predictor.predict(train)
+        self.assertEqual(list(predicted), [x.sentiment for x in train])
+
+    def test_unknown_classifier(self):
+        with self.assertRaises(ValueError):
+            PhraseSentimentPredictor(classifier="nope")
+
+    def test_ann(self):
+        train, test = corpus.make_train_test_split("heroes")
+        predictor = PhraseSentimentPredictor(classifier="ann",
+                                             classifier_args={"n_neighbors": 3})
+        predictor.fit(train)
+        self.assertEqual(len(predictor.predict(test)), len(test))
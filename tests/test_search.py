@@ -0,0 +1,103 @@
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from samr import corpus
+from samr.search import (load_configs, expand_grid, read_ledger,
+                         successive_halving)
+
+
+TESTDATA_PATH = os.path.join(os.path.dirname(__file__), "data")
+
+
+class TestLoadConfigs(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write(self, name, config):
+        path = os.path.join(self.tmp, name)
+        with open(path, "w") as f:
+            json.dump(config, f)
+        return path
+
+    def test_files_folders_and_grids(self):
+        self.write("a.json", {"ngram": 2})
+        self.write("b.json", {"base": {"binary": True}, "grid": {"ngram": [1, 2],
+                                                                 "min_df": [0]}})
+        configs = load_configs([self.tmp])
+        self.assertEqual(configs, [
+            ("a", {"ngram": 2}),
+            ("b[min_df=0,ngram=1]", {"binary": True, "min_df": 0, "ngram": 1}),
+            ("b[min_df=0,ngram=2]", {"binary": True, "min_df": 0, "ngram": 2}),
+        ])
+        self.assertEqual(load_configs([os.path.join(self.tmp, "a.json")]), configs[:1])
+
+    def test_duplicated_names(self):
+        path = self.write("a.json", {})
+        with self.assertRaises(ValueError):
+            load_configs([path, self.tmp])
+
+    def test_expand_grid(self):
+        configs = expand_grid("g", {}, {"stopwords": [None, "english"]})
+        self.assertEqual([name for name, _ in configs],
+                         ['g[stopwords=null]', 'g[stopwords="english"]'])
+
+
+class TestSuccessiveHalving(TestCase):
+    def setUp(self):
+        self.__original_path = corpus.DATA_PATH
+        corpus.DATA_PATH = TESTDATA_PATH
+        self.tmp = tempfile.mkdtemp()
+        self.ledger = os.path.join(self.tmp, "ledger.jsonl")
+        self.configs = [("one", {}), ("two", {"ngram": 2}),
+                        ("three", {"binary": True}), ("four", {"classifier": "ann"})]
+
+    def tearDown(self):
+        corpus.DATA_PATH = self.__original_path
+        shutil.rmtree(self.tmp)
+
+    def test_halving(self):
+        calls = []
+        results = successive_halving(self.configs, seed="cool", K=4, min_folds=1,
+                                     ledger=self.ledger,
+                                     callback=lambda *args: calls.append(args))
+        self.assertEqual([x["folds"] for x in results], [4, 2, 1, 1])
+        self.assertEqual(len(calls), 4 + 2 + 2)  # 4x1 folds, 2x1 more, 1x2 more
+        # The interleaved first round
+        self.assertEqual([(name, k) for name, k, _ in calls[:4]],
+                         [(name, 0) for name, _ in self.configs])
+        records = read_ledger(self.ledger)
+        self.assertEqual(len(records), len(calls))
+        best = results[0]
+        scores = [x["score"] for x in records if x["name"] == best["name"]]
+        self.assertEqual(sorted(x["fold"] for x in records if x["name"] == best["name"]),
+                         [0, 1, 2, 3])
+        self.assertAlmostEqual(best["score"], sum(scores) / 4)
+
+    def test_resume(self):
+        expected = successive_halving(self.configs, seed="cool", K=4, min_folds=1,
+                                      ledger=self.ledger)
+        records = read_ledger(self.ledger)
+        # An interrupted run, with a partially written last record
+        with open(self.ledger, "w") as f:
+            for record in records[:5]:
+                f.write(json.dumps(record) + "\n")
+            f.write('{"name": "tw')
+        calls = []
+        results = successive_halving(self.configs, seed="cool", K=4, min_folds=1,
+                                     ledger=self.ledger,
+                                     callback=lambda *args: calls.append(args))
+        self.assertEqual(len(calls), len(records) - 5)
+        self.assertEqual(set((name, k) for name, k, _ in calls),
+                         set((x["name"], x["fold"]) for x in records[5:]))
+        self.assertEqual(len(read_ledger(self.ledger)), len(records))
+
+    def test_parallel(self):
+        results = successive_halving(self.configs[:2], seed="cool", K=2,
+                                     min_folds=1, n_jobs=2)
+        self.assertEqual([x["folds"] for x in results], [2, 1])
@@ -0,0 +1,98 @@
+import json
+import threading
+import urllib.request
+from unittest import TestCase
+
+from samr.server import MicroBatcher, PredictionServer
+
+
+class FakePredictor:
+    def __init__(self):
+        self.calls = []
+
+    def predict(self, phrases):
+        self.calls.append(len(phrases))
+        return [str(len(x.phrase) % 5) for x in phrases]
+
+
+class TestMicroBatcher(TestCase):
+    def test_concurrent_requests_are_batched(self):
+        predictor = FakePredictor()
+        batcher = MicroBatcher(predictor.predict, max_batch=100, max_latency=0.2)
+        results = {}
+
+        def request(i):
+            results[i] = batcher.submit(["a" * i, "b" * (i + 1)])
+
+        threads = [threading.Thread(target=request, args=(i,)) for i in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        batcher.close()
+        for i in range(10):
+            self.assertEqual(results[i], [str(i % 5), str((i + 1) % 5)])
+        self.assertEqual(sum(predictor.calls), 20)
+        self.assertTrue(len(predictor.calls) < 10)
+        stats = batcher.stats()
+        self.assertEqual(stats["requests"], 10)
+        self.assertEqual(stats["phrases"], 20)
+        self.assertEqual(stats["batches"], len(predictor.calls))
+
+    def test_max_batch(self):
+        predictor = FakePredictor()
+        batcher = MicroBatcher(predictor.predict, max_batch=1, max_latency=10)
+        self.assertEqual(batcher.submit(["aa"]), ["2"])
+        batcher.close()
+        self.assertEqual(predictor.calls, [1])
+
+    def test_errors_are_raised(self):
+        def predict(phrases):
+            raise RuntimeError("broken")
+        batcher = MicroBatcher(predict)
+        with self.assertRaises(RuntimeError):
+            batcher.submit(["x"])
+        batcher.close()
+        self.assertEqual(batcher.stats()["errors"], 1)
+
+
+class TestPredictionServer(TestCase):
+    def setUp(self):
+        self.server = PredictionServer(FakePredictor(), port=0)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.url = "http://127.0.0.1:{}".format(self.server.server_address[1])
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def test_predict_and_stats(self):
+        body = json.dumps({"phrases": ["abc", "a"]}).encode("utf-8")
+        response = urllib.request.urlopen(self.url + "/predict", body)
+        self.assertEqual(json.loads(response.read().decode("utf-8")),
+                         {"sentiments": ["3", "1"]})
+        response = urllib.request.urlopen(self.url + "/stats")
+        stats = json.loads(response.read().decode("utf-8"))
+        self.assertEqual(stats["phrases"], 2)
+
+    def test_bad_request(self):
+        with self.assertRaises(urllib.error.HTTPError) as cm:
+            urllib.request.urlopen(self.url + "/predict", b"{}")
+        self.assertEqual(cm.exception.code, 400)
+
+    def test_phrases_not_a_list(self):
+        body = json.dumps({"phrases": "abc"}).encode("utf-8")
+        with self.assertRaises(urllib.error.HTTPError) as cm:
+            urllib.request.urlopen(self.url + "/predict", body)
+        self.assertEqual(cm.exception.code, 400)
+
+    def test_no_phrases(self):
+        body = json.dumps({"phrases": []}).encode("utf-8")
+        response = urllib.request.urlopen(self.url + "/predict", body)
+        self.assertEqual(json.loads(response.read().decode("utf-8")),
+                         {"sentiments": []})
+        response = urllib.request.urlopen(self.url + "/stats")
+        stats = json.loads(response.read().decode("utf-8"))
+        self.assertEqual(stats["requests"], 0)
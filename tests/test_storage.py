@@ -0,0 +1,119 @@
+import pickle
+import shutil
+import tempfile
+from unittest import TestCase
+
+import numpy
+
+from samr.storage import (StringArray, Vocabulary, save_arrays, load_arrays,
+                          save_object, load_object, MIN_ARRAY_BYTES)
+
+
+class TestStringArray(TestCase):
+    def test_empty(self):
+        a = StringArray.from_strings([])
+        self.assertEqual(len(a), 0)
+        self.assertEqual(list(a), [])
+        self.assertEqual(a.index("x"), -1)
+
+    def test_simple(self):
+        X = ["", "añejo", "bread", "z z"]
+        a = StringArray.from_strings(X)
+        self.assertEqual(len(a), 4)
+        self.assertEqual(list(a), X)
+        self.assertEqual(a[1], "añejo")
+        self.assertEqual(a[-1], "z z")
+        with self.assertRaises(IndexError):
+            a[4]
+
+    def test_index(self):
+        X = ["apple", "banana", "cherry"]
+        a = StringArray.from_strings(X)
+        for i, x in enumerate(X):
+            self.assertEqual(a.index(x), i)
+        self.assertEqual(a.index("avocado"), -1)
+        self.assertEqual(a.index("zucchini"), -1)
+
+    def test_slicing(self):
+        X = ["", "añejo", "bread", "z z", "q"]
+        a = StringArray.from_strings(X)
+        self.assertIs(a[1:4].blob, a.blob)
+        self.assertEqual(list(a[1:4]), X[1:4])
+        self.assertEqual(list(a[4:1]), [])
+        self.assertEqual(list(a[::2]), X[::2])
+        self.assertEqual(list(a[1:4][1:]), X[2:4])
+        self.assertEqual(a[1:4][0], "añejo")
+
+    def test_take(self):
+        X = ["", "añejo", "bread", "z z", "q"]
+        a = StringArray.from_strings(X)
+        self.assertEqual(list(a.take([3, 0, 1, 3])), ["z z", "", "añejo", "z z"])
+        self.assertEqual(list(a.take([])), [])
+        self.assertEqual(list(a[2:].take([1])), ["z z"])
+
+    def test_extend(self):
+        X = ["", "añejo", "bread", "z z"]
+        a = StringArray.from_strings(X)
+        self.assertEqual(list(a.extend(["q", ""])), X + ["q", ""])
+        self.assertEqual(list(a[2:].extend(["ñ"])), ["bread", "z z", "ñ"])
+        self.assertEqual(list(a.extend([])), X)
+        self.assertEqual(list(StringArray.from_strings([]).extend(["a"])), ["a"])
+
+
+class TestVocabulary(TestCase):
+    def test_mapping(self):
+        terms = {"b a": 0, "ñu": 2, "a": 1}
+        v = Vocabulary.from_dict(terms)
+        self.assertEqual(list(v.terms), ["a", "b a", "ñu"])
+        self.assertEqual(len(v), 3)
+        self.assertEqual(dict(v.items()), terms)
+        self.assertEqual(v["ñu"], 2)
+        self.assertEqual(v.get("c", -1), -1)
+        self.assertNotIn("c", v)
+        with self.assertRaises(KeyError):
+            v["c"]
+
+    def test_pickle(self):
+        v = Vocabulary.from_dict({"a": 1, "b": 0})
+        v["a"]
+        state = v.__getstate__()
+        self.assertNotIn("_dict", state)
+        self.assertEqual(dict(pickle.loads(pickle.dumps(v))), {"a": 1, "b": 0})
+
+
+class TestSaveArrays(TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_roundtrip(self):
+        arrays = StringArray.from_strings(["a", "bc"]).arrays("s")
+        arrays["x"] = numpy.arange(5)
+        save_arrays(self.path, "test", 1, arrays, header={"extra": 3})
+        header, loaded = load_arrays(self.path, "test", 1)
+        self.assertEqual(header["extra"], 3)
+        self.assertEqual(list(loaded["x"]), list(range(5)))
+        self.assertEqual(list(StringArray.from_arrays(loaded, "s")), ["a", "bc"])
+
+    def test_wrong_version(self):
+        save_arrays(self.path, "test", 1, {"x": numpy.arange(2)})
+        with self.assertRaises(ValueError):
+            load_arrays(self.path, "test", 2)
+        with self.assertRaises(ValueError):
+            load_arrays(self.path, "other", 1)
+
+    def test_object_roundtrip(self):
+        big = numpy.arange(MIN_ARRAY_BYTES, dtype=numpy.uint8)
+        small = numpy.arange(3)
+        obj = {"big": big, "again": big, "small": small, "other": "value"}
+        save_object(self.path, "test", 1, obj, header={"extra": 3})
+        header, loaded = load_object(self.path, "test", 1)
+        self.assertEqual(header["extra"], 3)
+        self.assertEqual(header["arrays"], ["array0"])
+        self.assertIsInstance(loaded["big"], numpy.memmap)
+        self.assertIs(loaded["big"], loaded["again"])
+        self.assertTrue((loaded["big"] == big).all())
+        self.assertEqual(list(loaded["small"]), [0, 1, 2])
+        self.assertEqual(loaded["other"], "value")
@@ -0,0 +1,33 @@
+import shutil
+import tempfile
+from unittest import TestCase
+
+from samr.synset_table import SynsetTable
+from samr.transformations import MapToSynsets
+
+
+class TestSynsetTable(TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.table = SynsetTable.from_dict({
+            "light": "Synset('light.a.01') Synset('light.v.01')",
+            "crashes": "Synset('crash.v.01')",
+            "the": "",
+        })
+        self.table.save(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_get(self):
+        table = SynsetTable.load(self.path)
+        self.assertEqual(len(table), 3)
+        self.assertEqual(table.get("crashes"), "Synset('crash.v.01')")
+        self.assertEqual(table.get("the"), "")
+        self.assertEqual(table.get("missing"), None)
+
+    def test_map_to_synsets_uses_table(self):
+        m = MapToSynsets(table_path=self.path)
+        Z = m.transform(["the light crashes", "the"])
+        self.assertEqual(Z, ["Synset('light.a.01') Synset('light.v.01') "
+                             "Synset('crash.v.01')", ""])
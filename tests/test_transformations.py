@@ -1,6 +1,43 @@
 from unittest import TestCase
 
-from samr.transformations import ReplaceText, MapToSynsets
+import numpy
+from scipy.sparse import csr_matrix
+
+from samr.transformations import (ExtractText, ReplaceText, MapToSynsets,
+                                  ClassifierOvOAsFeatures, StatelessTransform,
+                                  pad_linear_model)
+from samr import parallel
+from samr.data import Datapoint, PhraseBatch
+
+
+class TestExtractText(TestCase):
+    def setUp(self):
+        sentence = "The movie is n't bad , it 's awful ."
+        phrases = [sentence, "The movie", "is n't bad", "bad , it", "it 's",
+                   "awful .", "movie is", "", "not in the sentence"]
+        self.X = [Datapoint(phraseid=str(i), sentenceid="1", phrase=x,
+                            sentiment="2") for i, x in enumerate(phrases)]
+        self.X.append(Datapoint(phraseid="a", sentenceid="2",
+                                phrase="Another one", sentiment="2"))
+
+    def test_empty(self):
+        e = ExtractText(sentence_tokenization=True)
+        self.assertEqual(e.transform([]), [])
+
+    def test_sentence_tokenization_same_as_phrase(self):
+        Z1 = ExtractText(lowercase=True).transform(self.X)
+        Z2 = ExtractText(lowercase=True,
+                         sentence_tokenization=True).transform(self.X)
+        self.assertEqual(Z1, Z2)
+        self.assertEqual(Z2[7], "")
+        self.assertEqual(Z2[-1], "another one")
+
+    def test_phrase_batch(self):
+        X = self.X[:-1]  # Phrase ids must be integers in a batch
+        batch = PhraseBatch.from_datapoints(X)
+        for sentence_tokenization in [False, True]:
+            e = ExtractText(lowercase=True, sentence_tokenization=sentence_tokenization)
+            self.assertEqual(e.transform(batch), e.transform(X))
 
 
 class TestReplaceText(TestCase):
@@ -61,3 +98,143 @@ class TestMapToSynsets(TestCase):
         for word in ["light.a.01", "crash.v.01"]:
             self.assertIn(word, Z[0])
         self.assertNotIn("crash.n.02", Z[0])
+
+
+class TestClassifierOvOAsFeatures(TestCase):
+    def setUp(self):
+        rng = numpy.random.RandomState(7)
+        self.X = csr_matrix(rng.poisson(0.3, size=(60, 20)))
+        self.y = [str(i % 3) for i in range(60)]
+
+    def test_same_as_pairwise_decision_functions(self):
+        m = ClassifierOvOAsFeatures().fit(self.X, self.y)
+        Z = m.transform(self.X)
+        self.assertEqual(Z.shape, (60, 3))
+        for i, clf in enumerate(m.classifiers):
+            self.assertTrue(numpy.allclose(Z[:, i], clf.decision_function(self.X)))
+
+    def test_chunked(self):
+        m = ClassifierOvOAsFeatures().fit(self.X, self.y)
+        Z = m.transform(self.X)
+        m.chunk_size = 7
+        m.dtype = numpy.float32
+        Z32 = m.transform(self.X)
+        self.assertEqual(Z32.dtype, numpy.float32)
+        self.assertTrue(numpy.allclose(Z, Z32, atol=1e-4))
+
+    def test_partial_fit(self):
+        m = ClassifierOvOAsFeatures()
+        m.partial_fit(self.X[:30], self.y[:30], classes=["0", "1", "2"])
+        m.partial_fit(self.X[30:], self.y[30:])
+        self.assertIsNone(m._stacked)  # Stacked on the first transform
+        Z = m.transform(self.X)
+        self.assertEqual(Z.shape, (60, 3))
+        for i, clf in enumerate(m.classifiers):
+            self.assertTrue(numpy.allclose(Z[:, i], clf.decision_function(self.X)))
+
+    def test_partial_fit_missing_pair(self):
+        m = ClassifierOvOAsFeatures()
+        m.partial_fit(self.X[:1], self.y[:1], classes=["0", "1", "2"])
+        Z = m.transform(self.X)
+        self.assertEqual(Z.shape, (60, 3))
+        self.assertTrue((Z[:, 2] == 0).all())  # No data for the "1" vs "2" pair
+
+    def test_parallel_fit(self):
+        original = parallel.pool_size()
+        parallel.set_n_jobs(2)
+        try:
+            m = ClassifierOvOAsFeatures().fit(self.X, self.y)
+        finally:
+            parallel.set_n_jobs(original)
+        Z = m.transform(self.X)
+        self.assertEqual(Z.shape, (60, 3))
+        for i, clf in enumerate(m.classifiers):
+            self.assertTrue(numpy.allclose(Z[:, i], clf.decision_function(self.X)))
+
+    def test_threaded_fit_in_workers(self):
+        original = parallel.pool_size()
+        parallel.set_n_jobs(2)
+        try:
+            # Pool workers can't fork, so the pairs are fitted in threads
+            m, = parallel.parallel_map(_fit_ovo, [(self.X, self.y)])
+        finally:
+            parallel.set_n_jobs(original)
+        Z = m.transform(self.X)
+        self.assertEqual(Z.shape, (60, 3))
+        for i, clf in enumerate(m.classifiers):
+            self.assertTrue(numpy.allclose(Z[:, i], clf.decision_function(self.X)))
+
+    def test_partial_fit_extra_columns(self):
+        m = ClassifierOvOAsFeatures().fit(self.X[:, :15], self.y)
+        m.partial_fit(self.X, self.y)
+        self.assertEqual(m.coef_.shape, (20, 3))
+        for i, clf in enumerate(m.classifiers):
+            self.assertTrue(numpy.allclose(m.transform(self.X)[:, i],
+                                           clf.decision_function(self.X)))
+
+
+class TestPadLinearModel(TestCase):
+    def test_same_decisions(self):
+        from sklearn.linear_model import SGDClassifier
+        rng = numpy.random.RandomState(3)
+        X = rng.normal(size=(40, 5))
+        y = numpy.arange(40) % 3
+        for average in [False, True]:
+            m = SGDClassifier(average=average, random_state=0).fit(X, y)
+            expected = m.decision_function(X)
+            pad_linear_model(m, [0, 2, 5, 5])
+            wider = numpy.insert(X, [0, 2, 5, 5], rng.normal(size=(40, 4)), axis=1)
+            self.assertTrue(numpy.allclose(m.decision_function(wider), expected))
+            m.partial_fit(wider, y)
+            self.assertEqual(m.coef_.shape, (3, 9))
+
+
+class _Lengths(StatelessTransform):
+    def _transform(self, X):
+        return csr_matrix(numpy.array([[len(x)] for x in X]))
+
+
+def _fit_ovo(args):
+    X, y = args
+    return ClassifierOvOAsFeatures().fit(X, y)
+
+
+class TestParallelTransform(TestCase):
+    def setUp(self):
+        self.__original_n_jobs = parallel.pool_size()
+        parallel.set_n_jobs(3)
+        self.X = [Datapoint(phraseid=str(i), sentenceid=str(i // 7),
+                            phrase="Phrase number {} of {} .".format(i % 7, i // 7),
+                            sentiment="2") for i in range(100)]
+
+    def tearDown(self):
+        parallel.set_n_jobs(self.__original_n_jobs)
+
+    def test_same_as_serial(self):
+        for sentence_tokenization in [False, True]:
+            e = ExtractText(lowercase=True, sentence_tokenization=sentence_tokenization)
+            expected = e.transform(self.X)
+            e.n_jobs = 2
+            e.min_parallel_rows = 0
+            self.assertEqual(e.transform(self.X), expected)
+            self.assertEqual(e.transform(iter(self.X)), expected)
+            batch = PhraseBatch.from_datapoints(self.X)
+            self.assertEqual(e.transform(batch), expected)
+
+    def test_matrix_outputs(self):
+        X = ["a", "bb", "ccc"] * 10
+        m = _Lengths()
+        m.n_jobs = 3
+        m.min_parallel_rows = 0
+        Z = m.transform(X)
+        self.assertEqual(Z.shape, (30, 1))
+        self.assertEqual(Z.toarray().ravel().tolist(), [1, 2, 3] * 10)
+
+    def test_sentences_are_not_split(self):
+        e = ExtractText(sentence_tokenization=True)
+        bounds = e._chunk_bounds(self.X, 8)
+        self.assertEqual(bounds[0], 0)
+        self.assertEqual(bounds[-1], len(self.X))
+        for bound in bounds[1:-1]:
+            self.assertEqual(bound % 7, 0)
+        self.assertEqual(ExtractText()._chunk_bounds(self.X, 4), [0, 25, 50, 75, 100])